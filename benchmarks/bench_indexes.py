@@ -0,0 +1,83 @@
+#Times the app's hot lookup queries on a generated database before and after the schema migrations add their indexes.
+#Run it from the project folder: python -m benchmarks.bench_indexes --history-rows 200000
+
+import argparse
+import datetime
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from hardware.migrations import migrate
+
+
+TEMPLATE_DATABASE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "POSHardwareTEMPLATE.db")
+
+#(name, sql, parameters) for the queries the indexes are meant to speed up, the SQL is the same as the app's
+QUERIES = [
+    ("E-waste report history", 'SELECT "CHANGE TIME", "DEVICE S/N" FROM HISTORY WHERE "PREVIOUS LOCATION" = \'E-WASTED\' OR "NEW LOCATION" = \'E-WASTED\';', ()),
+    ("History for one device", 'SELECT * FROM HISTORY WHERE "DEVICE S/N" = ?;', ("D000042",)),
+    ("Newest history page", 'SELECT * FROM HISTORY ORDER BY "CHANGE TIME" DESC, rowid DESC LIMIT 100;', ()),
+    ("Changes in one day", 'SELECT count(*) FROM HISTORY WHERE "CHANGE TIME" >= ? AND "CHANGE TIME" < ?;', ("2024-03-01", "2024-03-02")),
+    ("Connected components", "SELECT * FROM COMPONENTS WHERE CONNECTED = ?;", ("D000042",)),
+    ("Devices at a location", "SELECT count(*) FROM DEVICES WHERE LOCATION = ?;", ("LOCATION 7",)),
+    ("Components at a location", "SELECT count(*) FROM COMPONENTS WHERE LOCATION = ?;", ("LOCATION 7",)),
+]
+
+
+#Fills a copy of the template with random devices, components and history
+def build_database(path, devices, components, history_rows, locations, seed=1):
+    shutil.copy(TEMPLATE_DATABASE, path)
+    rng = random.Random(seed)
+    location_names = [f"LOCATION {i}" for i in range(locations)] + ["E-WASTED", "UNKNOWN"]
+    device_serials = [f"D{i:06d}" for i in range(devices)]
+    start = datetime.datetime(2024, 1, 1)
+    with sqlite3.connect(path) as connection:
+        connection.executemany("INSERT INTO LOCATIONS (LOCATION, IMAGE) VALUES (?, NULL);", [(name,) for name in location_names])
+        connection.executemany('INSERT INTO DEVICES (POS, TYPE, "S/N", LOCATION, "FRIENDLY NAME", "LAST EDIT") VALUES (?, ?, ?, ?, ?, ?);',
+                               [("Toast", "TABLET", serial, rng.choice(location_names), f"Device {serial}", "2024-01-01 00:00:00") for serial in device_serials])
+        connection.executemany('INSERT INTO COMPONENTS (POS, TYPE, "S/N", LOCATION, CONNECTED, "LAST EDIT") VALUES (?, ?, ?, ?, ?, ?);',
+                               [("Toast", "PRINTER", f"C{i:06d}", rng.choice(location_names), rng.choice(device_serials), "2024-01-01 00:00:00") for i in range(components)])
+        connection.executemany('INSERT INTO HISTORY ("CHANGE TIME", "DEVICE S/N", "PREVIOUS LOCATION", "NEW LOCATION", "CHANGE LOG") VALUES (?, ?, ?, ?, ?);',
+                               [((start + datetime.timedelta(seconds=rng.randrange(365 * 24 * 3600))).strftime('%Y-%m-%d %H:%M:%S'), rng.choice(device_serials), rng.choice(location_names), rng.choice(location_names), "DEVICE UPDATE") for _ in range(history_rows)])
+
+#Median time in milliseconds of each query over a few repeats
+def time_queries(path, repeats):
+    results = {}
+    with sqlite3.connect(path) as connection:
+        for name, query, params in QUERIES:
+            timings = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                connection.execute(query, params).fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = statistics.median(timings)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hot lookup queries before and after the index migrations.")
+    parser.add_argument("--devices", type=int, default=5000)
+    parser.add_argument("--components", type=int, default=15000)
+    parser.add_argument("--history-rows", type=int, default=200000)
+    parser.add_argument("--locations", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "POSHardware.db")
+        build_database(path, args.devices, args.components, args.history_rows, args.locations)
+        before = time_queries(path, args.repeats)
+        migrate(path)
+        after = time_queries(path, args.repeats)
+
+    print(f"{'QUERY':<28}{'BEFORE (ms)':>14}{'AFTER (ms)':>14}{'SPEEDUP':>10}")
+    for name, _, _ in QUERIES:
+        print(f"{name:<28}{before[name]:>14.2f}{after[name]:>14.2f}{before[name] / max(after[name], 0.001):>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
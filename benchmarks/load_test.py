@@ -0,0 +1,115 @@
+#A small load test for the SQLite connection profile: a few simulated techs reading and saving at the same time.
+#Each client is a thread (like a Streamlit session) sharing one SQLAlchemy engine, most of what they do is reads (overview counts, a history page,
+#one device's history) and the rest are device saves (update + history row in one transaction, like the Save Device button).
+#It runs with SQLite's defaults, with the app's profile and write queue, and with the background writer's group commits on top,
+#and prints throughput, latencies and lock errors for each.
+#Run it from the project folder: python -m benchmarks.load_test --clients 8 --seconds 10
+
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError
+
+from benchmarks.bench_indexes import build_database
+from hardware.connection_profile import load_profile, apply_profile, WriteQueue
+from hardware.migrations import migrate
+from hardware.write_behind import WriteBehind
+
+
+READ_QUERIES = [
+    text('SELECT "ASSET TABLE", sum(ASSETS) FROM ASSET_SUMMARY GROUP BY "ASSET TABLE";'),
+    text('SELECT * FROM HISTORY ORDER BY "CHANGE TIME" DESC, rowid DESC LIMIT 100;'),
+    text('SELECT * FROM HISTORY WHERE "DEVICE S/N" = :sn;'),
+]
+UPDATE_QUERY = text("UPDATE DEVICES SET LOCATION = :location, `LAST EDIT` = :timestamp WHERE `S/N` = :sn;")
+HISTORY_QUERY = text("INSERT INTO HISTORY ('CHANGE TIME', 'DEVICE S/N', 'NEW LOCATION', 'CHANGE LOG') VALUES (:timestamp, :sn, :location, 'DEVICE UPDATE');")
+
+
+def percentile(timings, fraction):
+    if not timings:
+        return 0.0
+    timings = sorted(timings)
+    return timings[min(int(len(timings) * fraction), len(timings) - 1)]
+
+def client(engine, write_queue, write_behind, devices, locations, write_ratio, stop_at, seed, results):
+    rng = random.Random(seed)
+    while time.perf_counter() < stop_at:
+        serial = f"D{rng.randrange(devices):06d}"
+        started = time.perf_counter()
+        try:
+            if rng.random() < write_ratio:
+                params = {"sn": serial, "location": f"LOCATION {rng.randrange(locations)}", "timestamp": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+                if write_behind:
+                    write_behind.submit([(UPDATE_QUERY, params), (HISTORY_QUERY, params)]).result()
+                else:
+                    with write_queue or nullcontext():
+                        with engine.begin() as connection:
+                            connection.execute(UPDATE_QUERY, params)
+                            connection.execute(HISTORY_QUERY, params)
+                results["writes"].append((time.perf_counter() - started) * 1000)
+            else:
+                with engine.connect() as connection:
+                    connection.execute(rng.choice(READ_QUERIES), {"sn": serial}).fetchall()
+                results["reads"].append((time.perf_counter() - started) * 1000)
+        except DBAPIError as e:
+            results["errors"].append(str(e.orig))
+
+#Runs every client for the given time against a fresh copy of the database, returns the combined results
+def run(path, clients, seconds, write_ratio, devices, locations, profile=None, busy_timeout=None, group_commit=False):
+    #pysqlite waits 5 seconds on a lock by default, the default run keeps that so it's a fair comparison with what the app did before
+    engine = create_engine("sqlite:///" + path, connect_args={"timeout": busy_timeout / 1000} if busy_timeout else {})
+    write_queue = None
+    if profile:
+        apply_profile(engine, profile)
+        write_queue = WriteQueue()
+    write_behind = WriteBehind(engine, write_queue) if group_commit else None
+    results = {"reads": [], "writes": [], "errors": []}
+    per_client = [{"reads": [], "writes": [], "errors": []} for _ in range(clients)]
+    stop_at = time.perf_counter() + seconds
+    threads = [threading.Thread(target=client, args=(engine, write_queue, write_behind, devices, locations, write_ratio, stop_at, i, per_client[i])) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    for client_results in per_client:
+        for key in results:
+            results[key].extend(client_results[key])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test SQLite's default settings against the app's connection profile.")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="Share of operations that are saves")
+    parser.add_argument("--devices", type=int, default=5000)
+    parser.add_argument("--components", type=int, default=15000)
+    parser.add_argument("--history-rows", type=int, default=100000)
+    parser.add_argument("--locations", type=int, default=200)
+    args = parser.parse_args()
+
+    runs = [("SQLite defaults", None, False), ("App profile", load_profile(), False), ("Group commit", load_profile(), True)]
+    print(f"{'RUN':<18}{'OPS/S':>9}{'READ P50':>10}{'READ P95':>10}{'WRITE P50':>11}{'WRITE P95':>11}{'ERRORS':>8}")
+    for name, profile, group_commit in runs:
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "POSHardware.db")
+            build_database(path, args.devices, args.components, args.history_rows, args.locations)
+            migrate(path)
+            results = run(path, args.clients, args.seconds, args.write_ratio, args.devices, args.locations, profile, None if profile else 5000, group_commit)
+        operations = len(results["reads"]) + len(results["writes"])
+        print(f"{name:<18}{operations / args.seconds:>9.0f}{percentile(results['reads'], 0.5):>10.2f}{percentile(results['reads'], 0.95):>10.2f}"
+              f"{percentile(results['writes'], 0.5):>11.2f}{percentile(results['writes'], 0.95):>11.2f}{len(results['errors']):>8}")
+        for error in sorted(set(results["errors"])):
+            print(f"  {results['errors'].count(error)} x {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+#The headless benchmark suite: builds a synthetic database (see synthetic.py), times each of the app's hot paths against it without Streamlit
+#and writes the results as JSON, so a slower build shows up before it's deployed.
+#Run it from the project folder: python -m benchmarks.run --size medium --output results.json
+#Give it an earlier results file with --baseline and it exits with an error when anything got slower than --tolerance allows.
+
+import argparse
+import datetime
+import json
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+from benchmarks.synthetic import generate, size_settings, add_size_arguments, SIZES
+from hardware import history_store
+from hardware.cascade import cascade_location
+from hardware.compact import compact, memory_bytes
+from hardware.connection_graph import ConnectionGraph
+from hardware.connection_profile import load_profile, apply_profile
+from hardware.exports import csv_bytes, pdf_bytes
+from hardware.integrity import IntegrityScanner
+from hardware.locations import ImageFolder, location_summary
+from hardware.lookup_index import LookupIndex
+from hardware.overview import overview_metrics
+from hardware.photo_export import PhotoArchive
+from hardware.reports import build_reports
+from hardware.search_index import SearchIndex
+from hardware.table_cache import TableCache
+
+
+#A slowdown smaller than this many milliseconds is never called a regression, tiny timings are mostly noise
+REGRESSION_FLOOR_MS = 5
+
+
+#Everything the benchmarks share, set up once per run
+class Context:
+    def __init__(self, engine, images_folder):
+        self.engine = engine
+        self.images_folder = images_folder
+        self.table_cache = TableCache(engine)
+        self.search_indexes = {}
+        with engine.connect() as connection:
+            #The device with the most components, so the cascade moves as many rows as it ever does
+            self.busiest_device = connection.execute(text("SELECT CONNECTED FROM COMPONENTS WHERE CONNECTED IS NOT NULL GROUP BY CONNECTED ORDER BY count(*) DESC LIMIT 1;")).scalar()
+
+    def search_index(self, table_name):
+        if table_name not in self.search_indexes:
+            self.search_indexes[table_name] = SearchIndex(table_name)
+            self.search_indexes[table_name].sync(self.table_cache)
+        return self.search_indexes[table_name]
+
+
+#fetch_data on an empty cache, the first page load after the server starts
+def fetch_data(context):
+    table_cache = TableCache(context.engine)
+    for table_name in ("DEVICES", "COMPONENTS", "LOCATIONS", "HISTORY"):
+        table_cache.get(table_name)
+
+#What a save costs the cache afterwards, one device re-read and spliced back in
+def patch_one_device(context):
+    context.table_cache.get("DEVICES")
+    context.table_cache.invalidate("DEVICES", [context.busiest_device])
+
+def build_search_index(table_name):
+    def benchmark(context):
+        SearchIndex(table_name).rebuild(context.table_cache.get(table_name))
+    return benchmark
+
+def search(table_name, term):
+    def benchmark(context):
+        search_index = context.search_index(table_name)
+        df = context.table_cache.get(table_name)
+        df[df.index.isin(search_index.search(term))]
+    return benchmark
+
+def build_lookup_index(table_name):
+    def benchmark(context):
+        LookupIndex(table_name).rebuild(context.table_cache.get(table_name))
+    return benchmark
+
+#The whole graph from cold, then the components of the busiest device
+def connection_graph(context):
+    graph = ConnectionGraph()
+    graph.sync(context.table_cache)
+    graph.components_of(context.busiest_device)
+
+#"Apply location changes to the connected components" for the busiest device, rolled back so every repeat moves the same rows
+def cascade(context):
+    with context.engine.connect() as connection:
+        transaction = connection.begin()
+        cascade_location(connection, context.busiest_device, "UNKNOWN", "2024-12-31 00:00:00")
+        transaction.rollback()
+
+def overview(context):
+    overview_metrics(context.engine)
+
+def locations(context):
+    location_summary(context.engine, context.table_cache.get("LOCATIONS"), ImageFolder(context.images_folder))
+
+def integrity_scan(context):
+    IntegrityScanner().scan(context.engine, context.images_folder, full=True)
+
+def history_page(context):
+    history_store.HistoryPager(page_size=100, prefetch_pages=4).page(context.engine)
+
+def history_search(context):
+    history_store.search_history(context.engine, "LOCATION 7", limit=100)
+
+def xlsx_reports(context):
+    build_reports(context.engine)
+
+def csv_export(context):
+    csv_bytes(context.engine, "HISTORY", "full")
+
+def pdf_export(context):
+    pdf_bytes(context.engine, "active")
+
+#A new archive each time, so this is the cost of a zip that has to be built and not the cached one
+def photo_zip(context):
+    archive = PhotoArchive()
+    archive.zip_file(context.images_folder).close()
+    archive.close()
+
+BENCHMARKS = [
+    ("fetch_data (cold cache)", fetch_data),
+    ("table cache patch", patch_one_device),
+    ("search index build DEVICES", build_search_index("DEVICES")),
+    ("search index build HISTORY", build_search_index("HISTORY")),
+    ("search DEVICES", search("DEVICES", "d00004")),
+    ("search HISTORY", search("HISTORY", "location 7")),
+    ("lookup index build DEVICES", build_lookup_index("DEVICES")),
+    ("lookup index build COMPONENTS", build_lookup_index("COMPONENTS")),
+    ("connection graph build", connection_graph),
+    ("cascade location", cascade),
+    ("overview metrics", overview),
+    ("location summary", locations),
+    ("integrity scan", integrity_scan),
+    ("history page", history_page),
+    ("history full-text search", history_search),
+    ("xlsx reports", xlsx_reports),
+    ("csv export", csv_export),
+    ("pdf export", pdf_export),
+    ("photo zip", photo_zip),
+]
+
+
+#How much memory each big table takes as read from SQLite and as the table cache keeps it
+def cache_memory(engine):
+    memory = {}
+    with engine.connect() as connection:
+        for table_name in ("DEVICES", "COMPONENTS", "HISTORY"):
+            df = pd.read_sql(text(f'SELECT * FROM "{table_name}";'), connection)
+            memory[table_name] = {"raw_bytes": memory_bytes(df), "cached_bytes": memory_bytes(compact(table_name, df))}
+    return memory
+
+#Runs one benchmark repeats times (after a warm-up run) and returns its timings in milliseconds
+def time_benchmark(function, context, repeats):
+    function(context)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function(context)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {"median_ms": round(statistics.median(timings), 3), "min_ms": round(min(timings), 3), "max_ms": round(max(timings), 3), "repeats": repeats}
+
+def run_suite(folder, settings, repeats, only=None, seed=1):
+    database_path, images_folder = generate(folder, seed=seed, **settings)
+    engine = create_engine("sqlite:///" + database_path)
+    apply_profile(engine, load_profile())
+    history_store.ensure_history_fts(engine)
+    context = Context(engine, images_folder)
+    results = {}
+    for name, function in BENCHMARKS:
+        if only and not any(part.lower() in name.lower() for part in only):
+            continue
+        results[name] = time_benchmark(function, context, repeats)
+        print(f"{name:<30}{results[name]['median_ms']:>12.2f} ms", file=sys.stderr)
+    memory = cache_memory(engine)
+    engine.dispose()
+    return results, memory
+
+#The benchmarks whose median went up by more than tolerance (and by more than REGRESSION_FLOOR_MS) since the baseline
+def regressions(results, baseline, tolerance):
+    found = {}
+    for name, timing in results.items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            continue
+        slower_by = timing["median_ms"] - before["median_ms"]
+        if slower_by > REGRESSION_FLOOR_MS and timing["median_ms"] > before["median_ms"] * (1 + tolerance):
+            found[name] = {"baseline_ms": before["median_ms"], "median_ms": timing["median_ms"]}
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the app's hot paths against a synthetic database and write the results as JSON.")
+    add_size_arguments(parser)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--only", nargs="*", help="Only run the benchmarks with one of these in their name")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="File to write the JSON to, it's printed if this is left out")
+    parser.add_argument("--baseline", help="An earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="How much slower than the baseline (0.25 = 25%%) counts as a regression")
+    args = parser.parse_args()
+
+    settings = size_settings(args.size, **{name: getattr(args, name) for name in SIZES["small"]})
+    with tempfile.TemporaryDirectory() as folder:
+        results, memory = run_suite(folder, settings, args.repeats, args.only, args.seed)
+
+    report = {
+        "created": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "size": args.size,
+        "settings": settings,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "results": results,
+        "memory": memory,
+    }
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            report["regressions"] = regressions(results, json.load(baseline_file), args.tolerance)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if report.get("regressions"):
+        for name, timing in report["regressions"].items():
+            print(f"REGRESSION {name}: {timing['baseline_ms']:.2f} ms -> {timing['median_ms']:.2f} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
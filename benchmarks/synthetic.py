@@ -0,0 +1,83 @@
+#Makes synthetic POSHardware databases (with an images folder to go with them) at different sizes for the benchmark suite.
+#The tables come from bench_indexes.build_database, this adds the types, photos and schema migrations so the app's code can run against it.
+#Run it on its own to keep one around: python -m benchmarks.synthetic --size medium --output synthetic
+
+import argparse
+import os
+import random
+import sqlite3
+from io import BytesIO
+
+from PIL import Image
+
+from benchmarks.bench_indexes import build_database
+from hardware.migrations import migrate
+
+
+#The sizes the suite knows about, any of these can be overridden on the command line
+SIZES = {
+    "small": {"devices": 1000, "components": 3000, "history_rows": 1000, "locations": 50, "images": 200},
+    "medium": {"devices": 10000, "components": 30000, "history_rows": 100000, "locations": 1000, "images": 2000},
+    "large": {"devices": 50000, "components": 150000, "history_rows": 1000000, "locations": 5000, "images": 10000},
+}
+
+#Some photos are listed in the database but left out of the folder, so the integrity scan has something to find
+MISSING_PHOTO_FRACTION = 0.05
+
+
+#One small JPEG that every photo is a copy of, the contents don't matter for anything we time
+def photo_bytes():
+    buffer = BytesIO()
+    Image.new("RGB", (64, 48), (200, 120, 40)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+#Builds folder/POSHardware.db and folder/images, returns both paths
+def generate(folder, devices, components, history_rows, locations, images, seed=1):
+    database_path = os.path.join(folder, "POSHardware.db")
+    images_folder = os.path.join(folder, "images")
+    os.makedirs(images_folder, exist_ok=True)
+    build_database(database_path, devices, components, history_rows, locations, seed)
+    migrate(database_path)
+
+    rng = random.Random(seed)
+    with sqlite3.connect(database_path) as connection:
+        connection.execute("INSERT INTO DEVICE_TYPES (DEVICE_TYPE) VALUES ('TABLET');")
+        connection.execute("INSERT INTO COMPONENT_TYPES (COMPONENT_TYPE) VALUES ('PRINTER');")
+        #Photos are spread over devices, components and locations the same way they are in the real database
+        photo_owners = [("DEVICES", '"S/N"', f"D{i:06d}") for i in range(devices)] + [("COMPONENTS", '"S/N"', f"C{i:06d}") for i in range(components)] + [("LOCATIONS", "LOCATION", f"LOCATION {i}") for i in range(locations)]
+        jpeg = photo_bytes()
+        for table_name, key_column, key in rng.sample(photo_owners, min(images, len(photo_owners))):
+            file_name = f"{key}.jpg"
+            connection.execute(f"UPDATE {table_name} SET IMAGE = ? WHERE {key_column} = ?;", (file_name, key))
+            if rng.random() >= MISSING_PHOTO_FRACTION:
+                with open(os.path.join(images_folder, file_name), "wb") as photo:
+                    photo.write(jpeg)
+    return database_path, images_folder
+
+#The size's settings with any overrides that were given
+def size_settings(size, **overrides):
+    settings = dict(SIZES[size])
+    settings.update({name: value for name, value in overrides.items() if value is not None})
+    return settings
+
+def add_size_arguments(parser):
+    parser.add_argument("--size", choices=SIZES, default="small")
+    for name in SIZES["small"]:
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic POSHardware database and images folder.")
+    add_size_arguments(parser)
+    parser.add_argument("--output", default="synthetic", help="Folder to write POSHardware.db and images into")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    settings = size_settings(args.size, **{name: getattr(args, name) for name in SIZES["small"]})
+    os.makedirs(args.output, exist_ok=True)
+    database_path, images_folder = generate(args.output, seed=args.seed, **settings)
+    print(f"Wrote {database_path} and {images_folder} ({', '.join(f'{name}={value}' for name, value in settings.items())})")
+
+
+if __name__ == "__main__":
+    main()
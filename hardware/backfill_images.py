@@ -0,0 +1,122 @@
+#This is the offline clean-up for the images folder, for photos uploaded before the renditions existed or dropped in by hand.
+#It turns every photo upright (all eight EXIF orientations), re-saves the ones that were turned and makes any missing renditions.
+#A manifest of checksums is kept in images/renditions/manifest.json so the next run only looks at new or changed photos.
+#Run it from the project folder while the app is running or not: python -m hardware.backfill_images images --workers 4
+
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from hardware.images import open_upright, save_renditions, rendition_file, rendition_format, RENDITIONS, RENDITIONS_FOLDER, ORIGINAL_QUALITY
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+MANIFEST_FILE = "manifest.json"
+SAVE_FORMATS = {".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG"}
+
+
+def manifest_path(images_folder):
+    return os.path.join(images_folder, RENDITIONS_FOLDER, MANIFEST_FILE)
+
+def load_manifest(images_folder):
+    try:
+        with open(manifest_path(images_folder), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+#Written to a temporary name first so a run that gets killed halfway never leaves a broken manifest
+def save_manifest(images_folder, manifest):
+    path = manifest_path(images_folder)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def file_checksum(path):
+    checksum = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+def file_record(path):
+    stat = os.stat(path)
+    return {"sha256": file_checksum(path), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+#Every photo in the folder (not the renditions), as paths relative to the images folder
+def find_images(images_folder):
+    for root, dirs, file_names in os.walk(images_folder):
+        if root == images_folder:
+            dirs[:] = [folder for folder in dirs if folder != RENDITIONS_FOLDER]
+        for file_name in file_names:
+            if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.relpath(os.path.join(root, file_name), images_folder)
+
+def renditions_exist(images_folder, relative_path):
+    return all(os.path.exists(rendition_file(images_folder, relative_path, name, rendition_format(settings))) for name, settings in RENDITIONS)
+
+#Decides if a photo needs work. Unchanged size and modified time means we trust the manifest without reading the file,
+#otherwise the checksum decides (copying a folder changes the times but not the photos).
+def needs_processing(images_folder, relative_path, record):
+    if record is None or not renditions_exist(images_folder, relative_path):
+        return True
+    stat = os.stat(os.path.join(images_folder, relative_path))
+    if stat.st_size == record["size"] and stat.st_mtime_ns == record["mtime"]:
+        return False
+    return file_checksum(os.path.join(images_folder, relative_path)) != record["sha256"]
+
+#Runs in a worker process: turns one photo upright, re-saves it if it was turned and writes its renditions.
+#Returns (relative path, manifest record, whether it was rotated).
+def process_image(images_folder, relative_path):
+    path = os.path.join(images_folder, relative_path)
+    image, orientation = open_upright(path)
+    rotated = orientation != 1
+    if rotated:
+        image_format = SAVE_FORMATS[os.path.splitext(path)[1].lower()]
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(path, format=image_format, quality=ORIGINAL_QUALITY)
+    save_renditions(image, images_folder, relative_path)
+    image.close()
+    return relative_path, file_record(path), rotated
+
+
+def backfill(images_folder, workers=None, force=False):
+    manifest = {} if force else load_manifest(images_folder)
+    all_images = sorted(find_images(images_folder))
+    to_process = [relative_path for relative_path in all_images if needs_processing(images_folder, relative_path, manifest.get(relative_path))]
+    summary = {"images": len(all_images), "processed": 0, "rotated": 0, "skipped": len(all_images) - len(to_process), "errors": {}}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process_image, images_folder, relative_path): relative_path for relative_path in to_process}
+        for future in as_completed(futures):
+            try:
+                relative_path, record, rotated = future.result()
+            except Exception as e:
+                summary["errors"][futures[future]] = str(e)
+                continue
+            manifest[relative_path] = record
+            summary["processed"] += 1
+            summary["rotated"] += int(rotated)
+
+    #Photos that were deleted drop out of the manifest
+    existing = set(all_images)
+    manifest = {relative_path: record for relative_path, record in manifest.items() if relative_path in existing}
+    save_manifest(images_folder, manifest)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Turn photos upright, make missing renditions and record checksums.")
+    parser.add_argument("images_folder", nargs="?", default="images")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (defaults to the number of CPUs)")
+    parser.add_argument("--force", action="store_true", help="Ignore the manifest and process every photo")
+    args = parser.parse_args()
+
+    result = backfill(args.images_folder, args.workers, args.force)
+    print(f"{result['images']} photos: {result['processed']} processed ({result['rotated']} turned upright), {result['skipped']} unchanged, {len(result['errors'])} errors")
+    for relative_path, error in result["errors"].items():
+        print(f"  {relative_path}: {error}")
@@ -0,0 +1,138 @@
+#This is the bulk importer for receiving shipments, it adds devices or components from a .csv or .xlsx file.
+#Files are read a chunk at a time and every row is checked against sets of the serials, locations and types already in the database,
+#then each chunk of good rows is inserted (with its HISTORY rows) in one transaction.
+#Rows that can't be imported are reported back with their row number in the file instead of stopping the whole import.
+
+import datetime
+from contextlib import nullcontext
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from hardware.repository import REPOSITORIES, HISTORY
+
+
+#The columns each kind of asset can have in the file, the first four are required for both (same as the sidebar forms)
+REQUIRED_COLUMNS = ["S/N", "POS", "LOCATION", "TYPE"]
+IMPORT_COLUMNS = {
+    "DEVICES": REQUIRED_COLUMNS + ["MODEL", "FRIENDLY NAME", "NOTES"],
+    "COMPONENTS": REQUIRED_COLUMNS + ["MODEL", "CONNECTED", "NOTES"],
+}
+TYPE_TABLES = {"DEVICES": ("DEVICE_TYPES", "DEVICE_TYPE"), "COMPONENTS": ("COMPONENT_TYPES", "COMPONENT_TYPE")}
+CHANGE_LOGS = {"DEVICES": "NEW DEVICE", "COMPONENTS": "NEW COMPONENT"}
+
+
+#A blank file with the right headers, so people know what to fill in
+def template_csv(table_name):
+    return (",".join(IMPORT_COLUMNS[table_name]) + "\n").encode("utf-8")
+
+#Yields (first row number, DataFrame of text) for each chunk of the file. Row numbers match what you see in Excel (the header is row 1).
+def read_chunks(file, file_name, chunk_size):
+    if file_name.lower().endswith(".xlsx"):
+        yield from read_xlsx_chunks(file, chunk_size)
+        return
+    row_number = 2
+    for chunk in pd.read_csv(file, dtype=str, keep_default_na=False, chunksize=chunk_size):
+        yield row_number, chunk
+        row_number += len(chunk)
+
+#openpyxl's read-only mode streams the rows from the sheet instead of loading the whole workbook
+def read_xlsx_chunks(file, chunk_size):
+    from openpyxl import load_workbook
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell) if cell is not None else "" for cell in next(rows, ())]
+        row_number = 2
+        chunk = []
+        for row in rows:
+            #Short rows are padded and anything past the last header is dropped so every row lines up with the header
+            cells = ["" if cell is None else str(cell) for cell in row[:len(header)]]
+            chunk.append(cells + [""] * (len(header) - len(cells)))
+            if len(chunk) == chunk_size:
+                yield row_number, pd.DataFrame(chunk, columns=header)
+                row_number += len(chunk)
+                chunk = []
+        if chunk:
+            yield row_number, pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+#Everything we check rows against, loaded once per import as sets so every check is a quick lookup
+def load_existing(connection, table_name):
+    type_table, type_column = TYPE_TABLES[table_name]
+    return {
+        "serials": {row[0] for row in connection.execute(text(f"SELECT `S/N` FROM {table_name};"))},
+        "locations": {row[0] for row in connection.execute(text("SELECT LOCATION FROM LOCATIONS;"))},
+        "types": {row[0] for row in connection.execute(text(f"SELECT {type_column} FROM {type_table};"))},
+        "devices": {row[0] for row in connection.execute(text("SELECT `S/N` FROM DEVICES;"))},
+    }
+
+def clean(value):
+    value = str(value).strip()
+    return None if value in ("", "None", "nan") else value
+
+#Checks one row and returns ({column: value} for the insert, None) or (None, the reason it can't be imported)
+def validate_row(table_name, row, existing, timestamp):
+    values = {column: clean(row.get(column, "")) for column in IMPORT_COLUMNS[table_name]}
+    missing = [column for column in REQUIRED_COLUMNS if not values[column]]
+    if missing:
+        return None, f"Missing {', '.join(missing)}"
+    if values["S/N"] in existing["serials"]:
+        return None, f"{values['S/N']} already exists"
+    if values["LOCATION"] not in existing["locations"]:
+        return None, f"Unknown location {values['LOCATION']}"
+    if values["TYPE"] not in existing["types"]:
+        return None, f"Unknown type {values['TYPE']}"
+    if values.get("CONNECTED") and values["CONNECTED"] not in existing["devices"]:
+        return None, f"Connected device {values['CONNECTED']} doesn't exist"
+    return {**values, "LAST EDIT": timestamp}, None
+
+#Inserts the rows and their history with one executemany each
+def insert_rows(connection, table_name, rows):
+    inserts = [REPOSITORIES[table_name].insert(row) for row in rows]
+    connection.execute(inserts[0][0], [params for _, params in inserts])
+    history = [HISTORY.record(row["LAST EDIT"], CHANGE_LOGS[table_name], {"DEVICE S/N": row["S/N"], "NEW LOCATION": row["LOCATION"], "NEW FRIENDLY NAME": row.get("FRIENDLY NAME"), "NEW CONNECTION": row.get("CONNECTED"), "NEW NOTES": row["NOTES"]})
+               for row in rows]
+    connection.execute(history[0][0], [params for _, params in history])
+
+#Imports a .csv or .xlsx of devices or components (table_name is "DEVICES" or "COMPONENTS").
+#write_queue (a WriteQueue from connection_profile.py) makes each chunk wait its turn with the app's other writes.
+#Returns the serials that were imported and a DataFrame of the rows that weren't (ROW, S/N, ERROR).
+def import_assets(engine, file, file_name, table_name, chunk_size=1000, timestamp=None, write_queue=None):
+    timestamp = timestamp or datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    imported = []
+    errors = []
+    write_turn = write_queue or nullcontext()
+    with engine.connect() as connection:
+        existing = load_existing(connection, table_name)
+
+    for first_row, chunk in read_chunks(file, file_name, chunk_size):
+        chunk.columns = [str(column).strip().upper() for column in chunk.columns]
+        good_rows = []
+        for row_number, row in enumerate(chunk.to_dict("records"), start=first_row):
+            params, error = validate_row(table_name, row, existing, timestamp)
+            if error:
+                errors.append({"ROW": row_number, "S/N": clean(row.get("S/N", "")), "ERROR": error})
+                continue
+            #Reserve the serial now so a duplicate further down the file is caught too
+            existing["serials"].add(params["S/N"])
+            good_rows.append((row_number, params))
+        if not good_rows:
+            continue
+
+        try:
+            with write_turn, engine.begin() as connection:
+                insert_rows(connection, table_name, [params for _, params in good_rows])
+            imported.extend(params["S/N"] for _, params in good_rows)
+        except DBAPIError:
+            #Something in the chunk was rejected by the database (like a serial added by someone else mid-import), so find out which rows one at a time
+            for row_number, params in good_rows:
+                try:
+                    with write_turn, engine.begin() as connection:
+                        insert_rows(connection, table_name, [params])
+                    imported.append(params["S/N"])
+                except DBAPIError as e:
+                    errors.append({"ROW": row_number, "S/N": params["S/N"], "ERROR": str(e.orig)})
+
+    return imported, pd.DataFrame(errors, columns=["ROW", "S/N", "ERROR"])
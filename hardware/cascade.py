@@ -0,0 +1,24 @@
+#This is the "Apply location changes to the connected components" logic.
+#All of a device's components are read in one query and moved with one executemany for the updates and one for the history,
+#inside the caller's transaction, so either every connected component moves along with the device or nothing does.
+
+from hardware.repository import COMPONENTS, HISTORY
+
+
+CASCADE_COLUMNS = ("S/N", "LOCATION", "CONNECTED", "NOTES", "IMAGE")
+
+
+#Moves every component connected to device_serial to new_location and returns the serials that were moved.
+#Components already at new_location are left alone so they don't get an empty history entry.
+#This doesn't commit, the caller commits (or rolls back) it together with the device's own update.
+def cascade_location(session, device_serial, new_location, timestamp):
+    old_rows = COMPONENTS.connected_elsewhere(session, device_serial, new_location, CASCADE_COLUMNS)
+    if not old_rows:
+        return []
+    updates = [COMPONENTS.update(serial, {"LOCATION": new_location, "LAST EDIT": timestamp}) for serial, _, _, _, _ in old_rows]
+    session.execute(updates[0][0], [params for _, params in updates])
+    history = [HISTORY.record(timestamp, "COMPONENT UPDATE FROM CONNECTED DEVICE", {"DEVICE S/N": serial, "PREVIOUS LOCATION": old_location, "PREVIOUS CONNECTION": connected, "PREVIOUS NOTES": notes, "PREVIOUS PHOTO": image,
+                                                                                 "NEW LOCATION": new_location, "NEW CONNECTION": connected, "NEW NOTES": notes, "NEW PHOTO": image})
+               for serial, old_location, connected, notes, image in old_rows]
+    session.execute(history[0][0], [params for _, params in history])
+    return [serial for serial, _, _, _, _ in old_rows]
@@ -0,0 +1,93 @@
+#This is how the table cache stores DEVICES, COMPONENTS and HISTORY in memory.
+#Locations, types, POS and change logs are the same few strings over and over, so they're kept as categoricals (a small int per row plus one copy of each string),
+#and the timestamps are parsed into real datetimes once when they're loaded instead of every time a page needs them.
+#That's several times less memory for the big tables, and isin()/== on a categorical compares ints instead of strings.
+#POS_CACHE_LAYOUT=arrow also stores HISTORY's other text columns as Arrow strings (if pyarrow is installed, it isn't a requirement). Only HISTORY, because it's only ever shown and searched,
+#the Devices and Components panes test their cells against None and Arrow's missing value (pd.NA) can't be used that way.
+
+import os
+
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+
+CATEGORY_COLUMNS = {
+    "DEVICES": ["POS", "TYPE", "LOCATION"],
+    "COMPONENTS": ["POS", "TYPE", "LOCATION"],
+    "HISTORY": ["CHANGE LOG", "PREVIOUS LOCATION", "NEW LOCATION"],
+}
+DATETIME_COLUMNS = {
+    "DEVICES": ["LAST EDIT"],
+    "COMPONENTS": ["LAST EDIT"],
+    "HISTORY": ["CHANGE TIME"],
+}
+ARROW_COLUMNS = {
+    "HISTORY": ["DEVICE S/N", "PREVIOUS FRIENDLY NAME", "PREVIOUS CONNECTION", "PREVIOUS NOTES", "PREVIOUS PHOTO", "NEW FRIENDLY NAME", "NEW CONNECTION", "NEW NOTES", "NEW PHOTO"],
+}
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+LAYOUT_VARIABLE = "POS_CACHE_LAYOUT"
+LAYOUTS = ("categorical", "arrow")
+
+
+def load_layout(environment=None):
+    environment = os.environ if environment is None else environment
+    layout = environment.get(LAYOUT_VARIABLE, "categorical").strip().lower()
+    if layout not in LAYOUTS:
+        raise ValueError(f"{LAYOUT_VARIABLE} has to be one of {', '.join(LAYOUTS)}, not {layout}")
+    if layout == "arrow":
+        #Without pyarrow the Arrow strings aren't available, the default layout works everywhere
+        try:
+            import pyarrow
+        except ImportError:
+            return "categorical"
+    return layout
+
+#Timestamps are written as '%Y-%m-%d %H:%M:%S' by the app, anything else that was typed into the database is parsed one at a time
+def parse_datetimes(values):
+    parsed = pd.to_datetime(values, format=TIMESTAMP_FORMAT, errors="coerce")
+    retry = parsed.isna() & values.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(values[retry].map(lambda value: pd.to_datetime(value, errors="coerce")))
+    return parsed
+
+#Returns df with the table's columns converted, df isn't changed
+def compact(table_name, df, layout="categorical"):
+    columns = {}
+    for column in CATEGORY_COLUMNS.get(table_name, ()):
+        if column in df.columns and not isinstance(df[column].dtype, CategoricalDtype):
+            columns[column] = df[column].astype("category")
+    for column in DATETIME_COLUMNS.get(table_name, ()):
+        if column in df.columns and not pd.api.types.is_datetime64_any_dtype(df[column]):
+            columns[column] = parse_datetimes(df[column])
+    if layout == "arrow":
+        for column in ARROW_COLUMNS.get(table_name, ()):
+            if column in df.columns:
+                columns[column] = df[column].astype("string[pyarrow]")
+    return df.assign(**columns) if columns else df
+
+#Gives the cached frame and some freshly read (already compacted) rows the same categories, so they can be concatenated or copied
+#into each other without pandas falling back to plain strings. Returns both frames, neither of the originals is changed.
+def align_categories(table_name, old, fresh):
+    old_columns = {}
+    fresh_columns = {}
+    for column in CATEGORY_COLUMNS.get(table_name, ()):
+        if column not in old.columns or column not in fresh.columns:
+            continue
+        categories = old[column].cat.categories.union(fresh[column].cat.categories, sort=False)
+        if len(categories) != len(old[column].cat.categories):
+            old_columns[column] = old[column].cat.set_categories(categories)
+        fresh_columns[column] = fresh[column].astype(CategoricalDtype(categories))
+    return old.assign(**old_columns) if old_columns else old, fresh.assign(**fresh_columns) if fresh_columns else fresh
+
+#A column's values as a list with None for anything missing (categoricals give NaN and Arrow gives pd.NA), for code that compares with None
+def plain_values(series):
+    return series.astype(object).where(series.notna(), None).tolist()
+
+#A column as text the way the pages always showed it: missing values as "None" and timestamps as '%Y-%m-%d %H:%M:%S'
+def text_values(series):
+    return series.astype(object).where(series.notna(), None).astype(str)
+
+def memory_bytes(df):
+    return int(df.memory_usage(deep=True).sum())
@@ -0,0 +1,137 @@
+#This is the device -> component graph made from COMPONENTS.CONNECTED.
+#Each device keeps the set of its components' row positions, so a device's components are found in O(number of components) instead of a scan,
+#and the graph keeps two running sets on top: orphans (CONNECTED points at a device that doesn't exist) and mismatches (the component isn't where its device is).
+#Like the search and lookup indexes it follows the table cache's snapshots, a write only re-checks the rows it changed and the components of any device it moved.
+
+import threading
+
+from hardware.compact import plain_values
+
+
+ORPHAN = "orphan"
+MISMATCH = "mismatch"
+
+
+def column_values(df, column):
+    return plain_values(df[column])
+
+
+class ConnectionGraph:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.versions = {"DEVICES": 0, "COMPONENTS": 0}
+        #(S/N, LOCATION) for each DEVICES row position and (S/N, CONNECTED, LOCATION) for each COMPONENTS row position
+        self.device_rows = []
+        self.component_rows = []
+        self.device_locations = {}
+        self.positions_by_device = {}
+        self.orphans = set()
+        self.mismatches = set()
+
+    #Puts one component in the orphan or mismatch set (or neither) based on where its device is now
+    def check_component(self, position):
+        self.orphans.discard(position)
+        self.mismatches.discard(position)
+        row = self.component_rows[position]
+        if row is None or not row[1]:
+            return
+        _, connected, location = row
+        if connected not in self.device_locations:
+            self.orphans.add(position)
+        elif self.device_locations[connected] != location:
+            self.mismatches.add(position)
+
+    def check_device(self, device_serial):
+        for position in self.positions_by_device.get(device_serial, ()):
+            self.check_component(position)
+
+    def set_component(self, position, row):
+        if position < len(self.component_rows):
+            old_row = self.component_rows[position]
+            if old_row is not None and old_row[1] in self.positions_by_device:
+                self.positions_by_device[old_row[1]].discard(position)
+                if not self.positions_by_device[old_row[1]]:
+                    del self.positions_by_device[old_row[1]]
+            self.component_rows[position] = row
+        else:
+            self.component_rows.extend([None] * (position - len(self.component_rows)))
+            self.component_rows.append(row)
+        if row[1]:
+            self.positions_by_device.setdefault(row[1], set()).add(position)
+        self.check_component(position)
+
+    def set_device(self, position, row):
+        moved = {row[0]}
+        if position < len(self.device_rows):
+            old_serial = self.device_rows[position][0]
+            self.device_locations.pop(old_serial, None)
+            moved.add(old_serial)
+            self.device_rows[position] = row
+        else:
+            self.device_rows.extend([(None, None)] * (position - len(self.device_rows)))
+            self.device_rows.append(row)
+        self.device_locations[row[0]] = row[1]
+        for device_serial in moved:
+            self.check_device(device_serial)
+
+    def rebuild_devices(self, df):
+        self.device_rows = list(zip(column_values(df, "S/N"), column_values(df, "LOCATION")))
+        self.device_locations = dict(self.device_rows)
+        for position in range(len(self.component_rows)):
+            self.check_component(position)
+
+    def rebuild_components(self, df):
+        self.component_rows = []
+        self.positions_by_device = {}
+        self.orphans = set()
+        self.mismatches = set()
+        for position, row in enumerate(zip(column_values(df, "S/N"), column_values(df, "CONNECTED"), column_values(df, "LOCATION"))):
+            self.set_component(position, row)
+
+    def update_devices(self, df, positions):
+        changed_rows = df.iloc[positions]
+        for position, row in zip(positions, zip(column_values(changed_rows, "S/N"), column_values(changed_rows, "LOCATION"))):
+            self.set_device(position, row)
+
+    def update_components(self, df, positions):
+        changed_rows = df.iloc[positions]
+        for position, row in zip(positions, zip(column_values(changed_rows, "S/N"), column_values(changed_rows, "CONNECTED"), column_values(changed_rows, "LOCATION"))):
+            self.set_component(position, row)
+
+    #Brings both sides up to the table cache's latest snapshots (see TableCache.catch_up)
+    def sync(self, table_cache):
+        with self.lock:
+            self.versions["DEVICES"] = table_cache.catch_up("DEVICES", self.versions["DEVICES"], self.rebuild_devices, self.update_devices)
+            self.versions["COMPONENTS"] = table_cache.catch_up("COMPONENTS", self.versions["COMPONENTS"], self.rebuild_components, self.update_components)
+
+    #Row positions (in the cached COMPONENTS table) of the components connected to a device
+    def components_of(self, device_serial):
+        with self.lock:
+            return sorted(self.positions_by_device.get(device_serial, ()))
+
+    def has_components(self, device_serial):
+        with self.lock:
+            return bool(self.positions_by_device.get(device_serial))
+
+    #ORPHAN, MISMATCH or None for one component's row position
+    def problem(self, position):
+        with self.lock:
+            if position in self.orphans:
+                return ORPHAN
+            if position in self.mismatches:
+                return MISMATCH
+            return None
+
+    def device_location(self, device_serial):
+        with self.lock:
+            return self.device_locations.get(device_serial)
+
+    #Row positions of every component whose CONNECTED points at a device that doesn't exist
+    def orphaned_components(self):
+        with self.lock:
+            return sorted(self.orphans)
+
+    #Row positions of every component that isn't at its device's location
+    def mismatched_components(self):
+        with self.lock:
+            return sorted(self.mismatches)
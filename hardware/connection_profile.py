@@ -0,0 +1,106 @@
+#These are the SQLite settings every connection the app opens gets, and the queue every write goes through.
+#WAL journal mode lets people keep reading while someone saves, busy_timeout makes a connection wait for a lock instead of failing straight away,
+#synchronous=NORMAL is safe with WAL and saves an fsync per commit, and cache_size/mmap_size keep more of the database in memory.
+#Any setting can be changed without touching the code with an environment variable, like POS_SQLITE_SYNCHRONOUS=FULL or POS_SQLITE_JOURNAL_MODE=DELETE
+#(use DELETE if the database lives on a network share, WAL needs every user on the same machine).
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+
+DEFAULT_PROFILE = {
+    "journal_mode": "WAL",
+    "busy_timeout": 10000,
+    "synchronous": "NORMAL",
+    #Negative means KiB rather than pages, so this is 32 MB
+    "cache_size": -32000,
+    "mmap_size": 256 * 1024 * 1024,
+}
+ENVIRONMENT_PREFIX = "POS_SQLITE_"
+
+#The values each text setting can take, anything else is refused rather than pasted into a PRAGMA
+TEXT_SETTINGS = {
+    "journal_mode": ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"),
+    "synchronous": ("OFF", "NORMAL", "FULL", "EXTRA"),
+}
+
+
+#The default profile with any POS_SQLITE_ environment variables and then overrides on top
+def load_profile(overrides=None, environment=None):
+    environment = os.environ if environment is None else environment
+    profile = dict(DEFAULT_PROFILE)
+    for name in DEFAULT_PROFILE:
+        if ENVIRONMENT_PREFIX + name.upper() in environment:
+            profile[name] = environment[ENVIRONMENT_PREFIX + name.upper()]
+    profile.update(overrides or {})
+    return {name: check_setting(name, value) for name, value in profile.items()}
+
+def check_setting(name, value):
+    if name in TEXT_SETTINGS:
+        value = str(value).upper()
+        if value not in TEXT_SETTINGS[name]:
+            raise ValueError(f"{name} has to be one of {', '.join(TEXT_SETTINGS[name])}, not {value}")
+        return value
+    if name in DEFAULT_PROFILE:
+        return int(value)
+    raise ValueError(f"Unknown SQLite setting {name}")
+
+#Runs the profile's PRAGMAs on a DB-API (sqlite3) connection
+def apply_pragmas(dbapi_connection, profile):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in profile.items():
+            cursor.execute(f"PRAGMA {name} = {value};")
+    finally:
+        cursor.close()
+
+#Makes every connection the engine opens from now on use the profile.
+#Connections already in the pool were opened without it, so they're thrown away.
+def apply_profile(engine, profile):
+    event.listen(engine, "connect", lambda dbapi_connection, connection_record: apply_pragmas(dbapi_connection, profile))
+    engine.dispose()
+
+#A plain sqlite3 connection with the profile, for scripts that don't use SQLAlchemy
+def connect(database_path, profile, **kwargs):
+    connection = sqlite3.connect(database_path, timeout=profile.get("busy_timeout", 5000) / 1000, **kwargs)
+    apply_pragmas(connection, profile)
+    return connection
+
+
+#SQLite only ever lets one connection write at a time, and when two try at once one of them waits on busy_timeout and may still fail.
+#Every write in the app goes through this queue instead, so writers take turns (first come, first served) and readers are never held up.
+#One of these is shared by every session.
+class WriteQueue:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.next_ticket = 0
+        self.now_serving = 0
+        self.writes = 0
+
+    def __enter__(self):
+        with self.condition:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            while ticket != self.now_serving:
+                self.condition.wait()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with self.condition:
+            self.now_serving += 1
+            self.writes += 1
+            self.condition.notify_all()
+
+    def waiting(self):
+        with self.condition:
+            return self.next_ticket - self.now_serving
+
+    #Waits for this writer's turn and then opens a session from session_factory (like lambda: conn.session)
+    @contextmanager
+    def session(self, session_factory):
+        with self:
+            with session_factory() as session:
+                yield session
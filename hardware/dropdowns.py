@@ -0,0 +1,70 @@
+#The options and defaults for the edit panes' selectboxes.
+#Each option list comes with a map from value to its place in the list, so finding a selectbox's default is a dict lookup instead of list.index().
+#Option lists are kept per table snapshot and label lists per filtered snapshot (which rows were left after the filters),
+#so clicking around the edit panes doesn't rebuild any of it until the data or the filters change.
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+#How many option and label lists are kept, old ones are dropped first
+CACHED_LISTS = 64
+
+
+class Options:
+    def __init__(self, values):
+        #Categorical columns give NaN for a missing value, the selectboxes always showed None
+        self.values = [None if pd.isna(value) else value for value in values]
+        self.positions = {}
+        for position, value in enumerate(self.values):
+            self.positions.setdefault(value, position)
+
+    #The selectbox index for value, or None (no default) if it isn't an option
+    def index(self, value):
+        return self.positions.get(value)
+
+
+#A short fingerprint of a filtered frame's rows, the index holds each row's position in the cached table
+def rows_key(positions):
+    return hashlib.blake2b(np.ascontiguousarray(positions, dtype=np.int64).tobytes(), digest_size=16).digest()
+
+
+#One of these is shared by every session
+class DropdownCache:
+    def __init__(self, max_lists=CACHED_LISTS):
+        self.max_lists = max_lists
+        self.lock = threading.Lock()
+        self.lists = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, key, build):
+        with self.lock:
+            if key in self.lists:
+                self.lists.move_to_end(key)
+                self.hits += 1
+                return self.lists[key]
+        value = build()
+        with self.lock:
+            self.misses += 1
+            self.lists[key] = value
+            while len(self.lists) > self.max_lists:
+                self.lists.popitem(last=False)
+        return value
+
+    #The distinct values of a column, most recently edited first like the tables on the page (sort_by=None keeps the table's order)
+    def column_options(self, table_cache, table_name, column, sort_by="LAST EDIT"):
+        df, version = table_cache.snapshot(table_name)
+        def build():
+            ordered = df.sort_values(by=sort_by, ascending=False, kind="stable") if sort_by else df
+            return Options(ordered[column].unique())
+        return self.cached(("options", table_name, version, column), build)
+
+    #The dropdown labels for a filtered frame's rows, from the lookup index's label column
+    def labels(self, lookup_index, positions):
+        positions = np.asarray(positions, dtype=np.int64)
+        return self.cached(("labels", lookup_index.table_name, lookup_index.version, rows_key(positions)), lambda: lookup_index.labels(positions))
@@ -0,0 +1,201 @@
+#These are the .CSV and .PDF exports on the Reports tab.
+#Both read the database through a cursor a few thousand rows at a time and write each batch out before reading the next,
+#so exporting hundreds of thousands of HISTORY rows never builds a DataFrame or holds the whole table in memory.
+#The output goes into a spooled temporary file that moves to disk when it gets big, like the photo zip.
+#The rows in each report are picked the same way as the .xlsx reports (see hardware/reports.py).
+
+import csv
+import datetime
+import gzip
+import io
+import tempfile
+
+from hardware.photo_export import SPOOL_MAX_SIZE
+from hardware.reports import REPORT_SHEETS, row_router, sheet_query
+
+
+#How many rows are fetched from the cursor and written out at a time
+CHUNK_ROWS = 5000
+
+
+#Runs the export query for a table inside one read transaction and yields batches of the rows that belong in the report
+def report_rows(engine, table_name, report_name, order_by=None, columns=None, chunk_rows=CHUNK_ROWS):
+    route = row_router(REPORT_SHEETS[table_name])
+    query = sheet_query(table_name)
+    if order_by:
+        query = query.rstrip(";") + f" ORDER BY {order_by};"
+    positions = [REPORT_SHEETS[table_name].index(column) for column in columns] if columns else None
+    raw_connection = engine.raw_connection()
+    try:
+        cursor = raw_connection.cursor()
+        cursor.execute("BEGIN;")
+        cursor.execute(query)
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            rows = [row for row in rows if report_name in route(row)]
+            if positions:
+                rows = [[row[position] for position in positions] for row in rows]
+            yield rows
+        raw_connection.rollback()
+    finally:
+        raw_connection.close()
+
+#Writes one table as CSV into output (a binary file object), gzipped if compress is True. Returns the number of rows written.
+def write_csv(engine, table_name, output, report_name="full", compress=False, chunk_rows=CHUNK_ROWS):
+    stream = gzip.GzipFile(fileobj=output, mode="wb") if compress else output
+    row_count = 0
+    try:
+        text_buffer = io.StringIO()
+        writer = csv.writer(text_buffer)
+        writer.writerow(REPORT_SHEETS[table_name])
+        for rows in report_rows(engine, table_name, report_name, chunk_rows=chunk_rows):
+            writer.writerows(rows)
+            row_count += len(rows)
+            stream.write(text_buffer.getvalue().encode("utf-8"))
+            text_buffer.seek(0)
+            text_buffer.truncate()
+        stream.write(text_buffer.getvalue().encode("utf-8"))
+    finally:
+        #Closing the GzipFile writes the gzip trailer but leaves output open
+        if compress:
+            stream.close()
+    return row_count
+
+def csv_bytes(engine, table_name, report_name="full", compress=False):
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as output:
+        write_csv(engine, table_name, output, report_name, compress)
+        output.seek(0)
+        return output.read()
+
+
+#A small PDF writer, just enough for pages of text tables in the built in Helvetica fonts.
+#Each page is written to the file as soon as it's full and only the byte offsets of the objects are remembered,
+#the page list and cross-reference table go on the end once we know how many pages there were.
+
+PAGE_WIDTH = 792
+PAGE_HEIGHT = 612
+MARGIN = 36
+FONT_SIZE = 7
+LINE_HEIGHT = 10
+#Helvetica averages a bit over half its size in width per character, this keeps long values from running into the next column
+CHARACTER_WIDTH = FONT_SIZE * 0.55
+
+#Object numbers fixed up front: the catalog, the page list (written last) and the two fonts
+CATALOG_OBJECT = 1
+PAGES_OBJECT = 2
+FONT_OBJECT = 3
+BOLD_FONT_OBJECT = 4
+
+def pdf_text(value):
+    value = "" if value is None else str(value)
+    value = value.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)").replace("\r", " ").replace("\n", " ")
+    return value.encode("latin-1", "replace")
+
+def fit_text(value, width):
+    value = "" if value is None else str(value)
+    characters = max(int(width / CHARACTER_WIDTH), 1)
+    return value if len(value) <= characters else value[:characters - 1] + "~"
+
+
+class PDFWriter:
+    def __init__(self, output):
+        self.output = output
+        self.offsets = {}
+        self.page_objects = []
+        self.next_object = BOLD_FONT_OBJECT + 1
+        self.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self.write_object(FONT_OBJECT, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        self.write_object(BOLD_FONT_OBJECT, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+
+    def write(self, data):
+        self.output.write(data)
+
+    def position(self):
+        return self.output.tell()
+
+    def write_object(self, number, body):
+        self.offsets[number] = self.position()
+        self.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+    def new_object(self):
+        self.next_object += 1
+        return self.next_object - 1
+
+    #lines is a list of (x, y, text, bold)
+    def add_page(self, lines):
+        content = io.BytesIO()
+        for x, y, value, bold in lines:
+            content.write(b"BT /%s %d Tf %.2f %.2f Td (%s) Tj ET\n" % (b"F2" if bold else b"F1", FONT_SIZE, x, y, pdf_text(value)))
+        content = content.getvalue()
+        content_object = self.new_object()
+        self.write_object(content_object, b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        page_object = self.new_object()
+        self.write_object(page_object, b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R /Resources << /Font << /F1 %d 0 R /F2 %d 0 R >> >> >>"
+                          % (PAGES_OBJECT, PAGE_WIDTH, PAGE_HEIGHT, content_object, FONT_OBJECT, BOLD_FONT_OBJECT))
+        self.page_objects.append(page_object)
+
+    def close(self):
+        kids = b" ".join(b"%d 0 R" % number for number in self.page_objects)
+        self.write_object(PAGES_OBJECT, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.page_objects)))
+        self.write_object(CATALOG_OBJECT, b"<< /Type /Catalog /Pages %d 0 R >>" % PAGES_OBJECT)
+        xref_offset = self.position()
+        self.write(b"xref\n0 %d\n0000000000 65535 f \n" % self.next_object)
+        for number in range(1, self.next_object):
+            self.write(b"%010d 00000 n \n" % self.offsets[number])
+        self.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (self.next_object, CATALOG_OBJECT, xref_offset))
+
+
+#The columns that fit across a landscape page for each section, and the share of the width each one gets
+PDF_SECTIONS = {
+    "DEVICES": [("S/N", 0.16), ("TYPE", 0.12), ("MODEL", 0.14), ("POS", 0.08), ("LOCATION", 0.16), ("FRIENDLY NAME", 0.20), ("LAST EDIT", 0.14)],
+    "COMPONENTS": [("S/N", 0.16), ("TYPE", 0.12), ("MODEL", 0.14), ("POS", 0.08), ("LOCATION", 0.16), ("CONNECTED", 0.20), ("LAST EDIT", 0.14)],
+    "HISTORY": [("CHANGE TIME", 0.14), ("DEVICE S/N", 0.14), ("PREVIOUS LOCATION", 0.14), ("NEW LOCATION", 0.14), ("PREVIOUS CONNECTION", 0.14), ("NEW CONNECTION", 0.14), ("NEW NOTES", 0.16)],
+}
+PDF_ORDER = {"DEVICES": '"LOCATION", "S/N"', "COMPONENTS": '"LOCATION", "S/N"', "HISTORY": '"CHANGE TIME" DESC'}
+
+REPORT_TITLES = {"full": "Full Inventory", "ewaste": "E-Waste", "active": "Active Assets"}
+
+#Writes the inventory report as a PDF into output: a section for devices and components (and history if asked for), sorted by location.
+#Returns the number of pages.
+def write_pdf(engine, output, report_name="active", include_history=False, chunk_rows=CHUNK_ROWS):
+    pdf = PDFWriter(output)
+    title = f"POS Hardware {REPORT_TITLES[report_name]} Report - {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}"
+    usable_width = PAGE_WIDTH - 2 * MARGIN
+    rows_per_page = int((PAGE_HEIGHT - 2 * MARGIN - 3 * LINE_HEIGHT) / LINE_HEIGHT)
+
+    for table_name in ["DEVICES", "COMPONENTS"] + (["HISTORY"] if include_history else []):
+        columns = [column for column, _ in PDF_SECTIONS[table_name]]
+        widths = [share * usable_width for _, share in PDF_SECTIONS[table_name]]
+        starts = [MARGIN + sum(widths[:i]) for i in range(len(widths))]
+
+        def start_page():
+            top = PAGE_HEIGHT - MARGIN
+            lines = [(MARGIN, top, f"{title} - {table_name}", True), (PAGE_WIDTH - MARGIN - 40, top, f"Page {len(pdf.page_objects) + 1}", False)]
+            lines.extend((x, top - 2 * LINE_HEIGHT, fit_text(column, width), True) for x, column, width in zip(starts, columns, widths))
+            return lines, top - 3 * LINE_HEIGHT
+
+        lines, y = start_page()
+        row_count = 0
+        for rows in report_rows(engine, table_name, report_name, PDF_ORDER[table_name], columns, chunk_rows):
+            for row in rows:
+                if row_count == rows_per_page:
+                    pdf.add_page(lines)
+                    lines, y = start_page()
+                    row_count = 0
+                lines.extend((x, y, fit_text(value, width), False) for x, value, width in zip(starts, row, widths))
+                y -= LINE_HEIGHT
+                row_count += 1
+        if row_count == 0:
+            lines.append((MARGIN, y, "Nothing to show", False))
+        pdf.add_page(lines)
+
+    pdf.close()
+    return len(pdf.page_objects)
+
+def pdf_bytes(engine, report_name="active", include_history=False):
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as output:
+        write_pdf(engine, output, report_name, include_history)
+        output.seek(0)
+        return output.read()
@@ -0,0 +1,170 @@
+#This is everything that reads the HISTORY table straight from SQLite instead of loading the whole audit log into pandas.
+#The full-text search uses an FTS5 table (HISTORY_FTS) that mirrors HISTORY and is kept up to date by triggers.
+#The history viewer pages through the table newest first by (CHANGE TIME, rowid), so every page is an index range instead of a big OFFSET.
+
+import datetime
+import logging
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+
+#The columns shown on the History tab, these are also the columns that get searched
+HISTORY_COLUMNS = ["CHANGE TIME", "DEVICE S/N", "PREVIOUS LOCATION", "PREVIOUS FRIENDLY NAME", "PREVIOUS CONNECTION", "PREVIOUS NOTES", "NEW LOCATION", "NEW FRIENDLY NAME", "NEW CONNECTION", "NEW NOTES", "CHANGE LOG"]
+
+#The trigram tokenizer lets FTS5 match any part of a word (like the search bars do), but it needs 3 or more characters to do it
+TRIGRAM_LENGTH = 3
+
+logger = logging.getLogger(__name__)
+
+
+def quoted_columns(prefix=""):
+    return ", ".join(f'{prefix}"{column}"' for column in HISTORY_COLUMNS)
+
+#Creates the FTS5 table and its triggers if they aren't there yet, and fills it from HISTORY the first time.
+#Rebuilding HISTORY (like the migrations do) drops its triggers, so those are checked separately and the index is refilled if they were missing.
+#Returns False if this SQLite was built without FTS5 (the reason is logged), in which case the search mode just isn't offered.
+def ensure_history_fts(engine):
+    try:
+        with engine.begin() as connection:
+            table_exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'HISTORY_FTS';")).fetchone()
+            triggers_exist = connection.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'HISTORY_FTS_INSERT';")).fetchone()
+            if table_exists and triggers_exist:
+                return True
+            if not table_exists:
+                try:
+                    connection.execute(text(f"CREATE VIRTUAL TABLE HISTORY_FTS USING fts5({quoted_columns()}, content='HISTORY', content_rowid='rowid', tokenize='trigram');"))
+                except OperationalError:
+                    #SQLite older than 3.34 doesn't have the trigram tokenizer, so fall back to whole words
+                    connection.execute(text(f"CREATE VIRTUAL TABLE HISTORY_FTS USING fts5({quoted_columns()}, content='HISTORY', content_rowid='rowid');"))
+            connection.execute(text(f"CREATE TRIGGER IF NOT EXISTS HISTORY_FTS_INSERT AFTER INSERT ON HISTORY BEGIN INSERT INTO HISTORY_FTS(rowid, {quoted_columns()}) VALUES (new.rowid, {quoted_columns('new.')}); END;"))
+            connection.execute(text(f"CREATE TRIGGER IF NOT EXISTS HISTORY_FTS_DELETE AFTER DELETE ON HISTORY BEGIN INSERT INTO HISTORY_FTS(HISTORY_FTS, rowid, {quoted_columns()}) VALUES ('delete', old.rowid, {quoted_columns('old.')}); END;"))
+            connection.execute(text(f"CREATE TRIGGER IF NOT EXISTS HISTORY_FTS_UPDATE AFTER UPDATE ON HISTORY BEGIN INSERT INTO HISTORY_FTS(HISTORY_FTS, rowid, {quoted_columns()}) VALUES ('delete', old.rowid, {quoted_columns('old.')}); INSERT INTO HISTORY_FTS(rowid, {quoted_columns()}) VALUES (new.rowid, {quoted_columns('new.')}); END;"))
+            connection.execute(text("INSERT INTO HISTORY_FTS(HISTORY_FTS) VALUES ('rebuild');"))
+        return True
+    except OperationalError as e:
+        logger.warning("History full-text search is unavailable: %s", e)
+        return False
+
+def uses_trigrams(connection):
+    table_sql = connection.execute(text("SELECT sql FROM sqlite_master WHERE name = 'HISTORY_FTS';")).scalar()
+    return table_sql is not None and "trigram" in table_sql
+
+#Builds the WHERE clause for a search term.
+#Anything long enough goes through FTS5 as one quoted phrase (so characters like - or ( are literal), short terms fall back to LIKE on each column.
+def search_clause(connection, search_term):
+    if uses_trigrams(connection):
+        if len(search_term) >= TRIGRAM_LENGTH:
+            return 'h.rowid IN (SELECT rowid FROM HISTORY_FTS WHERE HISTORY_FTS MATCH :match)', {"match": '"' + search_term.replace('"', '""') + '"'}, True
+        like_term = "%" + search_term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return "(" + " OR ".join(f"h.\"{column}\" LIKE :like ESCAPE '\\'" for column in HISTORY_COLUMNS) + ")", {"like": like_term}, False
+    return 'h.rowid IN (SELECT rowid FROM HISTORY_FTS WHERE HISTORY_FTS MATCH :match)', {"match": '"' + search_term.replace('"', '""') + '"*'}, True
+
+#CHANGE TIME is stored as 'YYYY-MM-DD HH:MM:SS' text, so a date range is a plain string range: start of the first day up to (not including) the day after the last one
+def date_range_clause(start_date=None, end_date=None, prefix="h."):
+    conditions = []
+    params = {}
+    if start_date:
+        conditions.append(f'{prefix}"CHANGE TIME" >= :start_time')
+        params["start_time"] = start_date.strftime('%Y-%m-%d')
+    if end_date:
+        conditions.append(f'{prefix}"CHANGE TIME" < :end_time')
+        params["end_time"] = (end_date + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+    return conditions, params
+
+#Runs a history search inside SQLite and returns one page of results (best matches first) and the total number of matches.
+#Without a search term it returns the newest changes instead.
+def search_history(engine, search_term, limit=100, offset=0, start_date=None, end_date=None):
+    search_term = (search_term or "").strip()
+    conditions, params = date_range_clause(start_date, end_date)
+    with engine.connect() as connection:
+        ranked = False
+        if search_term:
+            where, search_params, ranked = search_clause(connection, search_term)
+            conditions.append(where)
+            params.update(search_params)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        total = connection.execute(text(f"SELECT count(*) FROM HISTORY h{where};"), params).scalar()
+        if ranked:
+            #bm25 rank from FTS5, lower is a better match
+            query = f'SELECT {quoted_columns("h.")} FROM HISTORY_FTS f JOIN HISTORY h ON h.rowid = f.rowid{where} AND HISTORY_FTS MATCH :match ORDER BY f.rank LIMIT :limit OFFSET :offset;'
+        else:
+            query = f'SELECT {quoted_columns("h.")} FROM HISTORY h{where} ORDER BY h."CHANGE TIME" DESC LIMIT :limit OFFSET :offset;'
+        page = pd.read_sql(text(query), connection, params={**params, "limit": limit, "offset": offset})
+    return page, total
+
+#Reads up to limit history rows, newest first, that come after the cursor (the CHANGE TIME and rowid of the last row already shown)
+def fetch_history_window(connection, cursor=None, limit=100, start_date=None, end_date=None):
+    conditions, params = date_range_clause(start_date, end_date)
+    if cursor is not None:
+        conditions.append('(h."CHANGE TIME", h.rowid) < (:cursor_time, :cursor_rowid)')
+        params.update({"cursor_time": cursor[0], "cursor_rowid": cursor[1]})
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    query = f'SELECT h.rowid AS "_rowid", {quoted_columns("h.")} FROM HISTORY h{where} ORDER BY h."CHANGE TIME" DESC, h.rowid DESC LIMIT :limit;'
+    return pd.read_sql(text(query), connection, params={**params, "limit": limit})
+
+
+#The History tab's pager, one of these lives in each session's state.
+#It fetches the visible page plus a few pages ahead in one query, and walks forward and back with keyset cursors so it never loads the whole table.
+class HistoryPager:
+    def __init__(self, page_size=100, prefetch_pages=4):
+        self.page_size = page_size
+        self.prefetch_pages = prefetch_pages
+        self.filters = None
+        self.data_version = None
+        self.reset()
+
+    def reset(self):
+        self.page_number = 0
+        #cursors[i] is where page i starts, None for the newest page
+        self.cursors = [None]
+        self.window = None
+        self.window_start = 0
+        self.has_more = False
+
+    #Starts again from the newest page when the date range changes
+    def set_filters(self, start_date=None, end_date=None):
+        if (start_date, end_date) != self.filters:
+            self.filters = (start_date, end_date)
+            self.reset()
+
+    def newer(self):
+        if self.page_number > 0:
+            self.page_number -= 1
+
+    def older(self):
+        if self.page_number + 1 < len(self.cursors):
+            self.page_number += 1
+
+    def has_newer(self):
+        return self.page_number > 0
+
+    def has_older(self):
+        return self.page_number + 1 < len(self.cursors)
+
+    #Returns the rows for the current page, only going to the database when the page isn't in the prefetched window.
+    #A new history row (a higher max rowid) throws the window away so the newest page is never stale.
+    def page(self, engine):
+        with engine.connect() as connection:
+            data_version = connection.execute(text("SELECT max(rowid) FROM HISTORY;")).scalar()
+            if data_version != self.data_version:
+                self.data_version = data_version
+                self.window = None
+            offset = (self.page_number - self.window_start) * self.page_size
+            in_window = self.window is not None and 0 <= offset < max(len(self.window), 1) and self.page_number <= self.window_start + self.prefetch_pages
+            if not in_window:
+                start_date, end_date = self.filters or (None, None)
+                window_size = self.page_size * (self.prefetch_pages + 1)
+                #One extra row tells us if there is anything after the window
+                self.window = fetch_history_window(connection, self.cursors[self.page_number], window_size + 1, start_date, end_date)
+                self.has_more = len(self.window) > window_size
+                self.window = self.window.iloc[:window_size]
+                self.window_start = self.page_number
+                del self.cursors[self.page_number + 1:]
+                #Work out where each of the prefetched pages (and the one after them) starts
+                for end in range(self.page_size, len(self.window) + 1, self.page_size):
+                    if end < len(self.window) or self.has_more:
+                        last_row = self.window.iloc[end - 1]
+                        self.cursors.append((last_row["CHANGE TIME"], int(last_row["_rowid"])))
+                offset = 0
+        return self.window.iloc[offset:offset + self.page_size].drop(columns="_rowid")
@@ -0,0 +1,74 @@
+#This is where the smaller copies (renditions) of every uploaded photo are made and picked.
+#The original is kept at full quality like before, and a thumbnail and a preview are saved next to it in images/renditions/<name>/.
+#Views ask for the width they show the photo at and get the smallest rendition that still looks sharp.
+
+import os
+from PIL import Image, ImageOps, features
+
+from hardware.perf import METRICS
+
+
+#The quality ladder, smallest first. max_size is the longest side in pixels, format can be "WEBP" or "JPEG".
+#If this Pillow can't write WebP, JPEG is used instead.
+RENDITIONS = [
+    ("thumbnail", {"max_size": 400, "format": "WEBP", "quality": 70}),
+    ("preview", {"max_size": 1200, "format": "WEBP", "quality": 82}),
+]
+ORIGINAL_QUALITY = 100
+
+#Photos are shown at this many times their width so they stay sharp on high-density screens
+DISPLAY_SCALE = 2
+
+RENDITIONS_FOLDER = "renditions"
+
+#EXIF tag number for the orientation, phones save photos sideways and just set this tag (1 means it's already upright)
+ORIENTATION_TAG = 0x0112
+EXTENSIONS = {"WEBP": ".webp", "JPEG": ".jpg"}
+
+
+#Opens an image (a path or a file object) and turns it the right way up for any of the eight EXIF orientations, including the mirrored ones.
+#Returns the upright image and the orientation it had, so callers can tell if anything changed.
+def open_upright(source):
+    image = Image.open(source)
+    orientation = image.getexif().get(ORIENTATION_TAG, 1)
+    upright = ImageOps.exif_transpose(image)
+    if upright is not image:
+        image.close()
+    else:
+        upright.load()
+    return upright, orientation
+
+def rendition_format(settings):
+    if settings["format"] == "WEBP" and not features.check("webp"):
+        return "JPEG"
+    return settings["format"]
+
+def rendition_file(images_folder, file_name, rendition_name, image_format):
+    stem, _ = os.path.splitext(file_name)
+    return os.path.join(images_folder, RENDITIONS_FOLDER, rendition_name, stem + EXTENSIONS[image_format])
+
+#Saves every rendition of an already opened (and correctly rotated) image, returns the paths that were written
+@METRICS.timed("images.save_renditions")
+def save_renditions(image, images_folder, file_name):
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    saved = []
+    for rendition_name, settings in RENDITIONS:
+        image_format = rendition_format(settings)
+        path = rendition_file(images_folder, file_name, rendition_name, image_format)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        rendition = image.copy()
+        rendition.thumbnail((settings["max_size"], settings["max_size"]), Image.Resampling.LANCZOS)
+        rendition.save(path, format=image_format, quality=settings["quality"])
+        saved.append(path)
+    return saved
+
+#The path of the smallest rendition that is at least width (times DISPLAY_SCALE) wide, falling back to the original if it hasn't been made yet
+def rendition_path(images_folder, file_name, width=None):
+    if width is not None:
+        for rendition_name, settings in RENDITIONS:
+            if settings["max_size"] >= width * DISPLAY_SCALE:
+                path = rendition_file(images_folder, file_name, rendition_name, rendition_format(settings))
+                if os.path.exists(path):
+                    return path
+    return os.path.join(images_folder, file_name)
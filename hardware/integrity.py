@@ -0,0 +1,144 @@
+#This is the "Flag potential issues" scan on the Overview tab.
+#Every check is one SQL query (a join, or a NOT EXISTS anti-join against HISTORY) that yields its issues as it goes,
+#and the images folder is listed once per scan into a set instead of checking the disk for every photo.
+#The scanner remembers what it found, so later scans only recheck assets whose LAST EDIT is newer than the last scan.
+
+import datetime
+import os
+import threading
+
+import pandas as pd
+from sqlalchemy import text
+
+
+MISSING_PHOTO = "Photo missing from images folder"
+LOCATION_MISMATCH = "Component not with its device"
+STALE_DEVICE = "No update in 6 months"
+NO_HISTORY = "No edit history"
+
+ASSET_TABLES = ("DEVICES", "COMPONENTS")
+STALE_AFTER = datetime.timedelta(days=182)
+ISSUE_COLUMNS = ["ISSUE", "TABLE", "S/N", "DETAIL"]
+
+
+def issue(name, table_name, serial, detail):
+    return {"ISSUE": name, "TABLE": table_name, "S/N": serial, "DETAIL": detail}
+
+#The photo filenames in the images folder, IMAGE columns only ever hold a filename in that folder
+def list_images(images_folder):
+    try:
+        return frozenset(entry.name for entry in os.scandir(images_folder) if entry.is_file())
+    except FileNotFoundError:
+        return frozenset()
+
+#Limits a check to assets edited since the last scan ('YYYY-MM-DD HH:MM:SS' text, so it's a range on the LAST EDIT index).
+#>= rather than > so an edit in the same second as the last scan is never missed.
+def changed_since(since, prefix=""):
+    return f' AND {prefix}"LAST EDIT" >= :since' if since else ""
+
+
+def missing_photos(connection, context, since=None):
+    image_files = context["image_files"]
+    for table_name in ASSET_TABLES:
+        query = f'SELECT "S/N", IMAGE FROM {table_name} WHERE IMAGE IS NOT NULL{changed_since(since)};'
+        for serial, image in connection.execute(text(query), {"since": since}):
+            if image not in image_files:
+                yield issue(MISSING_PHOTO, table_name, serial, image)
+    #LOCATIONS has no LAST EDIT, but there are only ever a few of them so they're always checked
+    for location, image in connection.execute(text("SELECT LOCATION, IMAGE FROM LOCATIONS WHERE IMAGE IS NOT NULL;")):
+        if image not in image_files:
+            yield issue(MISSING_PHOTO, "LOCATIONS", location, image)
+
+def missing_photos_touched(connection, since):
+    for table_name in ASSET_TABLES:
+        for (serial,) in connection.execute(text(f'SELECT "S/N" FROM {table_name} WHERE 1{changed_since(since)};'), {"since": since}):
+            yield table_name, serial
+    for (location,) in connection.execute(text("SELECT LOCATION FROM LOCATIONS;")):
+        yield "LOCATIONS", location
+
+def location_mismatches(connection, context, since=None):
+    changed = ' AND (c."LAST EDIT" >= :since OR d."LAST EDIT" >= :since)' if since else ""
+    query = f'SELECT c."S/N", c.LOCATION, d."S/N", d.LOCATION FROM COMPONENTS c JOIN DEVICES d ON d."S/N" = c.CONNECTED WHERE c.LOCATION IS NOT d.LOCATION{changed};'
+    for serial, location, device_serial, device_location in connection.execute(text(query), {"since": since}):
+        yield issue(LOCATION_MISMATCH, "COMPONENTS", serial, f"At {location}, but {device_serial} is at {device_location}")
+
+#A component's result can change when it or the device it's connected to is edited
+def location_mismatches_touched(connection, since):
+    query = 'SELECT c."S/N" FROM COMPONENTS c LEFT JOIN DEVICES d ON d."S/N" = c.CONNECTED WHERE c."LAST EDIT" >= :since OR d."LAST EDIT" >= :since;'
+    for (serial,) in connection.execute(text(query), {"since": since}):
+        yield "COMPONENTS", serial
+
+#E-wasted devices are expected to stop changing, so they're left out
+def stale_devices(connection, context, since=None):
+    cutoff = (context["now"] - STALE_AFTER).strftime('%Y-%m-%d %H:%M:%S')
+    query = 'SELECT "S/N", "LAST EDIT" FROM DEVICES WHERE ("LAST EDIT" < :cutoff OR "LAST EDIT" IS NULL) AND LOCATION IS NOT \'E-WASTED\';'
+    for serial, last_edit in connection.execute(text(query), {"cutoff": cutoff}):
+        yield issue(STALE_DEVICE, "DEVICES", serial, f"Last edit {last_edit}" if last_edit else "Never edited")
+
+def missing_history(connection, context, since=None):
+    for table_name in ASSET_TABLES:
+        query = f'SELECT a."S/N" FROM {table_name} a WHERE NOT EXISTS (SELECT 1 FROM HISTORY h WHERE h."DEVICE S/N" = a."S/N"){changed_since(since, "a.")};'
+        for (serial,) in connection.execute(text(query), {"since": since}):
+            yield issue(NO_HISTORY, table_name, serial, "Added straight to the database")
+
+def missing_history_touched(connection, since):
+    for table_name in ASSET_TABLES:
+        for (serial,) in connection.execute(text(f'SELECT "S/N" FROM {table_name} WHERE 1{changed_since(since)};'), {"since": since}):
+            yield table_name, serial
+
+
+#(issue name, check, the assets an incremental scan has to recheck) - a check without the last one is run in full every time.
+#Stale devices depend on today's date rather than on edits, but they're a range on the LAST EDIT index so a full run is cheap.
+CHECKS = [
+    (MISSING_PHOTO, missing_photos, missing_photos_touched),
+    (LOCATION_MISMATCH, location_mismatches, location_mismatches_touched),
+    (STALE_DEVICE, stale_devices, None),
+    (NO_HISTORY, missing_history, missing_history_touched),
+]
+
+#Runs every check in full and yields each issue as soon as it's found
+def iter_issues(engine, images_folder, now=None):
+    context = {"image_files": list_images(images_folder), "now": now or datetime.datetime.now()}
+    with engine.connect() as connection:
+        for _, check, _ in CHECKS:
+            yield from check(connection, context)
+
+
+#One of these is shared by every session, it holds the issues found by the last scan
+class IntegrityScanner:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.issues = {name: {} for name, _, _ in CHECKS}
+        self.watermark = None
+        self.image_files = None
+        self.scans = 0
+        self.last_scan = None
+
+    #Scans for issues and returns them as a DataFrame (ISSUE, TABLE, S/N, DETAIL).
+    #After the first scan only assets edited since the previous one are rechecked, unless full is True.
+    #If the images folder changed, the photo check is run in full since any photo could have gone missing.
+    def scan(self, engine, images_folder, full=False, now=None):
+        context = {"image_files": list_images(images_folder), "now": now or datetime.datetime.now()}
+        with self.lock, engine.connect() as connection:
+            #Read before the checks, anything edited while they run is at or after this and gets rechecked next time
+            watermark = connection.execute(text('SELECT max(last_edit) FROM (SELECT max("LAST EDIT") AS last_edit FROM DEVICES UNION ALL SELECT max("LAST EDIT") FROM COMPONENTS);')).scalar()
+            since = None if full else self.watermark
+            for name, check, touched in CHECKS:
+                check_since = since
+                if touched is None or (name == MISSING_PHOTO and context["image_files"] != self.image_files):
+                    check_since = None
+                if check_since is None:
+                    self.issues[name] = {}
+                else:
+                    for key in touched(connection, check_since):
+                        self.issues[name].pop(key, None)
+                for found in check(connection, context, check_since):
+                    self.issues[name][(found["TABLE"], found["S/N"])] = found
+            self.watermark = watermark
+            self.image_files = context["image_files"]
+            self.scans += 1
+            self.last_scan = context["now"]
+            return self.frame()
+
+    def frame(self):
+        return pd.DataFrame([found for issues in self.issues.values() for found in issues.values()], columns=ISSUE_COLUMNS)
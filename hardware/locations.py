@@ -0,0 +1,63 @@
+#This is the data behind the Locations tab's cards.
+#The device and component counts for every location come from one GROUP BY over ASSET_SUMMARY (see migrations.py),
+#and whether each location's photo is really in the images folder is answered from a cached listing of the folder,
+#which is only listed again when the folder's modified time changes (adding, removing or renaming a photo changes it).
+
+import os
+import threading
+
+import pandas as pd
+from sqlalchemy import text
+
+from hardware.integrity import list_images
+from hardware.perf import METRICS
+
+
+#Cards per page on the Locations tab, a multiple of the 4 columns so every page is full rows
+LOCATIONS_PER_PAGE = 12
+
+COUNTS_QUERY = text('SELECT LOCATION, "ASSET TABLE", sum(ASSETS) AS ASSETS FROM ASSET_SUMMARY GROUP BY LOCATION, "ASSET TABLE";')
+
+
+#One of these is shared by every session
+class ImageFolder:
+    def __init__(self, images_folder):
+        self.images_folder = images_folder
+        self.lock = threading.Lock()
+        self.modified = None
+        self.image_files = frozenset()
+        self.listings = 0
+
+    def files(self):
+        try:
+            modified = os.stat(self.images_folder).st_mtime_ns
+        except FileNotFoundError:
+            modified = None
+        with self.lock:
+            if modified != self.modified or self.listings == 0:
+                with METRICS.timer("images.list_folder"):
+                    self.image_files = list_images(self.images_folder)
+                self.modified = modified
+                self.listings += 1
+            return self.image_files
+
+    def exists(self, file_name):
+        return file_name in self.files()
+
+
+#Returns df_locations' LOCATION, IMAGE and IS_STORAGE plus DEVICES and COMPONENTS counts and IMAGE_FOUND for every location
+def location_summary(engine, df_locations, image_folder):
+    with engine.connect() as connection:
+        counts = pd.read_sql(COUNTS_QUERY, connection)
+    counts = counts.pivot_table(index="LOCATION", columns="ASSET TABLE", values="ASSETS", aggfunc="sum").reindex(columns=["DEVICES", "COMPONENTS"])
+    summary = df_locations[["LOCATION", "IMAGE", "IS_STORAGE"]].join(counts, on="LOCATION")
+    summary[["DEVICES", "COMPONENTS"]] = summary[["DEVICES", "COMPONENTS"]].fillna(0).astype(int)
+    summary["IMAGE_FOUND"] = summary["IMAGE"].isin(image_folder.files())
+    return summary.reset_index(drop=True)
+
+def page_count(summary):
+    return max((len(summary) + LOCATIONS_PER_PAGE - 1) // LOCATIONS_PER_PAGE, 1)
+
+def location_page(summary, page_number):
+    start = (page_number - 1) * LOCATIONS_PER_PAGE
+    return summary.iloc[start:start + LOCATIONS_PER_PAGE]
@@ -0,0 +1,129 @@
+#These are the hash maps behind every "which row is this?" question the pages ask: serial to row, friendly name to serial,
+#and the label shown in the edit dropdowns to serial (which components are connected to which device is in connection_graph.py).
+#Like the search index, one is built per table from the table cache's snapshot and only the changed rows are patched after a write,
+#so every lookup and duplicate check is a dictionary lookup instead of a scan over the whole frame.
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from hardware.compact import plain_values, text_values
+
+
+#The edit dropdowns show "<first> at <LOCATION> (<S/N>)"
+LABEL_COLUMNS = {
+    "DEVICES": ("FRIENDLY NAME", "LOCATION", "S/N"),
+    "COMPONENTS": ("TYPE", "LOCATION", "S/N"),
+}
+
+
+#Builds the dropdown labels for every row of df at once, missing values show as "None" the same way the old f-string did
+def row_labels(df, table_name):
+    first, location, serial = LABEL_COLUMNS[table_name]
+    return (text_values(df[first]) + " at " + text_values(df[location]) + " (" + text_values(df[serial]) + ")").tolist()
+
+def column_values(df, column):
+    return plain_values(df[column]) if column in df.columns else [None] * len(df)
+
+#Last edits as timestamps that can always be compared, a missing or unreadable one counts as the oldest
+def edit_times(df):
+    if "LAST EDIT" not in df.columns:
+        return [pd.Timestamp.min] * len(df)
+    return pd.to_datetime(df["LAST EDIT"], errors="coerce").fillna(pd.Timestamp.min).tolist()
+
+
+class LookupIndex:
+    def __init__(self, table_name):
+        self.table_name = table_name
+        self.lock = threading.RLock()
+        self.version = 0
+        #(serial, friendly name, label, last edit) for each row position of the snapshot
+        self.rows = []
+        self.position_by_serial = {}
+        #A friendly name can be used more than once, so each name keeps all of its serials with their last edit
+        self.serials_by_name = {}
+        self.serial_by_label = {}
+        #Every row's label in position order, so the labels for a filtered frame are one numpy take
+        self.label_array = np.empty(0, dtype=object)
+
+    #The row tuples for the given positions of df
+    def row_entries(self, df):
+        return list(zip(column_values(df, "S/N"), column_values(df, "FRIENDLY NAME"), row_labels(df, self.table_name), edit_times(df)))
+
+    def add_row(self, position, row):
+        serial, name, label, last_edit = row
+        self.position_by_serial[serial] = position
+        if name is not None:
+            self.serials_by_name.setdefault(name, {})[serial] = last_edit
+        self.serial_by_label[label] = serial
+
+    def remove_row(self, position, row):
+        serial, name, label, _ = row
+        if self.position_by_serial.get(serial) == position:
+            del self.position_by_serial[serial]
+        if name is not None and name in self.serials_by_name:
+            self.serials_by_name[name].pop(serial, None)
+            if not self.serials_by_name[name]:
+                del self.serials_by_name[name]
+        if self.serial_by_label.get(label) == serial:
+            del self.serial_by_label[label]
+
+    def rebuild(self, df):
+        self.rows = self.row_entries(df)
+        self.position_by_serial = {}
+        self.serials_by_name = {}
+        self.serial_by_label = {}
+        for position, row in enumerate(self.rows):
+            self.add_row(position, row)
+        self.label_array = np.array([row[2] for row in self.rows], dtype=object)
+
+    #Re-indexes only the rows at the changed positions, anything past the end of the old snapshot is a new row
+    def update(self, df, positions):
+        rows = self.row_entries(df.iloc[positions])
+        needed = max(positions, default=-1) + 1
+        if needed > len(self.label_array):
+            self.label_array = np.concatenate([self.label_array, np.empty(needed - len(self.label_array), dtype=object)])
+        for position, row in zip(positions, rows):
+            if position < len(self.rows):
+                self.remove_row(position, self.rows[position])
+                self.rows[position] = row
+            else:
+                self.rows.extend([None] * (position - len(self.rows)))
+                self.rows.append(row)
+            self.add_row(position, row)
+            self.label_array[position] = row[2]
+
+    def sync(self, table_cache):
+        with self.lock:
+            self.version = table_cache.catch_up(self.table_name, self.version, self.rebuild, self.update)
+
+    def has_serial(self, serial):
+        with self.lock:
+            return serial in self.position_by_serial
+
+    def position(self, serial):
+        with self.lock:
+            return self.position_by_serial.get(serial)
+
+    #The most recently edited device with this friendly name (the same one the old scan of the newest-first frame found)
+    def serial_for_name(self, name):
+        with self.lock:
+            serials = self.serials_by_name.get(name)
+            if not serials:
+                return None
+            return max(serials, key=serials.get)
+
+    def name_for_serial(self, serial):
+        with self.lock:
+            position = self.position_by_serial.get(serial)
+            return self.rows[position][1] if position is not None else None
+
+    def serial_for_label(self, label):
+        with self.lock:
+            return self.serial_by_label.get(label)
+
+    #The dropdown labels for these row positions (the index of a frame from the table cache), in the same order
+    def labels(self, positions):
+        with self.lock:
+            return self.label_array[np.asarray(positions, dtype=np.int64)].tolist()
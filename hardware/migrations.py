@@ -0,0 +1,183 @@
+#These are the schema migrations for POSHardware.db, they run once at startup before anything reads the database.
+#The schema version is kept in PRAGMA user_version, so each migration only ever runs once per database.
+#Every migration also checks the schema itself before changing it, so a database that was fixed by hand won't break.
+#You can also run them without the app: python -m hardware.migrations POSHardware.db
+#python -m hardware.migrations --check runs them against copies of the template shaped like older databases and fails if any of them break.
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+
+def table_columns(connection, table_name):
+    return {row[1]: row[2].upper() for row in connection.execute(f"PRAGMA table_info({table_name});")}
+
+#SQLite can't change a column's type in place, so the table is copied into a new one with the right schema.
+#rowid is copied too so anything pointing at HISTORY rows (like the full-text search table) still lines up.
+#copy_values can give an SQL expression for a column instead of copying it as-is, e.g. to fill in NULLs a new constraint won't allow.
+def rebuild_table(connection, table_name, create_sql, copy_columns, copy_values=None):
+    copy_values = copy_values or {}
+    columns = ", ".join(f'"{column}"' for column in copy_columns)
+    values = ", ".join(copy_values.get(column, f'"{column}"') for column in copy_columns)
+    connection.execute(f"DROP TABLE IF EXISTS {table_name}_NEW;")
+    connection.execute(create_sql.replace(f"CREATE TABLE {table_name} ", f"CREATE TABLE {table_name}_NEW ", 1))
+    connection.execute(f"INSERT INTO {table_name}_NEW (rowid, {columns}) SELECT rowid, {values} FROM {table_name};")
+    connection.execute(f"DROP TABLE {table_name};")
+    connection.execute(f"ALTER TABLE {table_name}_NEW RENAME TO {table_name};")
+
+
+#Version 1: LOCATIONS.IMAGE holds a filename now (not the photo itself) and every location needs IS_STORAGE for the overview
+def locations_image_text_and_storage(connection):
+    columns = table_columns(connection, "LOCATIONS")
+    #IS_STORAGE added by hand is nullable, and locations from before it was added have NULL there
+    if columns.get("IMAGE") == "TEXT" and "IS_STORAGE" in columns:
+        connection.execute("UPDATE LOCATIONS SET IS_STORAGE = 0 WHERE IS_STORAGE IS NULL;")
+        return
+    copy_columns = ["LOCATION", "IMAGE"] + (["IS_STORAGE"] if "IS_STORAGE" in columns else [])
+    rebuild_table(connection, "LOCATIONS", "CREATE TABLE LOCATIONS (LOCATION TEXT PRIMARY KEY, IMAGE TEXT, IS_STORAGE BOOLEAN NOT NULL DEFAULT 0);", copy_columns,
+                  {"IS_STORAGE": 'coalesce("IS_STORAGE", 0)'})
+
+#Version 2: HISTORY."PREVIOUS PHOTO" is a filename like "NEW PHOTO", so it is TEXT as well
+def history_photo_text(connection):
+    if table_columns(connection, "HISTORY").get("PREVIOUS PHOTO") == "TEXT":
+        return
+    copy_columns = ["CHANGE TIME", "DEVICE S/N", "PREVIOUS LOCATION", "PREVIOUS FRIENDLY NAME", "PREVIOUS CONNECTION", "PREVIOUS NOTES", "PREVIOUS PHOTO", "NEW LOCATION", "NEW FRIENDLY NAME", "NEW CONNECTION", "NEW NOTES", "NEW PHOTO", "CHANGE LOG"]
+    rebuild_table(connection, "HISTORY", 'CREATE TABLE HISTORY ("CHANGE TIME" TIMESTAMP, "DEVICE S/N" TEXT, "PREVIOUS LOCATION" TEXT, "PREVIOUS FRIENDLY NAME" TEXT, "PREVIOUS CONNECTION" TEXT, "PREVIOUS NOTES" TEXT, "PREVIOUS PHOTO" TEXT, "NEW LOCATION" TEXT, "NEW FRIENDLY NAME" TEXT, "NEW CONNECTION" TEXT, "NEW NOTES" TEXT, "NEW PHOTO" TEXT, "CHANGE LOG" TEXT);', copy_columns)
+
+#Version 3: indexes for every column we filter or sort on that isn't a primary key
+HOT_LOOKUP_INDEXES = {
+    "HISTORY_CHANGE_TIME": ("HISTORY", "CHANGE TIME"),
+    "HISTORY_DEVICE_SN": ("HISTORY", "DEVICE S/N"),
+    "HISTORY_PREVIOUS_LOCATION": ("HISTORY", "PREVIOUS LOCATION"),
+    "HISTORY_NEW_LOCATION": ("HISTORY", "NEW LOCATION"),
+    "COMPONENTS_CONNECTED": ("COMPONENTS", "CONNECTED"),
+    "COMPONENTS_LOCATION": ("COMPONENTS", "LOCATION"),
+    "DEVICES_LOCATION": ("DEVICES", "LOCATION"),
+}
+
+def hot_lookup_indexes(connection):
+    for index_name, (table_name, column) in HOT_LOOKUP_INDEXES.items():
+        connection.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ("{column}");')
+    connection.execute("ANALYZE;")
+
+#Version 4: ASSET_SUMMARY keeps a running count of assets for each table, location and whether they have a photo.
+#Triggers on DEVICES and COMPONENTS keep it up to date, so the overview adds up a handful of rows instead of scanning every asset.
+#Anything that rebuilds DEVICES or COMPONENTS has to recreate these triggers (asset_summary does it and refills the counts).
+SUMMARY_TABLES = ("DEVICES", "COMPONENTS")
+
+def asset_summary(connection):
+    connection.execute('CREATE TABLE IF NOT EXISTS ASSET_SUMMARY ("ASSET TABLE" TEXT NOT NULL, LOCATION TEXT NOT NULL, HAS_PHOTO INTEGER NOT NULL, ASSETS INTEGER NOT NULL DEFAULT 0, PRIMARY KEY ("ASSET TABLE", LOCATION, HAS_PHOTO));')
+    #An asset without a location is counted under '' so the primary key still works
+    add = "INSERT INTO ASSET_SUMMARY VALUES ('{table}', coalesce({row}.LOCATION, ''), {row}.IMAGE IS NOT NULL, 1) ON CONFLICT (\"ASSET TABLE\", LOCATION, HAS_PHOTO) DO UPDATE SET ASSETS = ASSETS + 1;"
+    remove = "UPDATE ASSET_SUMMARY SET ASSETS = ASSETS - 1 WHERE \"ASSET TABLE\" = '{table}' AND LOCATION = coalesce({row}.LOCATION, '') AND HAS_PHOTO = ({row}.IMAGE IS NOT NULL);"
+    for table_name in SUMMARY_TABLES:
+        connection.execute(f"DROP TRIGGER IF EXISTS {table_name}_SUMMARY_INSERT;")
+        connection.execute(f"DROP TRIGGER IF EXISTS {table_name}_SUMMARY_DELETE;")
+        connection.execute(f"DROP TRIGGER IF EXISTS {table_name}_SUMMARY_UPDATE;")
+        connection.execute(f"CREATE TRIGGER {table_name}_SUMMARY_INSERT AFTER INSERT ON {table_name} BEGIN {add.format(table=table_name, row='new')} END;")
+        connection.execute(f"CREATE TRIGGER {table_name}_SUMMARY_DELETE AFTER DELETE ON {table_name} BEGIN {remove.format(table=table_name, row='old')} END;")
+        connection.execute(f"CREATE TRIGGER {table_name}_SUMMARY_UPDATE AFTER UPDATE OF LOCATION, IMAGE ON {table_name} BEGIN {remove.format(table=table_name, row='old')} {add.format(table=table_name, row='new')} END;")
+    connection.execute("DELETE FROM ASSET_SUMMARY;")
+    for table_name in SUMMARY_TABLES:
+        connection.execute(f"INSERT INTO ASSET_SUMMARY SELECT '{table_name}', coalesce(LOCATION, ''), IMAGE IS NOT NULL, count(*) FROM {table_name} GROUP BY 2, 3;")
+
+#Version 5: indexes on "LAST EDIT", the integrity scan uses them to find what changed since its last run and which devices have gone stale
+LAST_EDIT_INDEXES = {
+    "DEVICES_LAST_EDIT": ("DEVICES", "LAST EDIT"),
+    "COMPONENTS_LAST_EDIT": ("COMPONENTS", "LAST EDIT"),
+}
+
+def last_edit_indexes(connection):
+    for index_name, (table_name, column) in LAST_EDIT_INDEXES.items():
+        connection.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ("{column}");')
+    connection.execute("ANALYZE;")
+
+
+#(version, description, function) in the order they have to run, new migrations always go on the end with the next number
+MIGRATIONS = [
+    (1, "LOCATIONS.IMAGE as TEXT and LOCATIONS.IS_STORAGE", locations_image_text_and_storage),
+    (2, "HISTORY.PREVIOUS PHOTO as TEXT", history_photo_text),
+    (3, "Indexes on hot lookup columns", hot_lookup_indexes),
+    (4, "ASSET_SUMMARY counts kept by triggers", asset_summary),
+    (5, "Indexes on LAST EDIT", last_edit_indexes),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(connection):
+    return connection.execute("PRAGMA user_version;").fetchone()[0]
+
+#Runs every migration newer than the database's version, each one in its own transaction along with its version bump.
+#If one fails it is rolled back and the error is raised, so the app never starts on a half-migrated database.
+#Returns the descriptions of the migrations that were applied.
+def migrate(database_path):
+    applied = []
+    #isolation_level=None means sqlite3 doesn't open transactions by itself, so BEGIN/COMMIT below cover the table rebuilds too
+    connection = sqlite3.connect(database_path, isolation_level=None)
+    try:
+        for version, description, migration in MIGRATIONS:
+            if version <= schema_version(connection):
+                continue
+            connection.execute("BEGIN IMMEDIATE;")
+            try:
+                migration(connection)
+                connection.execute(f"PRAGMA user_version = {version};")
+                connection.execute("COMMIT;")
+            except Exception:
+                connection.execute("ROLLBACK;")
+                raise
+            applied.append(f"{version}: {description}")
+    finally:
+        connection.close()
+    return applied
+
+
+#Older databases the migrations have to handle, each is the template with these statements run on it first
+LEGACY_DATABASES = {
+    "template as shipped": [
+        "INSERT INTO LOCATIONS (LOCATION) VALUES ('STORAGE');",
+    ],
+    "IS_STORAGE added by hand with NULLs": [
+        "ALTER TABLE LOCATIONS ADD COLUMN IS_STORAGE BOOLEAN;",
+        "INSERT INTO LOCATIONS (LOCATION, IS_STORAGE) VALUES ('OLD BAR', NULL);",
+        "INSERT INTO LOCATIONS (LOCATION, IS_STORAGE) VALUES ('STORAGE', 1);",
+    ],
+}
+
+#Migrates a copy of the template for each of LEGACY_DATABASES and checks every location ends up with IS_STORAGE set, returns what went wrong
+def check_migrations(template_path):
+    failures = []
+    for name, statements in LEGACY_DATABASES.items():
+        with tempfile.TemporaryDirectory() as folder:
+            database_path = os.path.join(folder, "legacy.db")
+            shutil.copyfile(template_path, database_path)
+            connection = sqlite3.connect(database_path)
+            for statement in statements:
+                connection.execute(statement)
+            connection.commit()
+            connection.close()
+            try:
+                migrate(database_path)
+            except Exception as e:
+                failures.append(f"{name}: {e}")
+                continue
+            connection = sqlite3.connect(database_path)
+            if schema_version(connection) != LATEST_VERSION:
+                failures.append(f"{name}: stopped at version {schema_version(connection)}")
+            if connection.execute("SELECT count(*) FROM LOCATIONS WHERE IS_STORAGE IS NULL;").fetchone()[0]:
+                failures.append(f"{name}: locations left without IS_STORAGE")
+            connection.close()
+    return failures
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--check"]:
+        problems = check_migrations(sys.argv[2] if len(sys.argv) > 2 else "POSHardwareTEMPLATE.db")
+        for problem in problems:
+            print(problem)
+        sys.exit(1 if problems else 0)
+    for applied_migration in migrate(sys.argv[1] if len(sys.argv) > 1 else "POSHardware.db") or ["Already up to date"]:
+        print(applied_migration)
@@ -0,0 +1,38 @@
+#These are the numbers on the Overview tab.
+#Asset counts come from ASSET_SUMMARY (one row per table, location and photo/no photo, kept up to date by triggers, see migrations.py),
+#so they cost the same whether there are a hundred assets or a million.
+#Changes in the last 24 hours are counted with the index on HISTORY."CHANGE TIME", which only touches the rows in that window.
+
+import datetime
+from sqlalchemy import text
+
+
+SUMMARY_QUERY = text('SELECT s."ASSET TABLE", s.LOCATION, s.HAS_PHOTO, s.ASSETS, coalesce(l.IS_STORAGE, 0) FROM ASSET_SUMMARY s LEFT JOIN LOCATIONS l ON l.LOCATION = s.LOCATION WHERE s.ASSETS > 0;')
+RECENT_CHANGES_QUERY = text('SELECT count(*) FROM HISTORY WHERE "CHANGE TIME" >= :since;')
+
+
+#Returns a dict of every number the overview paragraph needs
+def overview_metrics(engine, now=None):
+    now = now or datetime.datetime.now()
+    metrics = {
+        "total_devices": 0, "total_components": 0,
+        "wasted_devices": 0, "wasted_components": 0,
+        "devices_without_photo": 0, "components_without_photo": 0,
+        "stored_assets": 0, "unknown_assets": 0,
+    }
+    with engine.connect() as connection:
+        for table_name, location, has_photo, assets, is_storage in connection.execute(SUMMARY_QUERY):
+            kind = "devices" if table_name == "DEVICES" else "components"
+            metrics[f"total_{kind}"] += assets
+            if location == "E-WASTED":
+                metrics[f"wasted_{kind}"] += assets
+            if not has_photo:
+                metrics[f"{kind}_without_photo"] += assets
+            if is_storage:
+                metrics["stored_assets"] += assets
+            if location == "UNKNOWN":
+                metrics["unknown_assets"] += assets
+        #CHANGE TIME is 'YYYY-MM-DD HH:MM:SS' text, so this is a plain range on the index
+        since = (now - datetime.timedelta(hours=24)).strftime('%Y-%m-%d %H:%M:%S')
+        metrics["changes_last_24_hours"] = connection.execute(RECENT_CHANGES_QUERY, {"since": since}).scalar()
+    return metrics
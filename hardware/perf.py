@@ -0,0 +1,169 @@
+#Timers and counters for the app's hot paths (queries, cache hits and misses, searches, image I/O and commits).
+#It's off unless POS_PERF=1 is set, and while it's off timer() hands back one shared do-nothing timer and count() returns straight away,
+#so leaving the calls in the code costs next to nothing.
+#When it's on, the totals are shared by every session and each rerun's own timings are kept for the Performance tab.
+#Set POS_PERF_EXPORT to a file path and the totals are written there after reruns, as JSON if it ends in .json and Prometheus text otherwise.
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+ENABLED_VARIABLE = "POS_PERF"
+EXPORT_VARIABLE = "POS_PERF_EXPORT"
+
+#How many reruns the Performance tab can show, and how often the export file is rewritten at most
+RERUNS_KEPT = 50
+EXPORT_INTERVAL_SECONDS = 10
+
+PROMETHEUS_PREFIX = "pos_hardware"
+
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+NULL_TIMER = NullTimer()
+
+class Timer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.record(self.name, time.perf_counter() - self.started)
+        return False
+
+
+#One of these is shared by the whole server, it's METRICS at the bottom
+class Metrics:
+    def __init__(self, enabled=False, export_path=None):
+        self.enabled = enabled
+        self.export_path = export_path
+        self.lock = threading.Lock()
+        #name: [calls, total seconds, slowest seconds]
+        self.timers = {}
+        self.counters = {}
+        self.reruns = deque(maxlen=RERUNS_KEPT)
+        self.last_export = 0
+        #Each Streamlit session reruns on its own thread, so the timings for the rerun in progress are kept per thread
+        self.local = threading.local()
+
+    def timer(self, name):
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, name)
+
+    #Wraps a function so every call is timed under name
+    def timed(self, name):
+        def decorator(function):
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return function(*args, **kwargs)
+            wrapper.__name__ = function.__name__
+            wrapper.__doc__ = function.__doc__
+            return wrapper
+        return decorator
+
+    def record(self, name, seconds):
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+        rerun = getattr(self.local, "rerun", None)
+        if rerun is not None:
+            rerun["timings"][name] = rerun["timings"].get(name, 0) + seconds
+            rerun["calls"][name] = rerun["calls"].get(name, 0) + 1
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+        rerun = getattr(self.local, "rerun", None)
+        if rerun is not None:
+            rerun["counters"][name] = rerun["counters"].get(name, 0) + amount
+
+    #Called at the top and bottom of the script, anything timed in between on this thread is part of the rerun's breakdown
+    def start_rerun(self):
+        if not self.enabled:
+            return
+        self.local.rerun = {"started": time.time(), "perf_counter": time.perf_counter(), "timings": {}, "calls": {}, "counters": {}}
+
+    #Returns the finished rerun (or None when it's off) so the session can keep its own
+    def finish_rerun(self):
+        rerun = getattr(self.local, "rerun", None)
+        if rerun is None:
+            return None
+        self.local.rerun = None
+        rerun["total"] = time.perf_counter() - rerun.pop("perf_counter")
+        with self.lock:
+            self.reruns.append(rerun)
+        self.record("rerun", rerun["total"])
+        if self.export_path and time.time() - self.last_export >= EXPORT_INTERVAL_SECONDS:
+            self.export(self.export_path)
+        return rerun
+
+    def reset(self):
+        with self.lock:
+            self.timers.clear()
+            self.counters.clear()
+            self.reruns.clear()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "timers": {name: {"calls": calls, "total_seconds": total, "max_seconds": slowest} for name, (calls, total, slowest) in self.timers.items()},
+                "counters": dict(self.counters),
+                "reruns": list(self.reruns),
+            }
+
+    #The totals in Prometheus' text format, names go in a label so dotted names like query.DEVICES.all don't need escaping
+    def prometheus_text(self):
+        snapshot = self.snapshot()
+        timers = sorted(snapshot["timers"].items())
+        #Each metric's lines have to be together under its TYPE line
+        families = [
+            ("timer_calls_total", "counter", [(name, timer["calls"]) for name, timer in timers]),
+            ("timer_seconds_total", "counter", [(name, f"{timer['total_seconds']:.6f}") for name, timer in timers]),
+            ("timer_max_seconds", "gauge", [(name, f"{timer['max_seconds']:.6f}") for name, timer in timers]),
+            ("events_total", "counter", sorted(snapshot["counters"].items())),
+        ]
+        lines = []
+        for metric, metric_type, samples in families:
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{metric} {metric_type}")
+            lines.extend(f"{PROMETHEUS_PREFIX}_{metric}{{name={json.dumps(name)}}} {value}" for name, value in samples)
+        return "\n".join(lines) + "\n"
+
+    def json_text(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    #Writes to a temporary file first so a scraper never reads half a file
+    def export(self, path):
+        self.last_export = time.time()
+        contents = self.json_text() if path.endswith(".json") else self.prometheus_text()
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "w") as export_file:
+            export_file.write(contents)
+        os.replace(temporary_path, path)
+
+
+def metrics_from_environment(environment=None):
+    environment = os.environ if environment is None else environment
+    enabled = environment.get(ENABLED_VARIABLE, "").strip().lower() in ("1", "true", "yes", "on")
+    return Metrics(enabled=enabled, export_path=environment.get(EXPORT_VARIABLE) or None)
+
+METRICS = metrics_from_environment()
@@ -0,0 +1,110 @@
+#This builds the "All POS Photos" .zip.
+#The archive is written straight into a file in the system temp folder, photos are copied into the zip a small piece at a time,
+#and nothing is left behind in the project folder (the file is deleted when the archive is replaced or the server stops, on Windows one that was still open is deleted on a later rebuild).
+#The app never holds the zip in memory itself, the download button is handed the open file.
+#Streamlit still reads it into its own media storage when the button is drawn, that one copy can't be avoided with st.download_button.
+#Photos are already compressed, so they are stored as-is instead of being compressed a second time.
+#The finished archive is kept until a photo is added, changed or removed, so pressing the button again doesn't rebuild it.
+
+import hashlib
+import os
+import tempfile
+import threading
+import weakref
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+
+from hardware.perf import METRICS
+
+
+#Formats that are already compressed, zipping them again just costs time
+STORED_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif")
+
+#Exports (exports.py) up to this size are built in memory, anything bigger spills over to disk
+SPOOL_MAX_SIZE = 32 * 1024 * 1024
+
+#The thumbnails and previews are made from the originals, so they aren't worth downloading
+SKIPPED_FOLDERS = ("renditions",)
+
+
+#Every file in the folder (path in the zip, full path, size, modified time), sorted so the same photos always give the same manifest
+def photo_files(directory_path):
+    files = []
+    for root, dirs, file_names in os.walk(directory_path):
+        if root == directory_path:
+            dirs[:] = [folder for folder in dirs if folder not in SKIPPED_FOLDERS]
+        dirs.sort()
+        for file_name in sorted(file_names):
+            full_path = os.path.join(root, file_name)
+            stat = os.stat(full_path)
+            files.append((os.path.relpath(full_path, directory_path).replace(os.sep, "/"), full_path, stat.st_size, stat.st_mtime_ns))
+    return files
+
+#A short fingerprint of the folder, if it hasn't changed neither has the zip
+def manifest_key(files):
+    manifest = hashlib.sha1()
+    for arcname, _, size, mtime in files:
+        manifest.update(f"{arcname}\0{size}\0{mtime}\n".encode("utf-8"))
+    return manifest.hexdigest()
+
+#Writes the zip into archive (any writable file object)
+def write_photo_zip(files, archive):
+    with ZipFile(archive, "w") as zipf:
+        for arcname, full_path, _, _ in files:
+            compression = ZIP_STORED if arcname.lower().endswith(STORED_EXTENSIONS) else ZIP_DEFLATED
+            zipf.write(full_path, arcname=arcname, compress_type=compression)
+
+
+#True once the file is gone. Windows won't delete a file that's still open, so an archive someone is downloading can't go yet
+def remove_archive(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return False
+    return True
+
+#Deletes what it can and keeps the rest in paths to try again later
+def remove_archives(paths):
+    paths[:] = [path for path in paths if not remove_archive(path)]
+
+
+#One of these is shared by every session, it holds the last archive that was built
+class PhotoArchive:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.key = None
+        self.path = None
+        #The current archive plus any replaced ones that couldn't be deleted yet, they're retried on every rebuild
+        #and once more when this object is thrown away or the server exits
+        self.paths = []
+        self.cleanup = weakref.finalize(self, remove_archives, self.paths)
+        self.builds = 0
+
+    #Returns the zip opened for reading at the start (close it when done), rebuilding it only when the photos changed.
+    #An archive that gets replaced while someone is still reading it stays readable until they close it (and on Windows stays on disk until then).
+    def zip_file(self, directory_path):
+        files = photo_files(directory_path) if os.path.isdir(directory_path) else []
+        key = manifest_key(files)
+        with self.lock:
+            if key != self.key or self.path is None:
+                self.close()
+                handle, path = tempfile.mkstemp(prefix="pos-photos-", suffix=".zip")
+                try:
+                    with os.fdopen(handle, "wb") as archive, METRICS.timer("images.photo_zip"):
+                        write_photo_zip(files, archive)
+                except BaseException:
+                    remove_archive(path)
+                    raise
+                self.path = path
+                self.paths.append(path)
+                self.key = key
+                self.builds += 1
+            return open(self.path, "rb")
+
+    #Deletes the archive file (or leaves it to be retried if it's still open), the next zip_file() builds a new one
+    def close(self):
+        with self.lock:
+            self.path = None
+            self.key = None
+            remove_archives(self.paths)
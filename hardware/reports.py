@@ -0,0 +1,111 @@
+#This is the report engine behind the Reports tab.
+#All three .xlsx reports (full, e-waste and active) are built together from one read of the database: each table is read once,
+#row by row inside a single read transaction, and every row is written straight to whichever workbooks it belongs in.
+#xlsxwriter's constant_memory mode flushes each row to disk as it goes, so memory stays flat no matter how long HISTORY gets.
+#The finished workbooks are kept until the data changes, so downloading an unchanged report again is instant.
+
+import threading
+from io import BytesIO
+
+import xlsxwriter
+
+
+EWASTE_LOCATION = "E-WASTED"
+
+#The columns in each sheet, in the same order as they always were
+REPORT_SHEETS = {
+    "DEVICES": ["POS", "MODEL", "TYPE", "S/N", "LOCATION", "FRIENDLY NAME", "NOTES", "LAST EDIT"],
+    "COMPONENTS": ["POS", "MODEL", "TYPE", "S/N", "LOCATION", "CONNECTED", "NOTES", "LAST EDIT"],
+    "HISTORY": ["CHANGE TIME", "DEVICE S/N", "PREVIOUS LOCATION", "PREVIOUS FRIENDLY NAME", "PREVIOUS CONNECTION", "PREVIOUS NOTES", "NEW LOCATION", "NEW FRIENDLY NAME", "NEW CONNECTION", "NEW NOTES"],
+}
+
+#Which rows go into which report. These match the old SQL exactly, including that != leaves out rows where the location is empty.
+def asset_reports(location):
+    reports = ["full"]
+    if location == EWASTE_LOCATION:
+        reports.append("ewaste")
+    elif location is not None:
+        reports.append("active")
+    return reports
+
+def history_reports(previous_location, new_location):
+    reports = ["full"]
+    if previous_location == EWASTE_LOCATION or new_location == EWASTE_LOCATION:
+        reports.append("ewaste")
+    elif previous_location is not None and new_location is not None:
+        reports.append("active")
+    return reports
+
+REPORT_NAMES = ("full", "ewaste", "active")
+
+
+#Every change the app makes adds a HISTORY row, and new assets change the counts, so together these tell us if a report is out of date
+def data_version(cursor):
+    cursor.execute('SELECT (SELECT max(rowid) FROM HISTORY), (SELECT count(*) FROM DEVICES), (SELECT count(*) FROM COMPONENTS);')
+    return tuple(cursor.fetchone())
+
+def sheet_query(table_name):
+    columns = ", ".join(f'"{column}"' for column in REPORT_SHEETS[table_name])
+    return f"SELECT {columns} FROM {table_name};"
+
+#Picks the reports a row belongs in, using the LOCATION column for assets and both location columns for HISTORY
+def row_router(columns):
+    if "LOCATION" in columns:
+        location = columns.index("LOCATION")
+        return lambda row: asset_reports(row[location])
+    previous_location, new_location = columns.index("PREVIOUS LOCATION"), columns.index("NEW LOCATION")
+    return lambda row: history_reports(row[previous_location], row[new_location])
+
+#Builds all three workbooks in one pass, returns (data version, {report name: xlsx bytes})
+def build_reports(engine):
+    outputs = {name: BytesIO() for name in REPORT_NAMES}
+    workbooks = {name: xlsxwriter.Workbook(outputs[name], {"constant_memory": True}) for name in REPORT_NAMES}
+    header_formats = {name: workbook.add_format({"bold": True, "border": 1}) for name, workbook in workbooks.items()}
+
+    raw_connection = engine.raw_connection()
+    try:
+        cursor = raw_connection.cursor()
+        #One read transaction, so all three sheets (and the version) come from the same moment even if someone saves halfway through
+        cursor.execute("BEGIN;")
+        version = data_version(cursor)
+        for table_name, columns in REPORT_SHEETS.items():
+            sheets = {name: workbook.add_worksheet(table_name) for name, workbook in workbooks.items()}
+            next_row = {}
+            for name, sheet in sheets.items():
+                sheet.write_row(0, 0, columns, header_formats[name])
+                next_row[name] = 1
+            route = row_router(columns)
+            cursor.execute(sheet_query(table_name))
+            for row in cursor:
+                for name in route(row):
+                    sheets[name].write_row(next_row[name], 0, row)
+                    next_row[name] += 1
+        raw_connection.rollback()
+    finally:
+        raw_connection.close()
+
+    for workbook in workbooks.values():
+        workbook.close()
+    return version, {name: output.getvalue() for name, output in outputs.items()}
+
+
+#One of these is shared by every session
+class ReportCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.workbooks = {}
+        self.builds = 0
+
+    #Returns the .xlsx bytes for "full", "ewaste" or "active", rebuilding all three only if the data changed since the last build
+    def workbook(self, engine, report_name):
+        raw_connection = engine.raw_connection()
+        try:
+            current_version = data_version(raw_connection.cursor())
+        finally:
+            raw_connection.close()
+        with self.lock:
+            if current_version != self.version or report_name not in self.workbooks:
+                self.version, self.workbooks = build_reports(engine)
+                self.builds += 1
+            return self.workbooks[report_name]
@@ -0,0 +1,132 @@
+#This is the data-access layer, every table's SQL lives here instead of being written out again in each form handler.
+#Each table has a repository that knows its columns, so reads name the columns they want instead of SELECT *,
+#and each statement is built once and kept, so SQLAlchemy compiles it once and reuses it for every call after that.
+#Writes come back as (statement, parameters) pairs, which the background writer runs as they are (or pass them to connection.execute yourself).
+#Nothing in here needs Streamlit, so scripts and benchmarks can use it straight against an engine.
+
+import re
+import threading
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+
+def quote(column):
+    return f'"{column}"'
+
+#Bind parameter names can't have spaces or slashes, so "FRIENDLY NAME" is bound as :friendly_name and "S/N" as :s_n
+def param_name(column):
+    return re.sub(r"[^0-9a-zA-Z]+", "_", column).strip("_").lower()
+
+
+class Repository:
+    table_name = None
+    key_column = None
+    columns = []
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.statements = {}
+
+    #Builds a statement the first time it's asked for and hands back the same one after that
+    def statement(self, name, build):
+        with self.lock:
+            if name not in self.statements:
+                self.statements[name] = build()
+            return self.statements[name]
+
+    def column_list(self, columns=None, prefix=""):
+        return ", ".join(prefix + quote(column) for column in (columns or self.columns))
+
+    #Every row with the table's columns (or just the ones asked for)
+    def all(self, connection, columns=None):
+        columns = tuple(columns or self.columns)
+        query = self.statement(("all", columns), lambda: text(f"SELECT {self.column_list(columns)} FROM {self.table_name};"))
+        return pd.read_sql(query, connection)
+
+    #The rows with any of these keys, one statement no matter how many keys there are
+    def by_keys(self, connection, keys, columns=None):
+        columns = tuple(columns or self.columns)
+        query = self.statement(("by_keys", columns), lambda: text(f"SELECT {self.column_list(columns)} FROM {self.table_name} WHERE {quote(self.key_column)} IN :keys;").bindparams(bindparam("keys", expanding=True)))
+        return pd.read_sql(query, connection, params={"keys": list(keys)})
+
+    #One row as a dict (or None if it doesn't exist)
+    def get(self, connection, key, columns=None):
+        columns = tuple(columns or self.columns)
+        query = self.statement(("get", columns), lambda: text(f"SELECT {self.column_list(columns)} FROM {self.table_name} WHERE {quote(self.key_column)} = :key;"))
+        row = connection.execute(query, {"key": key}).mappings().fetchone()
+        return dict(row) if row is not None else None
+
+    #A misspelled column would otherwise just be left out of the statement
+    def check_columns(self, values):
+        unknown = set(values) - set(self.columns)
+        if unknown:
+            raise KeyError(f"{self.table_name} has no column {', '.join(sorted(unknown))}")
+
+    #values is {column: value}, every column that isn't given is inserted as NULL
+    def insert(self, values):
+        query = self.statement("insert", lambda: text(f"INSERT INTO {self.table_name} ({self.column_list()}) VALUES ({', '.join(':' + param_name(column) for column in self.columns)});"))
+        self.check_columns(values)
+        return query, {param_name(column): values.get(column) for column in self.columns}
+
+    #Sets the given columns on the row with this key, there is one cached statement for each set of columns that gets updated
+    def update(self, key, values):
+        self.check_columns(values)
+        columns = tuple(column for column in self.columns if column in values)
+        query = self.statement(("update", columns), lambda: text(f"UPDATE {self.table_name} SET {', '.join(f'{quote(column)} = :{param_name(column)}' for column in columns)} WHERE {quote(self.key_column)} = :key;"))
+        return query, {**{param_name(column): values[column] for column in columns}, "key": key}
+
+
+class DevicesRepository(Repository):
+    table_name = "DEVICES"
+    key_column = "S/N"
+    columns = ["POS", "MODEL", "TYPE", "S/N", "LOCATION", "FRIENDLY NAME", "NOTES", "IMAGE", "LAST EDIT"]
+
+class ComponentsRepository(Repository):
+    table_name = "COMPONENTS"
+    key_column = "S/N"
+    columns = ["POS", "MODEL", "TYPE", "S/N", "LOCATION", "CONNECTED", "NOTES", "IMAGE", "LAST EDIT"]
+
+    #The components connected to a device that aren't already at new_location
+    def connected_elsewhere(self, connection, device_serial, new_location, columns=None):
+        columns = tuple(columns or self.columns)
+        query = self.statement(("connected_elsewhere", columns), lambda: text(f"SELECT {self.column_list(columns)} FROM COMPONENTS WHERE CONNECTED = :device AND (LOCATION IS NULL OR LOCATION != :location);"))
+        return connection.execute(query, {"device": device_serial, "location": new_location}).fetchall()
+
+class LocationsRepository(Repository):
+    table_name = "LOCATIONS"
+    key_column = "LOCATION"
+    columns = ["LOCATION", "IMAGE", "IS_STORAGE"]
+
+#DEVICE_TYPES and COMPONENT_TYPES have the same shape, just a different name for the type column
+class TypesRepository(Repository):
+    def __init__(self, table_name, type_column):
+        super().__init__()
+        self.table_name = table_name
+        self.key_column = type_column
+        self.columns = [type_column, "IMAGE"]
+
+#HISTORY has no key and is only ever added to, so rows are found by rowid
+class HistoryRepository(Repository):
+    table_name = "HISTORY"
+    columns = ["CHANGE TIME", "DEVICE S/N", "PREVIOUS LOCATION", "PREVIOUS FRIENDLY NAME", "PREVIOUS CONNECTION", "PREVIOUS NOTES", "PREVIOUS PHOTO", "NEW LOCATION", "NEW FRIENDLY NAME", "NEW CONNECTION", "NEW NOTES", "NEW PHOTO", "CHANGE LOG"]
+
+    #Every row added after rowid, with the rowid as "_rowid"
+    def since(self, connection, rowid=0, columns=None):
+        columns = tuple(columns or self.columns)
+        query = self.statement(("since", columns), lambda: text(f'SELECT rowid AS "_rowid", {self.column_list(columns)} FROM HISTORY WHERE rowid > :rowid;'))
+        return pd.read_sql(query, connection, params={"rowid": rowid})
+
+    #A new history entry, values are the columns that were part of the change
+    def record(self, change_time, change_log, values=None):
+        return self.insert({**(values or {}), "CHANGE TIME": change_time, "CHANGE LOG": change_log})
+
+
+DEVICES = DevicesRepository()
+COMPONENTS = ComponentsRepository()
+LOCATIONS = LocationsRepository()
+DEVICE_TYPES = TypesRepository("DEVICE_TYPES", "DEVICE_TYPE")
+COMPONENT_TYPES = TypesRepository("COMPONENT_TYPES", "COMPONENT_TYPE")
+HISTORY = HistoryRepository()
+
+REPOSITORIES = {repository.table_name: repository for repository in (DEVICES, COMPONENTS, LOCATIONS, DEVICE_TYPES, COMPONENT_TYPES, HISTORY)}
@@ -0,0 +1,118 @@
+#This is the search index behind the Devices, Components and History search bars.
+#Every distinct cell value is broken into 3 letter pieces (trigrams) once, so a search only has to look at the values that share all of the search term's pieces.
+#Searches are case-insensitive substring matches on each cell, the same as the old row.astype(str).str.contains(term, case=False) filter (but without regex).
+
+import threading
+import numpy as np
+
+from hardware.compact import text_values
+from hardware.perf import METRICS
+
+
+GRAM_SIZE = 3
+
+
+def text_grams(value):
+    return {value[start:start + GRAM_SIZE] for start in range(len(value) - GRAM_SIZE + 1)}
+
+
+class SearchIndex:
+    def __init__(self, table_name, columns=None):
+        self.table_name = table_name
+        self.columns = list(columns) if columns else None
+        self.lock = threading.Lock()
+        self.version = 0
+        self.rows = []
+        self.values = {}
+        self.grams = {}
+        self.short_values = set()
+
+    #Turns rows of a frame into lowercase cell text, this matches what astype(str) shows for None, NaN and timestamps
+    def cell_text(self, df):
+        columns = self.columns or list(df.columns)
+        return [text_values(df[column]).str.lower() for column in columns]
+
+    def add_value(self, value, positions):
+        if value not in self.values:
+            self.values[value] = set()
+            if len(value) < GRAM_SIZE:
+                self.short_values.add(value)
+            for gram in text_grams(value):
+                gram_values = self.grams.get(gram)
+                if gram_values is None:
+                    self.grams[gram] = {value}
+                else:
+                    gram_values.add(value)
+        self.values[value].update(positions)
+
+    def remove_value(self, value, position):
+        positions = self.values.get(value)
+        if positions is None:
+            return
+        positions.discard(position)
+        if not positions:
+            del self.values[value]
+            self.short_values.discard(value)
+            for gram in text_grams(value):
+                gram_values = self.grams.get(gram)
+                if gram_values is not None:
+                    gram_values.discard(value)
+                    if not gram_values:
+                        del self.grams[gram]
+
+    def rebuild(self, df):
+        self.values = {}
+        self.grams = {}
+        self.short_values = set()
+        lowered = self.cell_text(df)
+        #Grouping each column by its values means repeated values (locations, types, change logs) are only indexed once
+        for column in lowered:
+            for value, positions in column.groupby(column.to_numpy(), sort=False).indices.items():
+                self.add_value(value, positions.tolist())
+        self.rows = list(zip(*[column.tolist() for column in lowered])) if lowered else []
+
+    #Re-indexes only the rows at the changed positions, anything past the end of the old snapshot is a new row
+    def update(self, df, positions):
+        lowered = self.cell_text(df.iloc[positions])
+        new_rows = list(zip(*[column.tolist() for column in lowered])) if lowered else []
+        for position, cells in zip(positions, new_rows):
+            if position < len(self.rows):
+                for value in set(self.rows[position]):
+                    self.remove_value(value, position)
+                self.rows[position] = cells
+            else:
+                self.rows.extend([()] * (position - len(self.rows)))
+                self.rows.append(cells)
+            for value in set(cells):
+                self.add_value(value, (position,))
+
+    def sync(self, table_cache):
+        with self.lock:
+            self.version = table_cache.catch_up(self.table_name, self.version,
+                                                METRICS.timed(f"search_index.{self.table_name}.rebuild")(self.rebuild),
+                                                METRICS.timed(f"search_index.{self.table_name}.update")(self.update))
+
+    #The distinct values that contain the term.
+    #Long terms intersect the values of each of their trigrams (smallest first) and then double check the candidates.
+    #Short terms can't be split into trigrams, but any value holding one has a trigram holding it, so we scan the trigrams instead of the values.
+    def matching_values(self, term):
+        if len(term) >= GRAM_SIZE:
+            gram_values = sorted((self.grams.get(gram, ()) for gram in text_grams(term)), key=len)
+            candidates = set(gram_values[0]).intersection(*gram_values[1:])
+            return [value for value in candidates if term in value]
+        matches = {value for value in self.short_values if term in value}
+        for gram, gram_values in self.grams.items():
+            if term in gram:
+                matches.update(gram_values)
+        return matches
+
+    #Returns the row positions (index labels of the cached table) with a cell containing the term
+    def search(self, term):
+        term = str(term).lower()
+        with self.lock:
+            if not term:
+                return np.arange(len(self.rows))
+            positions = set()
+            for value in self.matching_values(term):
+                positions.update(self.values[value])
+        return np.fromiter(sorted(positions), dtype=np.int64, count=len(positions))
@@ -0,0 +1,176 @@
+#This is the in-memory cache for every table in the database.
+#Instead of wiping everything after a write, each write tells the cache which rows it touched and only those get re-read.
+#The DataFrames handed out by get() are shared between every session, so treat them as read-only!
+#DEVICES, COMPONENTS and HISTORY are stored compacted (categorical columns and parsed timestamps), see compact.py.
+
+import threading
+import numpy as np
+import pandas as pd
+
+from hardware.compact import compact, align_categories, load_layout
+from hardware.perf import METRICS
+from hardware.repository import REPOSITORIES
+
+
+#The column that identifies a row in each table, this is what gets patched when a write touches a row
+TABLE_KEYS = {table_name: repository.key_column for table_name, repository in REPOSITORIES.items() if repository.key_column}
+
+#HISTORY is append-only, so new rows are picked up by their rowid instead of by a key column
+APPEND_ONLY_TABLES = ("HISTORY",)
+
+#How many versions of changed row positions we remember for each table before anything built on top has to rebuild
+CHANGE_LOG_LENGTH = 50
+
+
+class TableCache:
+    def __init__(self, engine, layout=None):
+        self.engine = engine
+        self.layout = layout or load_layout()
+        self.lock = threading.RLock()
+        self.frames = {}
+        self.versions = {}
+        self.last_rowid = {}
+        self.change_log = {}
+        self.stats = {}
+
+    #Bumps one of the counters for a table, these show up in the sidebar so we can see the cache working
+    def count(self, table_name, counter, amount=1):
+        table_stats = self.stats.setdefault(table_name, {"hits": 0, "misses": 0, "patched rows": 0, "appended rows": 0, "reloads": 0})
+        table_stats[counter] += amount
+        METRICS.count(f"table_cache.{counter}", amount)
+
+    #Runs one of the table's repository reads (see repository.py) on a fresh connection and compacts what comes back
+    def read(self, table_name, method, *args):
+        with METRICS.timer(f"query.{table_name}.{method}"), self.engine.connect() as connection:
+            df = getattr(REPOSITORIES[table_name], method)(connection, *args)
+        return compact(table_name, df, self.layout)
+
+    #Returns the cached table, only going to the database if we have never loaded it (or it was invalidated)
+    def get(self, table_name):
+        with self.lock:
+            if table_name in self.frames:
+                self.count(table_name, "hits")
+                return self.frames[table_name]
+            self.count(table_name, "misses")
+            self.load(table_name)
+            return self.frames[table_name]
+
+    def load(self, table_name):
+        if table_name in APPEND_ONLY_TABLES:
+            df = self.read(table_name, "since", 0)
+            self.last_rowid[table_name] = int(df["_rowid"].max()) if not df.empty else 0
+            df = df.drop(columns="_rowid")
+        else:
+            df = self.read(table_name, "all")
+        self.store(table_name, df)
+        self.count(table_name, "reloads")
+
+    #Every new frame gets a new version number so anything built on top of a snapshot (indexes, views) knows when to rebuild
+    #changed is the list of row positions that are different from the last version, None means everything could have moved
+    def store(self, table_name, df, changed=None):
+        self.frames[table_name] = df
+        self.versions[table_name] = self.versions.get(table_name, 0) + 1
+        log = self.change_log.setdefault(table_name, [])
+        log.append((self.versions[table_name], changed))
+        del log[:-CHANGE_LOG_LENGTH]
+
+    def version(self, table_name):
+        with self.lock:
+            return self.versions.get(table_name, 0)
+
+    #Returns the frame and its version together so they always match
+    def snapshot(self, table_name):
+        with self.lock:
+            df = self.get(table_name)
+            return df, self.versions[table_name]
+
+    #Returns the row positions that changed after since_version up to until_version, or None if they can't be patched and need a rebuild
+    def changes_since(self, table_name, since_version, until_version):
+        with self.lock:
+            log = [entry for entry in self.change_log.get(table_name, []) if since_version < entry[0] <= until_version]
+            if since_version == 0 or len(log) != until_version - since_version:
+                return None
+            changed = set()
+            for _, positions in log:
+                if positions is None:
+                    return None
+                changed.update(positions)
+            return sorted(changed)
+
+    #How everything built on a table's snapshots (the search and lookup indexes, the connection graph) catches up with it.
+    #rebuild(df) is called when the rows that changed since since_version aren't known, otherwise update(df, positions) gets just those rows.
+    #Returns the version that was caught up to, call it while holding your own lock and keep the result as your since_version for next time.
+    def catch_up(self, table_name, since_version, rebuild, update):
+        df, version = self.snapshot(table_name)
+        if version == since_version:
+            return version
+        changed = self.changes_since(table_name, since_version, version)
+        if changed is None:
+            rebuild(df)
+        else:
+            update(df, changed)
+        return version
+
+    #Called after a write. Keys are the rows that were changed, if there aren't any we just drop the table and reload it next time.
+    def invalidate(self, table_name, keys=None):
+        with self.lock:
+            if table_name not in self.frames:
+                return
+            if table_name in APPEND_ONLY_TABLES:
+                self.append_new_rows(table_name)
+            elif keys is not None and table_name in TABLE_KEYS:
+                self.patch_rows(table_name, list(keys))
+            else:
+                del self.frames[table_name]
+
+    #Reads only the rows added since the last load and tacks them onto the end of the cached frame
+    def append_new_rows(self, table_name):
+        last_rowid = self.last_rowid.get(table_name, 0)
+        new_rows = self.read(table_name, "since", last_rowid)
+        if new_rows.empty:
+            return
+        self.last_rowid[table_name] = int(new_rows["_rowid"].max())
+        new_rows = new_rows.drop(columns="_rowid")
+        old, new_rows = align_categories(table_name, self.frames[table_name], new_rows)
+        old_length = len(old)
+        self.store(table_name, pd.concat([old, new_rows], ignore_index=True), changed=range(old_length, old_length + len(new_rows)))
+        self.count(table_name, "appended rows", len(new_rows))
+
+    #Re-reads only the changed rows and splices them in where the old ones were, so the table keeps its order.
+    #Rows that no longer exist in the database are dropped and brand new rows are added at the end.
+    def patch_rows(self, table_name, keys):
+        if not keys:
+            return
+        key_column = TABLE_KEYS[table_name]
+        fresh = self.read(table_name, "by_keys", keys)
+
+        old, fresh = align_categories(table_name, self.frames[table_name], fresh)
+        is_fresh = old[key_column].isin(fresh[key_column])
+        is_deleted = old[key_column].isin(keys) & ~is_fresh
+        patched = old[~is_deleted].copy()
+        replaced = patched[key_column].isin(fresh[key_column])
+        if replaced.any():
+            fresh_by_key = fresh.set_index(key_column, drop=False)
+            replaced_keys = patched.loc[replaced, key_column]
+            #Column by column so each one keeps its own dtype (categorical, datetime, text)
+            for column in fresh.columns:
+                patched.loc[replaced, column] = fresh_by_key.loc[replaced_keys, column].to_numpy()
+        added = fresh[~fresh[key_column].isin(old[key_column])]
+        #Deleted rows shift every position after them, so only a pure update/insert can be reported as a list of positions
+        if is_deleted.any():
+            changed = None
+        else:
+            changed = np.flatnonzero(replaced.to_numpy()).tolist() + list(range(len(patched), len(patched) + len(added)))
+        self.store(table_name, pd.concat([patched, added], ignore_index=True), changed=changed)
+        self.count(table_name, "patched rows", len(fresh))
+
+    #This is what the "Refresh data" button does, everything is thrown out and reloaded the next time it's needed
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.last_rowid.clear()
+
+    def stats_frame(self):
+        with self.lock:
+            rows = [{"TABLE": table_name, "VERSION": self.versions.get(table_name, 0), **table_stats} for table_name, table_stats in self.stats.items()]
+        return pd.DataFrame(rows)
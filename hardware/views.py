@@ -0,0 +1,83 @@
+#The frames the Devices and Components tabs show.
+#The newest-first copy of each table is sorted once per table version and shared by every session (nothing may change it in place!),
+#and each session keeps its last few filtered results keyed on (data version, locations, types, search term),
+#so a rerun that didn't change the data or the filters gets the same frame back without copying or masking anything.
+#Filters are combined as one boolean mask over the shared frame, and with no filters the shared frame itself is handed out.
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+#How many filtered results each session keeps per table
+VIEWS_PER_TABLE = 4
+
+
+#One of these is shared by every session
+class SortedFrames:
+    def __init__(self, sort_by="LAST EDIT"):
+        self.sort_by = sort_by
+        self.lock = threading.Lock()
+        self.frames = {}
+
+    #The table newest first and the version it was sorted from
+    def frame(self, table_cache, table_name):
+        df, version = table_cache.snapshot(table_name)
+        with self.lock:
+            cached = self.frames.get(table_name)
+            if cached is not None and cached[1] == version:
+                return cached
+        sorted_df = df.sort_values(by=self.sort_by, ascending=False)
+        with self.lock:
+            self.frames[table_name] = (sorted_df, version)
+        return sorted_df, version
+
+
+#locations and types are None for "All", positions are the rows the search matched (None without a search)
+def filter_rows(df, locations=None, types=None, positions=None):
+    if locations is None and types is None and positions is None:
+        return df
+    mask = np.ones(len(df), dtype=bool)
+    if locations is not None:
+        mask &= df["LOCATION"].isin(locations).to_numpy()
+    if types is not None:
+        mask &= df["TYPE"].isin(types).to_numpy()
+    if positions is not None:
+        mask &= df.index.isin(positions)
+    if mask.all():
+        return df
+    return df[mask]
+
+#Multiselects give "All" or a list, the key needs something hashable that doesn't care about the order things were picked in
+def selection_key(selected):
+    if selected is None or "All" in selected:
+        return None
+    return frozenset(selected)
+
+
+#One of these lives in each session's state
+class FilteredViews:
+    def __init__(self, views_per_table=VIEWS_PER_TABLE):
+        self.views_per_table = views_per_table
+        self.views = {}
+        self.hits = 0
+        self.misses = 0
+
+    #search(term) returns the matching row positions, it's only called when the result isn't already kept
+    def filtered(self, table_name, df, version, locations, types, search_term, search):
+        key = (version, selection_key(locations), selection_key(types), search_term or "")
+        table_views = self.views.setdefault(table_name, OrderedDict())
+        if key in table_views:
+            table_views.move_to_end(key)
+            self.hits += 1
+            return table_views[key]
+        self.misses += 1
+        #A new version means the kept views are out of date, let go of them so old frames don't stay in memory
+        for old_key in [old_key for old_key in table_views if old_key[0] != version]:
+            del table_views[old_key]
+        view = filter_rows(df, key[1], key[2], search(search_term) if search_term else None)
+        table_views[key] = view
+        while len(table_views) > self.views_per_table:
+            table_views.popitem(last=False)
+        return view
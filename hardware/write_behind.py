@@ -0,0 +1,126 @@
+#This is the background writer every save in the app goes through.
+#Script runs hand their writes to one writer thread and get a Future back instead of committing themselves.
+#The writer takes whatever writes have piled up (a burst of scanner edits, several people saving at once) and commits them together,
+#so a dozen saves cost one fsync instead of twelve. Each write runs in its own SAVEPOINT, so one that fails is rolled back on its own
+#and the rest of the group still commits. A write's Future only finishes once its group is committed, so a finished Future means the change is durable.
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import nullcontext
+
+from hardware.perf import METRICS
+
+
+#The most writes committed together, and how long the writer waits for more to arrive once it has one
+MAX_GROUP_SIZE = 64
+GROUP_WAIT_SECONDS = 0.005
+
+logger = logging.getLogger(__name__)
+
+
+class Write:
+    def __init__(self, command, after_commit=None):
+        self.command = command
+        self.after_commit = after_commit
+        self.future = Future()
+        self.result = None
+
+    #command is either a function that takes the connection, or a list of (statement, parameters) to run in order
+    def run(self, connection):
+        if callable(self.command):
+            return self.command(connection)
+        for statement, params in self.command:
+            connection.execute(statement, params)
+
+
+#One of these is shared by every session
+class WriteBehind:
+    def __init__(self, engine, write_queue=None, max_group_size=MAX_GROUP_SIZE, group_wait=GROUP_WAIT_SECONDS):
+        self.engine = engine
+        #The WriteQueue from connection_profile.py, so each group takes its turn with anything else that writes (like the bulk importer)
+        self.write_queue = write_queue
+        self.max_group_size = max_group_size
+        self.group_wait = group_wait
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stats = {"writes": 0, "groups": 0, "failed": 0, "largest_group": 0, "failed_hooks": 0}
+
+    #Queues a write and returns its Future, which gets the command's return value or its exception.
+    #after_commit(result) runs on the writer thread once the write is durable and before the Future finishes (the app uses it to refresh its caches).
+    #The write is committed either way, so a failing hook is logged with its traceback and counted but doesn't fail the Future.
+    def submit(self, command, after_commit=None):
+        write = Write(command, after_commit)
+        self.start()
+        self.pending.put(write)
+        return write.future
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="write-behind", daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            group = [self.pending.get()]
+            deadline = time.perf_counter() + self.group_wait
+            while len(group) < self.max_group_size:
+                try:
+                    group.append(self.pending.get(timeout=max(deadline - time.perf_counter(), 0)))
+                except queue.Empty:
+                    break
+            self.commit_group(group)
+
+    def commit_group(self, group):
+        succeeded = []
+        try:
+            with METRICS.timer("writes.commit_group"), self.write_queue or nullcontext():
+                #AUTOCOMMIT hands transaction control to us, so the BEGIN, SAVEPOINTs and COMMIT below are exactly what SQLite runs
+                with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                    connection.exec_driver_sql("BEGIN IMMEDIATE;")
+                    try:
+                        for write in group:
+                            connection.exec_driver_sql("SAVEPOINT group_write;")
+                            try:
+                                write.result = write.run(connection)
+                            except Exception as e:
+                                connection.exec_driver_sql("ROLLBACK TO group_write;")
+                                connection.exec_driver_sql("RELEASE group_write;")
+                                write.future.set_exception(e)
+                                self.stats["failed"] += 1
+                                continue
+                            connection.exec_driver_sql("RELEASE group_write;")
+                            succeeded.append(write)
+                        connection.exec_driver_sql("COMMIT;")
+                    except BaseException:
+                        connection.exec_driver_sql("ROLLBACK;")
+                        raise
+        except Exception as e:
+            #The group couldn't be committed (like the disk being full or the database staying locked), so none of it happened
+            for write in group:
+                if not write.future.done():
+                    write.future.set_exception(e)
+                    self.stats["failed"] += 1
+            return
+
+        self.stats["writes"] += len(succeeded)
+        self.stats["groups"] += 1
+        self.stats["largest_group"] = max(self.stats["largest_group"], len(group))
+        METRICS.count("writes.committed", len(succeeded))
+        for write in succeeded:
+            if write.after_commit:
+                try:
+                    write.after_commit(write.result)
+                except Exception:
+                    logger.exception("After-commit hook failed for a committed write")
+                    self.stats["failed_hooks"] += 1
+                    METRICS.count("writes.failed_hooks")
+            write.future.set_result(write.result)
+
+    #Waits until everything submitted so far is committed, for scripts and tests
+    def flush(self, timeout=None):
+        return self.submit([]).result(timeout)
@@ -1,9 +1,7 @@
 #Unfortunately, due to how streamlit works, you must only use single line comments
 #Multiline comments are rendered as markdown in the program itself
 
-# To do before launch:
-# Change all image columns from BLOB format to text
-# Add IS_STORAGE to locations table in db
+#Schema changes (like IMAGE as TEXT and IS_STORAGE on LOCATIONS) live in hardware/migrations.py and run automatically at startup
 
 import streamlit as st
 import os
@@ -11,11 +9,34 @@ import sqlite3
 import pandas as pd
 import datetime
 from io import BytesIO
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import pandas as pd
-from PIL import Image
-from sqlalchemy import text
-import exifread
-from zipfile import ZipFile
+from sqlalchemy.exc import DBAPIError
+from hardware.table_cache import TableCache
+from hardware.compact import plain_values
+from hardware.search_index import SearchIndex
+from hardware.lookup_index import LookupIndex
+from hardware.connection_graph import ConnectionGraph, ORPHAN, MISMATCH
+from hardware.dropdowns import DropdownCache
+from hardware.views import SortedFrames, FilteredViews
+from hardware import history_store
+from hardware.migrations import migrate
+from hardware.cascade import cascade_location
+from hardware.bulk_import import import_assets, template_csv
+from hardware.photo_export import PhotoArchive
+from hardware.reports import ReportCache
+from hardware.exports import csv_bytes, pdf_bytes
+from hardware.overview import overview_metrics
+from hardware.integrity import IntegrityScanner
+from hardware.locations import ImageFolder, location_summary, location_page, page_count
+from hardware.connection_profile import load_profile, apply_profile, WriteQueue
+from hardware.write_behind import WriteBehind
+from hardware.repository import DEVICES, COMPONENTS, LOCATIONS, DEVICE_TYPES, COMPONENT_TYPES, HISTORY
+from hardware.images import open_upright, save_renditions, rendition_path, ORIGINAL_QUALITY
+from hardware.perf import METRICS, RERUNS_KEPT as PERFORMANCE_RERUNS_KEPT
+
+#Everything timed from here to the bottom of the script is this rerun's breakdown on the Performance tab (only when POS_PERF=1)
+METRICS.start_rerun()
 
 
 date = datetime.datetime.now()
@@ -155,7 +176,80 @@ absolute_path = os.path.dirname(__file__)
 conn = st.connection(name="connection", type="sql", url="sqlite:///" + os.path.join(absolute_path, database_file))
 images_path = os.path.join(absolute_path, "images")
 
+#WAL, busy_timeout and the rest of the SQLite settings (hardware/connection_profile.py), set on every connection the app opens
+@st.cache_resource
+def configure_connection():
+    profile = load_profile()
+    apply_profile(conn.engine, profile)
+    return profile
+
+sqlite_profile = configure_connection()
+
+#Every write takes its turn through this queue, so two people saving at once never fight over the database lock
+@st.cache_resource
+def get_write_queue():
+    return WriteQueue()
+
+#Every save is handed to the background writer (hardware/write_behind.py), which commits bursts of saves from everyone together
+@st.cache_resource
+def get_write_behind():
+    return WriteBehind(conn.engine, get_write_queue())
+
+#How long a save waits for its commit before the page carries on without it, the toast then shows up on a later rerun
+WRITE_WAIT_SECONDS = 5
+
+#If patching the cache after a commit fails the whole table cache is dropped, so nobody keeps seeing the old rows (the writer logs the error)
+def refresh_after_write(result, changes):
+    try:
+        refresh_data(changes(result) if callable(changes) else changes)
+    except Exception:
+        table_cache.clear()
+        raise
+
+#command is a list of (query, parameters) or a function that takes the connection.
+#changes is what gets refreshed once it's committed, or a function that works it out from what the command returned.
+def submit_write(command, changes):
+    return get_write_behind().submit(command, after_commit=lambda result: refresh_after_write(result, changes))
+
+#Waits for a save to be durable and toasts it, returns False if it's still going (the error is raised if it failed)
+def wait_for_write(write, saved_message):
+    try:
+        with METRICS.timer("writes.wait"):
+            write.result(timeout=WRITE_WAIT_SECONDS)
+    except FutureTimeoutError:
+        st.session_state.setdefault("pending_writes", []).append((write, saved_message))
+        st.toast("Still saving, you'll get a notification when it's done.", icon="⏳")
+        return False
+    st.toast(saved_message, icon="💾")
+    return True
+
+#Toasts (or reports) any saves from earlier reruns that have finished since
+def announce_pending_writes():
+    still_pending = []
+    for write, saved_message in st.session_state.get("pending_writes", []):
+        if not write.done():
+            still_pending.append((write, saved_message))
+        elif write.exception():
+            st.error(f"A save didn't go through: {write.exception()}")
+        else:
+            st.toast(saved_message, icon="💾")
+    st.session_state.pending_writes = still_pending
+
+announce_pending_writes()
+
+#Brings the database schema up to date, this only runs once per server start
+@st.cache_resource
+def run_migrations():
+    applied_migrations = migrate(os.path.join(absolute_path, database_file))
+    for applied_migration in applied_migrations:
+        print(f"Applied database migration {applied_migration}")
+    return applied_migrations
+
+run_migrations()
+
 #This function is for everytime an image is uploaded or changed, it controls the quality, metedata and format.
+#It also saves the smaller renditions (thumbnail and preview) that the pages show, see hardware/images.py for the quality ladder.
+@METRICS.timed("images.process_and_save")
 def process_and_save_image(image_upload, sn):
     images_folder = "images"
     timestamp = str(datetime.datetime.now().strftime('%Y-%m-%d'))
@@ -166,56 +260,107 @@ def process_and_save_image(image_upload, sn):
     image_path = os.path.join(images_folder, f"{sn}_{timestamp}.jpg")
 
     try:
-        #Read image bytes into memory for EXIF processing
-        image_bytes = image_upload.getvalue()  
-        with BytesIO(image_bytes) as f:
-            tags = exifread.process_file(f, details=False)
-
-        #Check for EXIF Orientation tag
-        if "Image Orientation" in tags:
-            orientation = tags["Image Orientation"].printable
-            if orientation == "Rotated 90 CW":
-                image = Image.open(BytesIO(image_bytes)).rotate(270, expand=True)
-            elif orientation == "Rotated 180 CW":
-                image = Image.open(BytesIO(image_bytes)).rotate(180)
-            elif orientation == "Rotated 270 CW":
-                image = Image.open(BytesIO(image_bytes)).rotate(90, expand=True)
-            else:  #Other orientations or no orientation tag
-                image = Image.open(BytesIO(image_bytes))
-        else:
-            image = Image.open(BytesIO(image_bytes))
+        #Decode the upload once and turn it upright using its EXIF orientation (phones love to save photos sideways)
+        image, _ = open_upright(BytesIO(image_upload.getvalue()))
 
         if original_extension not in (".jpg", ".jpeg"):
             image = image.convert('RGB')
 
-        image.save(image_path, format='JPEG', quality=100)
+        image.save(image_path, format='JPEG', quality=ORIGINAL_QUALITY)
+        save_renditions(image, images_folder, os.path.basename(image_path))
         return os.path.basename(image_path)
 
     except Exception as e:  #Catch any errors
         st.error(f"Error processing image: {e}")
         return None
 
-#This function is called almost every single time that anything is updated or changed (or the refresh data button is pressed).
-def refresh_data():
-    st.cache_data.clear()
+#This is the one table cache shared by every session, it's only created once per server
+@st.cache_resource
+def get_table_cache():
+    return TableCache(conn.engine)
 
-#This is all of the tables in my database and the function that calls them to be saved in the application cache
-#It may need to be reworked in the future if the data becomes too big and the application slows as a result
-@st.cache_data
-def fetch_data(table_name):
-    query = f"SELECT * FROM {table_name};"
-    result = conn.query(query)
-    return result
-@st.cache_data
-def get_serial_number(friendly_name):
-    device_row = df_devices[df_devices['FRIENDLY NAME'] == friendly_name]
-    if not device_row.empty:
-        return device_row.iloc[0]['S/N']
-    else:
-        return None
+table_cache = get_table_cache()
 
-df_devices = fetch_data("DEVICES").sort_values(by='LAST EDIT', ascending=False)
-df_components = fetch_data("COMPONENTS").sort_values(by='LAST EDIT', ascending=False)
+#This function is called almost every single time that anything is updated or changed (or the refresh data button is pressed).
+#Writes pass in the tables and rows they touched, e.g. {"DEVICES": [serial], "HISTORY": None}, so only those rows get re-read.
+#Without any changes (the refresh button) everything is thrown out.
+def refresh_data(changes=None):
+    if changes is None:
+        table_cache.clear()
+        st.cache_data.clear()
+        return
+    for table_name, keys in changes.items():
+        table_cache.invalidate(table_name, keys)
+
+#This is all of the tables in my database and the function that calls them from the table cache
+#The frames are shared with every other session, so never change them in place!
+def fetch_data(table_name):
+    with METRICS.timer("fetch_data"):
+        return table_cache.get(table_name)
+
+#The search bars use one shared index per table, it is built once and then only the changed rows are re-indexed
+@st.cache_resource
+def get_search_index(table_name, columns=None):
+    return SearchIndex(table_name, columns)
+
+#Sets up the full-text search table for HISTORY once per server, False means this SQLite can't do it
+@st.cache_resource
+def history_fts_ready():
+    return history_store.ensure_history_fts(conn.engine)
+
+#Returns the positions (index labels) of the rows with any cell containing the search term (case-insensitive)
+def search_positions(table_name, search_term, columns=None):
+    with METRICS.timer(f"search.{table_name}"):
+        search_index = get_search_index(table_name, columns)
+        search_index.sync(table_cache)
+        return search_index.search(search_term)
+
+#Returns the rows of df that match the search term, df has to come from fetch_data(table_name)
+def search_rows(df, table_name, search_term, columns=None):
+    return df[df.index.isin(search_positions(table_name, search_term, columns))]
+
+#The newest-first tables, sorted once per change and shared by every session
+@st.cache_resource
+def get_sorted_frames():
+    return SortedFrames()
+
+#Each session keeps its last few filtered Devices and Components tables, so a rerun with the same filters doesn't filter again
+def filtered_views():
+    if "filtered_views" not in st.session_state:
+        st.session_state.filtered_views = FilteredViews()
+    return st.session_state.filtered_views
+
+#Serial, friendly name, dropdown label and connection lookups for DEVICES and COMPONENTS, shared by every session and patched after each write
+@st.cache_resource
+def get_lookup_index(table_name):
+    return LookupIndex(table_name)
+
+def lookup_index(table_name):
+    index = get_lookup_index(table_name)
+    index.sync(table_cache)
+    return index
+
+#Selectbox options and labels, kept until the data (or for labels, the filtered rows) change
+@st.cache_resource
+def get_dropdown_cache():
+    return DropdownCache()
+
+dropdowns = get_dropdown_cache()
+
+#Which components are connected to which device, plus the orphaned and out-of-place ones, see hardware/connection_graph.py
+@st.cache_resource
+def get_connection_graph():
+    return ConnectionGraph()
+
+def connection_graph():
+    graph = get_connection_graph()
+    graph.sync(table_cache)
+    return graph
+
+#These are shared with every other session too, never change them in place!
+with METRICS.timer("fetch_data"):
+    df_devices, devices_version = get_sorted_frames().frame(table_cache, "DEVICES")
+    df_components, components_version = get_sorted_frames().frame(table_cache, "COMPONENTS")
 df_history = fetch_data("HISTORY")
 df_locations = fetch_data("LOCATIONS")
 df_device_types = fetch_data("DEVICE_TYPES")
@@ -232,10 +377,15 @@ st.sidebar.title("Actions")
 if st.sidebar.button("Refresh data"):
     refresh_data()
 
+with st.sidebar.expander("Cache stats"):
+    st.dataframe(table_cache.stats_frame(), use_container_width=True, hide_index=True)
+    st.caption("SQLite: " + ", ".join(f"{name}={value}" for name, value in sqlite_profile.items()))
+
 existing_locations = list(df_locations['LOCATION'].unique())
 existing_devices = [name for name in df_devices['FRIENDLY NAME'].unique() if name is not None and name.strip() != ""]
-existing_device_sn = [name for name in df_devices['S/N'].unique() if name is not None and name.strip() != ""]
-existing_component_sn = [name for name in df_components['S/N'].unique() if name is not None and name.strip() != ""]
+device_lookup = lookup_index("DEVICES")
+component_lookup = lookup_index("COMPONENTS")
+device_graph = connection_graph()
 existing_device_types = list(df_device_types['DEVICE_TYPE'].unique())
 existing_component_types = list(df_component_types['COMPONENT_TYPE'].unique())
 
@@ -312,10 +462,20 @@ with st.sidebar.expander("**Add Component Type**"):
         #Submit button
         add_component_type_submit = st.form_submit_button("Add Component Type")
 
+with st.sidebar.expander("**Bulk Import**"):
+    bulk_import_table = st.radio("Import", ["DEVICES", "COMPONENTS"], format_func=str.title, horizontal=True)
+    st.download_button("Download a blank template", data=template_csv(bulk_import_table), file_name=f"{bulk_import_table.title()} Import Template.csv", key="download_import_template")
+    with st.form("Bulk Import"):
+        st.caption("One row per asset. S/N, POS, LOCATION and TYPE are required, and the locations and types have to exist already.")
+        bulk_import_upload = st.file_uploader("Upload a shipment", type=["csv", "xlsx"])
+
+        #Submit button
+        bulk_import_submit = st.form_submit_button("Import")
+
 #All of the functions for submitting sidebar form data
 if add_device_submit:
     #Validate and process the form data
-    if device_sn and device_pos and device_location and device_type and not (device_sn in existing_device_sn):
+    if device_sn and device_pos and device_location and device_type and not device_lookup.has_serial(device_sn):
         if add_device_notes == "None" or "":
             add_device_notes = None
 
@@ -327,19 +487,17 @@ if add_device_submit:
 
             #Get the current timestamp
             timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            insert_query = text("INSERT INTO DEVICES (`S/N`, POS, LOCATION, `TYPE`, `FRIENDLY NAME`, NOTES, IMAGE, `LAST EDIT`) VALUES (:a, :b, :c, :d, :e, :f, :g, :h);")
-            insert_history_query = text("INSERT INTO HISTORY ('CHANGE TIME', 'DEVICE S/N', 'NEW LOCATION', 'NEW FRIENDLY NAME', 'NEW NOTES', 'NEW PHOTO', 'CHANGE LOG') VALUES (:a, :b, :c, :d, :e, :f, :g);")
-            with conn.session as session:
-                session.execute(insert_query, {"a": device_sn, "b": device_pos, "c": device_location, "d": device_type, "e": device_friendly_name, "f": add_device_notes, "g": device_image_filename, "h": timestamp})
-                session.execute(insert_history_query, {"a": timestamp, "b": device_sn, "c": device_location, "d": device_friendly_name, "e": add_device_notes, "f": device_image_filename, "g": "NEW DEVICE"})
-                session.commit()
-            st.success(f"A new {device_type} ({device_friendly_name}) was added successfully to {device_location}!")
-            refresh_data()
-
-        except sqlite3.IntegrityError as e:
+            new_device_write = submit_write([
+                DEVICES.insert({"S/N": device_sn, "POS": device_pos, "LOCATION": device_location, "TYPE": device_type, "FRIENDLY NAME": device_friendly_name, "NOTES": add_device_notes, "IMAGE": device_image_filename, "LAST EDIT": timestamp}),
+                HISTORY.record(timestamp, "NEW DEVICE", {"DEVICE S/N": device_sn, "NEW LOCATION": device_location, "NEW FRIENDLY NAME": device_friendly_name, "NEW NOTES": add_device_notes, "NEW PHOTO": device_image_filename}),
+            ], {"DEVICES": [device_sn], "HISTORY": None})
+            if wait_for_write(new_device_write, f"{device_sn} saved"):
+                st.success(f"A new {device_type} ({device_friendly_name}) was added successfully to {device_location}!")
+
+        except (sqlite3.Error, DBAPIError) as e:
             st.error(f"Error adding new device: {e}")
             
-    elif device_sn in existing_device_sn:
+    elif device_lookup.has_serial(device_sn):
         st.toast(f"Uh oh! Looks like {device_sn} already exists." , icon="🤔")
         st.toast("Try searching for it on the device page.", icon="🥹")
     else:
@@ -347,7 +505,7 @@ if add_device_submit:
         
 if add_component_submit:
     #Validate and process the form data
-    if component_sn and component_pos and component_location and component_type and not (component_sn in existing_component_sn):
+    if component_sn and component_pos and component_location and component_type and not component_lookup.has_serial(component_sn):
         if add_component_notes == "None" or "":
             add_component_notes = None
         try:
@@ -358,25 +516,18 @@ if add_component_submit:
 
             #Get the current timestamp
             timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            insert_query = text("INSERT INTO COMPONENTS (POS, `TYPE`, `S/N`, LOCATION, CONNECTED, NOTES, IMAGE, `LAST EDIT`) VALUES (:a, :b, :c, :d, :e, :f, :g, :h);")
-            insert_history_query = text("INSERT INTO HISTORY ('CHANGE TIME', 'DEVICE S/N', 'NEW LOCATION', 'NEW CONNECTION', 'NEW NOTES', 'NEW PHOTO', 'CHANGE LOG') VALUES (:a, :b, :c, :d, :e, :f, :g);")
-
-            #Execute the query
-            with conn.session as session:
-                session.execute(insert_query, {"a": component_pos, "b": component_type, "c": component_sn, "d": component_location, "e": get_serial_number(component_connected), "f": add_component_notes, "g": component_image_filename, "h": timestamp})
-                session.execute(insert_history_query, {"a": timestamp, "b": component_sn, "c": component_location, "d": get_serial_number(component_connected), "e": add_component_notes, "f": component_image_filename, "g": "NEW COMPONENT"})
-                session.commit()
-                        
-            st.success(f"A new {component_type} ({component_sn}) was added successfully to {component_location}!")
-
-            #Refresh the data in the app
-            print("New Component Added")
-            print("Beginning Data Refresh")
-            refresh_data()
-
-        except sqlite3.Error as e:
+            #Execute the query, the app's data is refreshed as soon as it's committed
+            new_component_write = submit_write([
+                COMPONENTS.insert({"POS": component_pos, "TYPE": component_type, "S/N": component_sn, "LOCATION": component_location, "CONNECTED": device_lookup.serial_for_name(component_connected), "NOTES": add_component_notes, "IMAGE": component_image_filename, "LAST EDIT": timestamp}),
+                HISTORY.record(timestamp, "NEW COMPONENT", {"DEVICE S/N": component_sn, "NEW LOCATION": component_location, "NEW CONNECTION": device_lookup.serial_for_name(component_connected), "NEW NOTES": add_component_notes, "NEW PHOTO": component_image_filename}),
+            ], {"COMPONENTS": [component_sn], "HISTORY": None})
+            if wait_for_write(new_component_write, f"{component_sn} saved"):
+                st.success(f"A new {component_type} ({component_sn}) was added successfully to {component_location}!")
+                print("New Component Added")
+
+        except (sqlite3.Error, DBAPIError) as e:
             st.error(f"Error adding new component: {e}")
-    elif component_sn in existing_component_sn:
+    elif component_lookup.has_serial(component_sn):
         st.toast(f"{component_sn} is already in the db...", icon="😅")
         st.toast("Try searching for it on the component page!", icon="🙄")
     else:
@@ -395,26 +546,15 @@ if add_location_submit:
             timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
             #Execute the query
-            insert_query = text("INSERT INTO LOCATIONS (LOCATION, IMAGE, IS_STORAGE) VALUES (:a, :b, :c);")
-            insert_history_query = text("INSERT INTO HISTORY ('CHANGE TIME', 'NEW LOCATION', 'NEW PHOTO', 'CHANGE LOG') VALUES (:a, :b, :c, :d);")
-
-            with conn.session as session:
-                session.execute(insert_query, {"a": location_name, "b": location_image_filename, "c": storage_check})
-                if storage_check == False:  
-                    session.execute(insert_history_query, {"a": timestamp, "b": location_name, "c": location_image_filename, "d": "NEW LOCATION"})
-                    session.commit()
-                else:
-                    session.execute(insert_history_query, {"a": timestamp, "b": location_name, "c": location_image_filename, "d": "NEW STORAGE LOCATION"})
-                    session.commit()
-
-            st.success(f"{location_name} has been created as a new location!")
-
-            #Refresh the data in the app
-            print("New Location Added")
-            print("Beginning Data Refresh")
-            refresh_data()
-
-        except sqlite3.Error as e:
+            new_location_write = submit_write([
+                LOCATIONS.insert({"LOCATION": location_name, "IMAGE": location_image_filename, "IS_STORAGE": storage_check}),
+                HISTORY.record(timestamp, "NEW STORAGE LOCATION" if storage_check else "NEW LOCATION", {"NEW LOCATION": location_name, "NEW PHOTO": location_image_filename}),
+            ], {"LOCATIONS": [location_name], "HISTORY": None})
+            if wait_for_write(new_location_write, f"{location_name} saved"):
+                st.success(f"{location_name} has been created as a new location!")
+                print("New Location Added")
+
+        except (sqlite3.Error, DBAPIError) as e:
             st.sidebar.error(f"Error adding new location: {e}")
     elif location_name in existing_locations:
         st.toast(f"{location_name} is already a location!", icon="🔥")
@@ -434,24 +574,18 @@ if add_device_type_submit:
             timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
             #Execute the query
-            insert_query = text("INSERT INTO 'DEVICE_TYPES' (DEVICE_TYPE, IMAGE) VALUES (:a, :b);")
-            insert_history_query = text("INSERT INTO HISTORY ('CHANGE TIME', 'NEW PHOTO', 'CHANGE LOG') VALUES (:a, :b, :c);")
             change_log_text = f"NEW DEVICE TYPE: {device_type_name}"
 
             
-            with conn.session as session:
-                session.execute(insert_query, {"a": device_type_name, "b": device_type_image_filename})
-                session.execute(insert_history_query, {"a": timestamp, "b": device_type_image_filename, "c": change_log_text})
-                session.commit()
-
-            st.success(f"{device_type_name} has been created as a new device type!")
-
-            #Refresh the data in the app
-            print("New Device Type Added!")
-            print("Beginning Data Refresh")
-            refresh_data()
-
-        except sqlite3.Error as e:
+            new_device_type_write = submit_write([
+                DEVICE_TYPES.insert({"DEVICE_TYPE": device_type_name, "IMAGE": device_type_image_filename}),
+                HISTORY.record(timestamp, change_log_text, {"NEW PHOTO": device_type_image_filename}),
+            ], {"DEVICE_TYPES": [device_type_name], "HISTORY": None})
+            if wait_for_write(new_device_type_write, f"{device_type_name} saved"):
+                st.success(f"{device_type_name} has been created as a new device type!")
+                print("New Device Type Added!")
+
+        except (sqlite3.Error, DBAPIError) as e:
             st.sidebar.error(f"Error adding new device type: {e}")
     elif device_type_name in existing_device_types:
         st.toast(f"What are you doing? {device_type} is already a device.", icon="🤷")
@@ -472,75 +606,71 @@ if add_component_type_submit:
             timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
             #Execute the query
-            insert_query = text("INSERT INTO 'COMPONENT_TYPES' (COMPONENT_TYPE, IMAGE) VALUES (:a, :b);")
-            insert_history_query = text("INSERT INTO HISTORY ('CHANGE TIME', 'NEW PHOTO', 'CHANGE LOG') VALUES (:a, :b, :c);")
             change_log_text = f"NEW COMPONENT TYPE: {component_type_name}"
 
             
-            with conn.session as session:
-                session.execute(insert_query, {"a": component_type_name, "b": component_type_image_filename})
-                session.execute(insert_history_query, {"a": timestamp, "b": component_type_image_filename, "c": change_log_text})
-                session.commit()
-
-            st.success(f"{component_type_name} has been created as a new component type!")
-
-            #Refresh the data in the app
-            print("New Component Type Added!")
-            print("Beginning Data Refresh")
-            refresh_data()
-
-        except sqlite3.Error as e:
+            new_component_type_write = submit_write([
+                COMPONENT_TYPES.insert({"COMPONENT_TYPE": component_type_name, "IMAGE": component_type_image_filename}),
+                HISTORY.record(timestamp, change_log_text, {"NEW PHOTO": component_type_image_filename}),
+            ], {"COMPONENT_TYPES": [component_type_name], "HISTORY": None})
+            if wait_for_write(new_component_type_write, f"{component_type_name} saved"):
+                st.success(f"{component_type_name} has been created as a new component type!")
+                print("New Component Type Added!")
+
+        except (sqlite3.Error, DBAPIError) as e:
             st.sidebar.error(f"Error adding new component type: {e}")
     elif component_type_name in existing_component_types:
         st.toast(f"I literally just saw {component_type_name} on the components page", icon="🤔")
     else:
         st.warning("Please enter the type of component you need to record.")
 
+if bulk_import_submit:
+    if bulk_import_upload:
+        with st.spinner(f"Importing {bulk_import_upload.name}..."):
+            imported_serials, import_errors = import_assets(conn.engine, bulk_import_upload, bulk_import_upload.name, bulk_import_table, write_queue=get_write_queue())
+        if imported_serials:
+            st.success(f"{len(imported_serials)} {bulk_import_table.lower()} were imported from {bulk_import_upload.name}!")
+            #Patching thousands of rows one by one is slower than just reloading the table
+            refresh_data({bulk_import_table: imported_serials if len(imported_serials) <= 500 else None, "HISTORY": None})
+        if not import_errors.empty:
+            st.warning(f"{len(import_errors)} rows could not be imported, fix them and upload just those rows again.")
+            st.dataframe(import_errors, use_container_width=True, hide_index=True)
+            st.download_button("Download the rows that failed", data=import_errors.to_csv(index=False).encode("utf-8"), file_name=f"{today} Import Errors.csv", key="download_import_errors")
+    else:
+        st.warning("Please upload a .csv or .xlsx file to import.")
+
 
 #I was told by some people to put this here, it's true.
 #Although I do use this software for work because it makes my job easier, I made it for myself (it was previously just an excel sheet named: "RELATIONAL DATABASE") 🥹 
 st.sidebar.markdown("##### [This software was created independently by Andrew Gibson outside of work hours.](https://github.com/JAndrewGibson/inventory_management)")
 
 #This function is called when "Apply location changes to the connected components" check box is selected and the data is input.
-#It loops over all of the connected components in the db and updates their location.
-def apply_connected_changes(selected_device_serial):
-    #Query to return a list of connected component's serial numbers
-    connected_components_to_change = df_components[df_components['CONNECTED'] == selected_device_serial]['S/N'].unique()
-    for serial in connected_components_to_change:
-        try:
-            #Fetch the current values before the update
-            fetch_old_values_query = "SELECT POS, LOCATION, CONNECTED, NOTES, IMAGE FROM COMPONENTS WHERE `S/N` = :a;"
-            old_values = conn.query(fetch_old_values_query, params={"a": serial})
-            timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-            #Update the data in the SQL database
-            update_query = text(f"UPDATE COMPONENTS SET LOCATION = :a, `LAST EDIT` = :b WHERE `S/N` = :c;")
-                #Insert the old values into the HISTORY table
-            insert_history_query = text("INSERT INTO HISTORY ('CHANGE TIME', 'DEVICE S/N', 'PREVIOUS LOCATION', 'PREVIOUS CONNECTION', 'PREVIOUS NOTES', 'PREVIOUS PHOTO', 'NEW LOCATION', 'NEW CONNECTION', 'NEW NOTES', 'NEW PHOTO', 'CHANGE LOG') VALUES (:a, :b, :c, :d, :e, :f, :g, :h, :i, :j, :k);")
-            with conn.session as session:
-                session.execute(update_query, {"a": location, "b": timestamp, "c": serial})
-                session.execute(insert_history_query, {"a": timestamp, "b": serial, "c": old_values.iat[0, 1], "d": old_values.iat[0, 2], "e": old_values.iat[0, 3], "f": old_values.iat[0, 4], "g": location, "h": old_values.iat[0, 2], "i": old_values.iat[0, 3], "j":  old_values.iat[0, 4], "k": "COMPONENT UPDATE FROM CONNECTED DEVICE"})
-                session.commit()
-        except sqlite3.Error as e:
-                st.error(f"Error updating data: {e}")
-
-    st.toast(f"Connected components ({connected_components_to_change}) saved successfully!", icon="🙌")
+#It moves all of the connected components in the same write (and transaction) as the device update, so they all save together or not at all.
+def apply_connected_changes(connection, selected_device_serial, new_location, timestamp):
+    return cascade_location(connection, selected_device_serial, new_location, timestamp)
     
 
 #This defines each of my tabs at the top of the screen
 overview, devices, components, locations, history, reports = st.columns(6)
-overview, devices, components, locations, history, reports = st.tabs(["Overview", "Devices", "Components", "Locations", "History", "Reports"])
+#The Performance tab is only there when the instrumentation is turned on (POS_PERF=1)
+overview, devices, components, locations, history, reports, *admin_tabs = st.tabs(["Overview", "Devices", "Components", "Locations", "History", "Reports"] + (["Performance"] if METRICS.enabled else []))
 
 #The next six 'with' statements are for each of the tabs and their functions. 
 
+#The issue scan is shared by every session so each scan only has to recheck what changed since the last one
+@st.cache_resource
+def get_integrity_scanner():
+    return IntegrityScanner()
+
 with overview:
     col1, col2 = st.columns(2)
     col1.subheader('Overview')
     
+    #All of the counts come from SQLite's running totals (hardware/overview.py) instead of scanning the tables
+    metrics = overview_metrics(conn.engine)
+
     #This is my counter logic and rephrasing for how many changes in the last 24 hours
-    df_history['CHANGE TIME'] = pd.to_datetime(df_history['CHANGE TIME'])
-    twenty_four_hours_ago = datetime.datetime.now() - datetime.timedelta(hours=24)
-    changes_last_24_hours = df_history[df_history['CHANGE TIME'] >= twenty_four_hours_ago].shape[0]
+    changes_last_24_hours = metrics["changes_last_24_hours"]
     if changes_last_24_hours == 1:
         changes_sentence = "There has only been one change"
     elif changes_last_24_hours > 1:
@@ -549,18 +679,14 @@ with overview:
         changes_sentence = "Looking good! There have not been any changes"
     
     #Defining all of my device counts
-    #This needs to be changed in the future to remove the hardcoded 'storage' locations
-    total_devices = df_devices["S/N"].count()
-    total_components = df_components["S/N"].count()
-    wasted_devices = df_devices[df_devices['LOCATION'] == 'E-WASTED']['LOCATION'].count()
-    wasted_components = df_components[df_components['LOCATION'] == 'E-WASTED']['LOCATION'].count()
-    devices_without_photo = df_devices['IMAGE'].isnull().sum()
-    components_without_photo = df_components['IMAGE'].isnull().sum()
-    storage_locations = df_locations[df_locations['IS_STORAGE'] == True]['LOCATION'].tolist()
-    devices_in_storage = df_devices[df_devices['LOCATION'].isin(storage_locations)]
-    components_in_storage = df_components[df_components['LOCATION'].isin(storage_locations)]
-    stored_assets = devices_in_storage.shape[0] + components_in_storage.shape[0]
-    unknown_assets = df_devices[df_devices['LOCATION'] == 'UNKNOWN']['LOCATION'].count() + (df_components[df_components['LOCATION'] == 'UNKNOWN']['LOCATION'].count())    
+    total_devices = metrics["total_devices"]
+    total_components = metrics["total_components"]
+    wasted_devices = metrics["wasted_devices"]
+    wasted_components = metrics["wasted_components"]
+    devices_without_photo = metrics["devices_without_photo"]
+    components_without_photo = metrics["components_without_photo"]
+    stored_assets = metrics["stored_assets"]
+    unknown_assets = metrics["unknown_assets"]
         
     #Display the overview paragraph
     col1.write(f'''
@@ -574,6 +700,19 @@ with overview:
             Got ideas for what should be displayed on this page? [Tell Andrew!](https://github.com/JAndrewGibson)
             ''')
 
+    #The potential issues scan, see hardware/integrity.py
+    col2.subheader("Potential Issues")
+    integrity_scanner = get_integrity_scanner()
+    full_scan = col2.checkbox("Recheck everything", help="Normally only assets edited since the last scan are rechecked", key="full_integrity_scan")
+    if col2.button("Flag potential issues"):
+        issues_found = integrity_scanner.scan(conn.engine, images_path, full=full_scan)
+        if issues_found.empty:
+            col2.success("No issues found!")
+        else:
+            for issue_name, issue_rows in issues_found.groupby("ISSUE", sort=False):
+                with col2.expander(f"{issue_name} ({len(issue_rows)})"):
+                    st.dataframe(issue_rows.drop(columns="ISSUE"), use_container_width=True, hide_index=True)
+
 with devices:
     #Two columns for this page as well!
     col1, col2 = st.columns(2)
@@ -588,14 +727,9 @@ with devices:
     search_device = col1.text_input("Search for a device", "")
 
     #Filtering logic for filtering the table by location, device type and search term
-    #All is selected by default
-    filtered_devices = df_devices.copy()
-    if "All" not in selected_device_locations:
-        filtered_devices = filtered_devices[filtered_devices['LOCATION'].isin(selected_device_locations)]
-    if "All" not in selected_types:
-        filtered_devices = filtered_devices[filtered_devices['TYPE'].isin(selected_types)]
-    if search_device:
-        filtered_devices = filtered_devices[filtered_devices.apply(lambda row: any(row.astype(str).str.contains(search_device, case=False)), axis=1)]
+    #All is selected by default, and the result is kept for this session until the data or the filters change
+    with METRICS.timer("filter.devices"):
+        filtered_devices = filtered_views().filtered("DEVICES", df_devices, devices_version, selected_device_locations, selected_types, search_device, lambda term: search_positions("DEVICES", term))
 
     #The Dataframe display for the filtered results
     if not filtered_devices.empty:
@@ -604,31 +738,31 @@ with devices:
         #Here is the second column for actually editing the device
         col2.subheader('Edit Device')
         #Dropdown to select a device from the filtered list
-        available_devices = filtered_devices.apply(
-        lambda row: f"{row['FRIENDLY NAME']} at {row['LOCATION']} ({row['S/N']})",axis=1).tolist()
-        #Create a mapping between display names and serial numbers
-        display_name_to_serial = {display_name: serial for display_name, serial in zip(available_devices, filtered_devices['S/N'].tolist())}
+        #The labels come from the lookup index, the filtered frame's index is each row's position in the cached table
+        with METRICS.timer("labels.devices"):
+            available_devices = dropdowns.labels(device_lookup, filtered_devices.index)
 
         #Dropdown to select a device from the filtered list
         selected_device_display = col2.selectbox("Select a device to edit", available_devices)
 
         #Get the corresponding serial number based on the displayed name
-        selected_device_serial = display_name_to_serial.get(selected_device_display, None)
+        selected_device_serial = device_lookup.serial_for_label(selected_device_display)
 
-        connected_components = df_components[df_components['CONNECTED'] == selected_device_serial]['TYPE'].unique()
+        #The graph can already be on a newer COMPONENTS snapshot than df_components (another session's save), so only positions df_components has are looked up
+        connected_positions = df_components.index.intersection(device_graph.components_of(selected_device_serial))
+        connected_components = plain_values(df_components.loc[connected_positions, 'TYPE'].drop_duplicates())
         connected_components_text = " ".join(f'<span style="color:green">•</span> {component}' for component in connected_components)
         col2.markdown(connected_components_text, unsafe_allow_html=True)
         
         #Display editable fields
         if not filtered_devices.empty:
-            print("Filtering Devices...")
-            selected_device_index = filtered_devices[filtered_devices['S/N'] == selected_device_serial].index[0]
+            selected_device_index = device_lookup.position(selected_device_serial)
 
             #Editable Fields            
-            pos_options = df_devices['POS'].unique()
-            pos = col2.selectbox("Device POS", pos_options, index=pos_options.tolist().index(filtered_devices.at[selected_device_index, 'POS']))
-            location_options = df_locations['LOCATION'].unique()
-            location = col2.selectbox("Device Location", location_options, index=location_options.tolist().index(filtered_devices.at[selected_device_index, 'LOCATION']))
+            pos_options = dropdowns.column_options(table_cache, "DEVICES", "POS")
+            pos = col2.selectbox("Device POS", pos_options.values, index=pos_options.index(filtered_devices.at[selected_device_index, 'POS']))
+            location_options = dropdowns.column_options(table_cache, "LOCATIONS", "LOCATION", sort_by=None)
+            location = col2.selectbox("Device Location", location_options.values, index=location_options.index(filtered_devices.at[selected_device_index, 'LOCATION']))
             save_changes_to_connected = col2.checkbox("Apply location changes to the connected components", value=False, label_visibility="visible")
             friendly_name = col2.text_input("Friendly Name", filtered_devices.at[selected_device_index, 'FRIENDLY NAME'])
             notes = col2.text_input("Device Notes", filtered_devices.at[selected_device_index, 'NOTES'])
@@ -640,8 +774,7 @@ with devices:
                     full_image_path = os.path.join(images_folder, existing_image_filename)
 
                     if os.path.exists(full_image_path):
-                        with Image.open(full_image_path) as image:
-                            col2.image(image, width=200)
+                        col2.image(rendition_path(images_folder, existing_image_filename, 200), width=200)
                     else:
                         col2.warning("Image filename found in database but the file itself was not found. It may have been deleted.")
                         
@@ -652,11 +785,8 @@ with devices:
             if col2.button("Save Device"):
                 try:
                     #Fetch the current values before the update
-                    fetch_old_values_query = "SELECT POS, LOCATION, `FRIENDLY NAME`, NOTES, IMAGE FROM DEVICES WHERE `S/N` = :a;"
-                    old_values = conn.query(fetch_old_values_query, params={"a": selected_device_serial})
-                    
-                    if save_changes_to_connected == True and location != old_values.iat[0, 1]:
-                        apply_connected_changes(selected_device_serial)
+                    with conn.engine.connect() as connection:
+                        old_values = DEVICES.get(connection, selected_device_serial, ["POS", "LOCATION", "FRIENDLY NAME", "NOTES", "IMAGE"])
                     
                     if notes == "None":
                         notes = None
@@ -669,20 +799,29 @@ with devices:
                         device_image_filename = None
                     
                     #Update the data in the SQL database
-                    update_query = text(f"UPDATE DEVICES SET POS = :a, LOCATION = :b, `FRIENDLY NAME` = :c, NOTES = :d, IMAGE = :e, `LAST EDIT` = :f WHERE `S/N` = :g;")
-                    insert_history_query = text("INSERT INTO HISTORY ('CHANGE TIME', 'DEVICE S/N', 'PREVIOUS LOCATION', 'PREVIOUS FRIENDLY NAME', 'PREVIOUS NOTES', 'PREVIOUS PHOTO', 'NEW LOCATION', 'NEW FRIENDLY NAME', 'NEW NOTES', 'NEW PHOTO','CHANGE LOG') VALUES (:a, :b, :c, :d, :e, :f, :g, :h, :i, :j, :k);")
                     timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    with conn.session as session:
-                        session.execute(update_query, {"a": pos, "b": location, "c": friendly_name, "d": notes, "e": device_image_filename, "f": timestamp, "g": selected_device_serial})
-                        session.execute(insert_history_query, {"a": timestamp, "b": selected_device_serial, "c": old_values.iat[0, 1], "d": old_values.iat[0, 2], "e": old_values.iat[0, 3], "f": old_values.iat[0, 4], "g": location, "h": friendly_name, "i": notes, "j": device_image_filename, "k": "DEVICE UPDATE"})
-                        session.commit()
-                    
-                    st.toast(f"Device {friendly_name} ({selected_device_serial}) updated successfully!", icon="🥳")
-                    print("Changes saved successfully!")
-                    #Refresh the data in the app
-                    refresh_data()
-
-                except sqlite3.Error as e:
+                    update_query = DEVICES.update(selected_device_serial, {"POS": pos, "LOCATION": location, "FRIENDLY NAME": friendly_name, "NOTES": notes, "IMAGE": device_image_filename, "LAST EDIT": timestamp})
+                    insert_history_query = HISTORY.record(timestamp, "DEVICE UPDATE", {"DEVICE S/N": selected_device_serial, "PREVIOUS LOCATION": old_values["LOCATION"], "PREVIOUS FRIENDLY NAME": old_values["FRIENDLY NAME"], "PREVIOUS NOTES": old_values["NOTES"], "PREVIOUS PHOTO": old_values["IMAGE"],
+                                                                                        "NEW LOCATION": location, "NEW FRIENDLY NAME": friendly_name, "NEW NOTES": notes, "NEW PHOTO": device_image_filename})
+                    cascade_to_components = save_changes_to_connected == True and location != old_values["LOCATION"]
+
+                    #The device, its history and its connected components are one write, returns the components that moved
+                    def save_device(connection):
+                        connection.execute(*update_query)
+                        connection.execute(*insert_history_query)
+                        if cascade_to_components:
+                            return apply_connected_changes(connection, selected_device_serial, location, timestamp)
+                        return []
+
+                    save_device_write = submit_write(save_device, lambda moved: {"DEVICES": [selected_device_serial], "COMPONENTS": moved, "HISTORY": None})
+                    if wait_for_write(save_device_write, f"Device {friendly_name} ({selected_device_serial}) updated successfully!"):
+                        moved_components = save_device_write.result()
+                        if moved_components:
+                            st.toast(f"Connected components ({', '.join(moved_components)}) saved successfully!", icon="🙌")
+                        print("Changes saved successfully!")
+
+                #Nothing is saved if any part of the device or its components fails, the write is rolled back as a whole
+                except (sqlite3.Error, DBAPIError) as e:
                     st.error(f"Error updating data: {e}")
     else:
         col1.write("Oops, no devices... Check your search terms or refresh data!")
@@ -694,24 +833,14 @@ with components:
    
     component_locations_list = ['All'] + list(existing_locations)
     selected_component_locations = col1.multiselect("Select a location", component_locations_list, default=['All'], key="component_location_select")
-    component_type_list = ['All'] + list(df_components['TYPE'].unique())
+    #TYPE is categorical in the cache, plain_values shows a missing type as None like the other dropdowns
+    component_type_list = ['All'] + plain_values(df_components['TYPE'].drop_duplicates())
     selected_list = col1.multiselect("Select a type", component_type_list, default=['All'], key="component_type_select")
     search_components = col1.text_input("Search for a component", "")
 
-    #Filter components based on search input and selected location
-    if 'All' in selected_component_locations:
-        filtered_components = df_components  #Show all components for now
-        if 'All' not in selected_list:
-            filtered_components = filtered_components[filtered_components['TYPE'].isin(selected_list)]
-    else:
-        filtered_components = df_components[df_components['LOCATION'].isin(selected_component_locations)]
-
-    #Apply type filtering regardless of location selection (if 'All' types not selected)
-    if 'All' not in selected_list:
-        filtered_components = filtered_components[filtered_components['TYPE'].isin(selected_list)]
-
-    if search_components:
-        filtered_components = filtered_components[filtered_components.apply(lambda row: any(row.astype(str).str.contains(search_components, case=False)), axis=1)]
+    #Filter components based on the search input, selected locations and types (kept for this session like the devices)
+    with METRICS.timer("filter.components"):
+        filtered_components = filtered_views().filtered("COMPONENTS", df_components, components_version, selected_component_locations, selected_list, search_components, lambda term: search_positions("COMPONENTS", term))
 
 
     #Display filtered components in a DataFrame
@@ -721,34 +850,35 @@ with components:
     #Dropdown to select a component from the filtered list
     available_components = []
     if not filtered_components.empty:  #Check if DataFrame is not empty
-        available_components = filtered_components.apply(lambda row: f"{row['TYPE']} at {row['LOCATION']} ({row['S/N']})", axis=1).tolist()
-    #Create a mapping between display names and serial numbers
-    display_name_to_serial = {display_name: serial for display_name, serial in zip(available_components, filtered_components['S/N'].tolist())}
-    serial_to_display_name = {serial: display_name for serial, display_name in zip(available_components, filtered_components['S/N'].tolist())}
+        with METRICS.timer("labels.components"):
+            available_components = dropdowns.labels(component_lookup, filtered_components.index)
 
     #Dropdown to select a component from the filtered list
     selected_component_display = col2.selectbox("Select a component to edit", available_components)
-    friendly_name_to_serial = df_devices.set_index('FRIENDLY NAME')['S/N'].to_dict()
     #Get the corresponding serial number based on the displayed name
-    selected_component_serial = display_name_to_serial.get(selected_component_display, None)
+    selected_component_serial = component_lookup.serial_for_label(selected_component_display)
 
     #Display editable fields
     if not filtered_components.empty:
-        print("Filtering Components...")
-        selected_component_index = filtered_components[filtered_components['S/N'] == selected_component_serial].index[0]
+        selected_component_index = component_lookup.position(selected_component_serial)
 
         #Add editable fields to the left column
-        pos_options = df_components['POS'].unique()
-        pos = col2.selectbox("Component POS", pos_options, index=pos_options.tolist().index(filtered_components.at[selected_component_index, 'POS']))
-        location_options = df_locations['LOCATION'].unique()
-        location = col2.selectbox("Component Location", location_options, index=location_options.tolist().index(filtered_components.at[selected_component_index, 'LOCATION']))
+        pos_options = dropdowns.column_options(table_cache, "COMPONENTS", "POS")
+        pos = col2.selectbox("Component POS", pos_options.values, index=pos_options.index(filtered_components.at[selected_component_index, 'POS']))
+        location_options = dropdowns.column_options(table_cache, "LOCATIONS", "LOCATION", sort_by=None)
+        location = col2.selectbox("Component Location", location_options.values, index=location_options.index(filtered_components.at[selected_component_index, 'LOCATION']))
         
         #Get current component connection
         current_connection_serial = filtered_components.at[selected_component_index, 'CONNECTED']
-        current_connection = df_devices[df_devices['S/N'] == current_connection_serial]['FRIENDLY NAME'].iloc[0] if current_connection_serial else None
-        connection_options = (df_devices['FRIENDLY NAME'].unique())
-        default_connection_index = connection_options.tolist().index(current_connection) if current_connection in connection_options else None
-        connection = col2.selectbox("Component Connection", connection_options, index=default_connection_index)
+        current_connection = device_lookup.name_for_serial(current_connection_serial) if current_connection_serial else None
+        #Let people know when the connection looks wrong, the graph already knows so this doesn't cost a scan
+        connection_problem = device_graph.problem(selected_component_index)
+        if connection_problem == ORPHAN:
+            col2.warning(f"This component is connected to {current_connection_serial}, which isn't a device anymore.")
+        elif connection_problem == MISMATCH:
+            col2.warning(f"This component is at {filtered_components.at[selected_component_index, 'LOCATION']} but {current_connection or current_connection_serial} is at {device_graph.device_location(current_connection_serial)}.")
+        connection_options = dropdowns.column_options(table_cache, "DEVICES", "FRIENDLY NAME")
+        connection = col2.selectbox("Component Connection", connection_options.values, index=connection_options.index(current_connection))
         break_connection_box = col2.checkbox("Break connection", value=False,)
         component_notes = col2.text_input("Component Notes", filtered_components.at[selected_component_index, 'NOTES'])
         #Display existing image if available
@@ -760,8 +890,7 @@ with components:
                     full_image_path = os.path.join(images_folder, existing_image_filename)
 
                     if os.path.exists(full_image_path):
-                        with Image.open(full_image_path) as image:
-                            col2.image(image, width=200) 
+                        col2.image(rendition_path(images_folder, existing_image_filename, 200), width=200)
                     else:
                         col2.warning("Image filename found in database but the file itself was not found. It may have been deleted.")
                 
@@ -771,12 +900,12 @@ with components:
         if break_connection_box == True:
             selected_connection_serial = None
         else:
-            selected_connection_serial = friendly_name_to_serial.get(connection)
+            selected_connection_serial = device_lookup.serial_for_name(connection)
         if col2.button("Save Component"):
             try:
                 #Fetch the current values before the update
-                fetch_old_values_query = "SELECT POS, LOCATION, CONNECTED, NOTES, IMAGE FROM COMPONENTS WHERE `S/N` = :a;"
-                old_values = conn.query(fetch_old_values_query, params={"a": selected_component_serial})
+                with conn.engine.connect() as connection:
+                    old_values = COMPONENTS.get(connection, selected_component_serial, ["POS", "LOCATION", "CONNECTED", "NOTES", "IMAGE"])
                 
                 #Convert the image to bytes if it's uploaded
                 if image_upload:
@@ -789,29 +918,32 @@ with components:
                 if component_notes == "None":
                     component_notes = None
                 #Update the data in the SQL database
-                update_query = text(f"UPDATE COMPONENTS SET POS = :a, LOCATION = :b, CONNECTED = :c, NOTES = :d, IMAGE = :e, `LAST EDIT` = :f WHERE `S/N` = :g;")
-                 #Insert the old values into the HISTORY table
-                insert_history_query = text("INSERT INTO HISTORY ('CHANGE TIME', 'DEVICE S/N', 'PREVIOUS LOCATION', 'PREVIOUS CONNECTION', 'PREVIOUS NOTES', 'PREVIOUS PHOTO', 'NEW LOCATION', 'NEW CONNECTION', 'NEW NOTES', 'NEW PHOTO', 'CHANGE LOG') VALUES (:a, :b, :c, :d, :e, :f, :g, :h, :i, :j, :k);")
-                with conn.session as session:
-                    session.execute(update_query, {"a": pos, "b": location, "c": selected_connection_serial, "d": component_notes, "e": component_image_filename, "f": timestamp, "g": selected_component_serial})
-                    session.execute(insert_history_query, {"a": timestamp, "b": selected_component_serial, "c": old_values.iat[0, 1], "d": old_values.iat[0, 2], "e": old_values.iat[0, 3], "f": old_values.iat[0, 4], "g": location, "h": selected_connection_serial, "i": notes, "j": component_image_filename, "k": "COMPONENT UPDATE"})
-                    session.commit()
-
-                st.toast(f"Component ({selected_component_serial}) saved successfully!", icon="🙌")
-
-                #Refresh the data in the app
-                refresh_data()
-                
-
-            except sqlite3.Error as e:
+                #The update and the old values going into the HISTORY table
+                save_component_write = submit_write([
+                    COMPONENTS.update(selected_component_serial, {"POS": pos, "LOCATION": location, "CONNECTED": selected_connection_serial, "NOTES": component_notes, "IMAGE": component_image_filename, "LAST EDIT": timestamp}),
+                    HISTORY.record(timestamp, "COMPONENT UPDATE", {"DEVICE S/N": selected_component_serial, "PREVIOUS LOCATION": old_values["LOCATION"], "PREVIOUS CONNECTION": old_values["CONNECTED"], "PREVIOUS NOTES": old_values["NOTES"], "PREVIOUS PHOTO": old_values["IMAGE"],
+                                                                   "NEW LOCATION": location, "NEW CONNECTION": selected_connection_serial, "NEW NOTES": notes, "NEW PHOTO": component_image_filename}),
+                ], {"COMPONENTS": [selected_component_serial], "HISTORY": None})
+                wait_for_write(save_component_write, f"Component ({selected_component_serial}) saved successfully!")
+
+            except (sqlite3.Error, DBAPIError) as e:
                 st.error(f"Error updating data: {e}")
     else:
         st.write("Oops, no devices... Check your search terms or refresh data!")
 
+#The images folder listing is shared by every session and only read again when a photo is added or removed
+@st.cache_resource
+def get_image_folder():
+    return ImageFolder(images_path)
+
 with locations:
     st.subheader("Locations")
+    #Counts for every location in one query, and only the current page of cards is drawn
+    locations_summary = location_summary(conn.engine, df_locations, get_image_folder())
+    locations_pages = page_count(locations_summary)
+    locations_page_number = st.number_input(f"Page (of {locations_pages})", min_value=1, max_value=locations_pages, key="locations_page") if locations_pages > 1 else 1
     cols = st.columns(4) #Adjust the number of columns as needed
-    for index, row in df_locations.iterrows():
+    for index, (_, row) in enumerate(location_page(locations_summary, locations_page_number).iterrows()):
         location_name = row["LOCATION"]
         image_filename = row["IMAGE"]
         is_storage = row["IS_STORAGE"]
@@ -820,9 +952,9 @@ with locations:
             with st.container():
                 st.subheader(location_name)
                 st.write(f'''
-Devices: {df_devices[df_devices['LOCATION'] == location_name]['LOCATION'].count()}
+Devices: {row["DEVICES"]}
 
-Components: {df_components[df_components['LOCATION'] == location_name]['LOCATION'].count()}''')
+Components: {row["COMPONENTS"]}''')
                 
                 if st.checkbox("Storage location", value = is_storage,key=f"storage_{location_name}"):
                     is_now_storage = True
@@ -831,9 +963,8 @@ Components: {df_components[df_components['LOCATION'] == location_name]['LOCATION
                 
                 if image_filename:
                     images_folder = "images" 
-                    image_path = os.path.join(images_folder, image_filename)
-                    if os.path.exists(image_path):
-                        st.image(image_path, width=200)
+                    if row["IMAGE_FOUND"]:
+                        st.image(rendition_path(images_folder, image_filename, 200), width=200)
                     else:
                         st.warning("An image is listed for this location, but no file was found.")
                     with st.expander(f"Edit {location_name} photo"):
@@ -854,14 +985,11 @@ Components: {df_components[df_components['LOCATION'] == location_name]['LOCATION
                                 notes = f"{location_name} is no longer a storage location"
                             #Update the data in the SQL database
                             timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            update_query = text(f"UPDATE LOCATIONS SET IMAGE = :a, IS_STORAGE = :b WHERE `LOCATION` = :c;")
-                            insert_history_query = text("INSERT INTO HISTORY ('CHANGE TIME', 'NEW NOTES', 'NEW PHOTO', 'CHANGE LOG') VALUES (:a, :b, :c, :d);")
-                            with conn.session as session:
-                                session.execute(update_query, {"a": location_image_filename, "b": is_now_storage, "c": location_name})
-                                session.execute(insert_history_query, {"a": timestamp, "b": notes, "c": location_image_filename, "d": "LOCATION UPDATE"})
-                                session.commit()
-                                #Refresh the data in the app
-                                refresh_data()
+                            location_write = submit_write([
+                                LOCATIONS.update(location_name, {"IMAGE": location_image_filename, "IS_STORAGE": is_now_storage}),
+                                HISTORY.record(timestamp, "LOCATION UPDATE", {"NEW NOTES": notes, "NEW PHOTO": location_image_filename}),
+                            ], {"LOCATIONS": [location_name], "HISTORY": None})
+                            wait_for_write(location_write, f"{location_name} saved")
                                 
                         
                 else:
@@ -882,14 +1010,11 @@ Components: {df_components[df_components['LOCATION'] == location_name]['LOCATION
                             notes = f"{location_name} is no longer a storage location"
                         #Update the data in the SQL database
                         timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                        update_query = text(f"UPDATE LOCATIONS SET IMAGE = :a, IS_STORAGE = :b WHERE `LOCATION` = :c;")
-                        insert_history_query = text("INSERT INTO HISTORY ('CHANGE TIME', 'NEW NOTES', 'NEW PHOTO', 'CHANGE LOG') VALUES (:a, :b, :c, :d);")
-                        with conn.session as session:
-                            session.execute(update_query, {"a": location_image_filename, "b": is_now_storage, "c": location_name})
-                            session.execute(insert_history_query, {"a": timestamp, "b": notes, "c": location_image_filename, "d": "LOCATION UPDATE"})
-                            session.commit()
-                            #Refresh the data in the app
-                            refresh_data()
+                        location_write = submit_write([
+                            LOCATIONS.update(location_name, {"IMAGE": location_image_filename, "IS_STORAGE": is_now_storage}),
+                            HISTORY.record(timestamp, "LOCATION UPDATE", {"NEW NOTES": notes, "NEW PHOTO": location_image_filename}),
+                        ], {"LOCATIONS": [location_name], "HISTORY": None})
+                        wait_for_write(location_write, f"{location_name} saved")
                                   
             st.divider()
                 
@@ -898,89 +1023,77 @@ with history:
 
     #Search bar for history lookup
     search_history = st.text_input("Search in History", "")
-
-    #Fetch data from the HISTORY table
-    history_data_query = "SELECT `CHANGE TIME`, `DEVICE S/N`, `PREVIOUS LOCATION`, `PREVIOUS FRIENDLY NAME`, `PREVIOUS CONNECTION`, `PREVIOUS NOTES`, `NEW LOCATION`, `NEW FRIENDLY NAME`, `NEW CONNECTION`, `NEW NOTES`, `CHANGE LOG` FROM HISTORY;"
-
-    #Fetch all rows from the cursor
-    df_history = conn.query(history_data_query)
-    
-    #Sort DataFrame by 'CHANGE TIME' column in descending order
-    df_history['CHANGE TIME'] = pd.to_datetime(df_history['CHANGE TIME'])
-    df_history = df_history.sort_values(by='CHANGE TIME', ascending=False)
-
-    #Filter history data based on search input across all columns
-    if search_history:
-        filtered_history = df_history[df_history.apply(lambda row: any(row.astype(str).str.contains(search_history, case=False)), axis=1)]
+    history_column_order = ("CHANGE LOG","DEVICE S/N","PREVIOUS LOCATION","NEW LOCATION","PREVIOUS FRIENDLY NAME","NEW FRIENDLY NAME","PREVIOUS CONNECTION","NEW CONNECTION","PREVIOUS NOTES","NEW NOTES","CHANGE TIME")
+
+    #Date range filter, this is pushed down into the SQL for the paged viewer and the full-text search
+    history_dates = st.date_input("Only show changes between", value=(), key="history_dates")
+    history_start_date = history_dates[0] if len(history_dates) > 0 else None
+    history_end_date = history_dates[1] if len(history_dates) > 1 else None
+
+    #Full-text search mode runs the search inside SQLite and only ever loads one page of history
+    use_history_fts = history_fts_ready() and st.toggle("Search inside the database (full-text search)", value=False)
+
+    if use_history_fts:
+        history_page_size = 100
+        history_page = st.number_input("Page", min_value=1, value=1, step=1, key="history_fts_page")
+        page_of_history, history_matches = history_store.search_history(conn.engine, search_history, limit=history_page_size, offset=(history_page - 1) * history_page_size, start_date=history_start_date, end_date=history_end_date)
+        history_pages = max(1, -(-history_matches // history_page_size))
+        st.caption(f"{history_matches} changes found, showing page {history_page} of {history_pages}" + (" (best matches first)" if search_history else ""))
+        st.dataframe(page_of_history, use_container_width=True, hide_index=True, column_order=history_column_order)
+    elif search_history:
+        #The history comes from the table cache, which only appends the new rows after each change
+        history_columns = history_store.HISTORY_COLUMNS
+        df_history = fetch_data("HISTORY")[history_columns]
+
+        #Filter history data based on search input across all columns, then the dates
+        filtered_history = search_rows(df_history, "HISTORY", search_history, tuple(history_columns))
+        #CHANGE TIME is already parsed by the table cache (hardware/compact.py)
+        if history_start_date:
+            filtered_history = filtered_history[filtered_history['CHANGE TIME'] >= pd.Timestamp(history_start_date)]
+        if history_end_date:
+            filtered_history = filtered_history[filtered_history['CHANGE TIME'] < pd.Timestamp(history_end_date) + pd.Timedelta(days=1)]
+        filtered_history = filtered_history.sort_values(by='CHANGE TIME', ascending=False)
         st.dataframe(filtered_history, use_container_width=True, hide_index=True)
     else:
-        #Display all history data
-        st.dataframe(df_history, use_container_width=True, hide_index=True, column_order=("CHANGE LOG","DEVICE S/N","PREVIOUS LOCATION","NEW LOCATION","PREVIOUS FRIENDLY NAME","NEW FRIENDLY NAME","PREVIOUS CONNECTION","NEW CONNECTION","PREVIOUS NOTES","NEW NOTES","CHANGE TIME"))
-
+        #Without a search the history is paged newest first, only the visible page and a few pages ahead are ever loaded
+        if "history_pager" not in st.session_state:
+            st.session_state.history_pager = history_store.HistoryPager(page_size=100, prefetch_pages=4)
+        history_pager = st.session_state.history_pager
+        history_pager.set_filters(history_start_date, history_end_date)
+
+        newer_column, older_column, _ = st.columns([1, 1, 6])
+        if newer_column.button("◀ Newer", disabled=not history_pager.has_newer()):
+            history_pager.newer()
+        if older_column.button("Older ▶"):
+            history_pager.older()
+        page_of_history = history_pager.page(conn.engine)
+        st.caption(f"Page {history_pager.page_number + 1}" + ("" if history_pager.has_older() else " (oldest changes)"))
+        st.dataframe(page_of_history, use_container_width=True, hide_index=True, column_order=history_column_order)
+
+#All three reports are built together in one pass over the database and kept until the data changes, see hardware/reports.py
+@st.cache_resource
+def get_report_cache():
+    return ReportCache()
 
 def download_full_report():
-    #Read data from the DEVICES table into a DataFrame
-    df_devices = conn.query("SELECT POS, MODEL, TYPE, `S/N`, LOCATION, `FRIENDLY NAME`, NOTES, `LAST EDIT` FROM DEVICES;")
-    df_history = conn.query("SELECT `CHANGE TIME`, `DEVICE S/N`, `PREVIOUS LOCATION`, `PREVIOUS FRIENDLY NAME`, `PREVIOUS CONNECTION`, `PREVIOUS NOTES`, `NEW LOCATION`, `NEW FRIENDLY NAME`, `NEW CONNECTION`, `NEW NOTES` FROM HISTORY;")
-    df_components = conn.query("SELECT POS, MODEL, TYPE, `S/N`, LOCATION, CONNECTED, NOTES, `LAST EDIT` FROM COMPONENTS;")
-    print("Retreiving Full Report Data!")
-    #Convert DataFrames to Excel with two sheets
-    excel_data = BytesIO()
-    with pd.ExcelWriter(excel_data, engine='xlsxwriter') as writer:
-        df_devices.to_excel(writer, sheet_name='DEVICES', index=False)
-        df_components.to_excel(writer, sheet_name='COMPONENTS', index=False)
-        df_history.to_excel(writer, sheet_name="HISTORY", index=False)
-
-    #Save the Excel data to a BytesIO buffer
-    excel_data.seek(0)
-    return excel_data
+    return get_report_cache().workbook(conn.engine, "full")
 
 def download_ewaste_report():
-    #Read data from the DEVICES table into a DataFrame, filtering for E-WASTED
-    df_devices = conn.query("SELECT POS, MODEL, TYPE, `S/N`, LOCATION, `FRIENDLY NAME`, NOTES, `LAST EDIT` FROM DEVICES WHERE LOCATION = 'E-WASTED';")
-    df_history = conn.query("SELECT `CHANGE TIME`, `DEVICE S/N`, `PREVIOUS LOCATION`, `PREVIOUS FRIENDLY NAME`, `PREVIOUS CONNECTION`, `PREVIOUS NOTES`, `NEW LOCATION`, `NEW FRIENDLY NAME`, `NEW CONNECTION`, `NEW NOTES` FROM HISTORY WHERE `PREVIOUS LOCATION` = 'E-WASTED' OR `NEW LOCATION` = 'E-WASTED';")
-    df_components = conn.query("SELECT POS, MODEL, TYPE, `S/N`, LOCATION, CONNECTED, NOTES, `LAST EDIT` FROM COMPONENTS WHERE LOCATION = 'E-WASTED';")
-
-    print("Retreiving E-Waste Report Data!")
-    #Convert DataFrames to Excel with two sheets
-    excel_data = BytesIO()
-    with pd.ExcelWriter(excel_data, engine='xlsxwriter') as writer:
-        df_devices.to_excel(writer, sheet_name='DEVICES', index=False)
-        df_components.to_excel(writer, sheet_name='COMPONENTS', index=False)
-        df_history.to_excel(writer, sheet_name="HISTORY", index=False)
-        
-    #Save the Excel data to a BytesIO buffer
-    excel_data.seek(0)
-    return excel_data
+    return get_report_cache().workbook(conn.engine, "ewaste")
 
 def download_active_report():
-    df_devices = conn.query("SELECT POS, MODEL, TYPE, `S/N`, LOCATION, `FRIENDLY NAME`, NOTES, `LAST EDIT` FROM DEVICES WHERE LOCATION != 'E-WASTED';")
-    df_history = conn.query("SELECT `CHANGE TIME`, `DEVICE S/N`, `PREVIOUS LOCATION`, `PREVIOUS FRIENDLY NAME`, `PREVIOUS CONNECTION`, `PREVIOUS NOTES`, `NEW LOCATION`, `NEW FRIENDLY NAME`, `NEW CONNECTION`, `NEW NOTES` FROM HISTORY WHERE `PREVIOUS LOCATION` != 'E-WASTED' AND `NEW LOCATION` != 'E-WASTED';")
-    df_components = conn.query("SELECT POS, MODEL, TYPE, `S/N`, LOCATION, CONNECTED, NOTES, `LAST EDIT` FROM COMPONENTS WHERE LOCATION != 'E-WASTED';")
-
-    print("Retreiving Data!")
-    #Convert DataFrames to Excel with two sheets
-    excel_data = BytesIO()
-    with pd.ExcelWriter(excel_data, engine='xlsxwriter') as writer:
-        df_devices.to_excel(writer, sheet_name='DEVICES', index=False)
-        df_components.to_excel(writer, sheet_name='COMPONENTS', index=False)
-        df_history.to_excel(writer, sheet_name="HISTORY", index=False)
-        
-    #Save the Excel data to a BytesIO buffer
-    excel_data.seek(0)
-    return excel_data
+    return get_report_cache().workbook(conn.engine, "active")
 
-def create_photo_zip_and_download_button(directory_path):
-    photo_zip_filename = f"{today} POS IMAGES.zip"  # Name of the ZIP file
-    with ZipFile(photo_zip_filename, "w") as zipf:
-        for root, dirs, files in os.walk(directory_path):
-            for file in files:
-                zipf.write(os.path.join(root, file), arcname=file)  # Maintain original file names
+#The reports the .CSV and .PDF tabs offer, same rows as the .xlsx buttons
+REPORT_OPTIONS = {"Active Assets": "active", "E-Waste": "ewaste", "Full Database": "full"}
 
-    with open(photo_zip_filename, "rb") as f:
-        photos_zip_bytes_data = f.read()
+#The photo zip is shared by every session and only rebuilt when a photo is added, changed or removed
+@st.cache_resource
+def get_photo_archive():
+    return PhotoArchive()
 
-    return photos_zip_bytes_data
+def create_photo_zip_and_download_button(directory_path):
+    return get_photo_archive().zip_file(directory_path)
     
 with reports:
     st.subheader("Reports")
@@ -1017,15 +1130,45 @@ with reports:
                 file_name=f"{today} POS Active Report.xlsx",
                 key="download_active_report"
             )
-    
-    
+
+    with csv:
+        st.text("Pick a table and a report, a download button will appear once generated.")
+        csv_table = st.radio("Table", ["DEVICES", "COMPONENTS", "HISTORY"], horizontal=True, key="csv_table")
+        csv_report = st.radio("Report", list(REPORT_OPTIONS), horizontal=True, key="csv_report")
+        #History dumps get big, gzip shrinks them to a fraction of the size
+        csv_gzip = st.checkbox("Compress (.csv.gz)", value=csv_table == "HISTORY", key="csv_gzip")
+        if st.button(label="Generate .CSV"):
+            st.download_button(
+                label=f"{csv_table.title()} Download",
+                data=csv_bytes(conn.engine, csv_table, REPORT_OPTIONS[csv_report], csv_gzip),
+                file_name=f"{today} POS {csv_report} {csv_table.title()}.csv" + (".gz" if csv_gzip else ""),
+                mime="application/gzip" if csv_gzip else "text/csv",
+                key="download_csv"
+            )
+
+    with pdf:
+        st.text("A printable inventory sorted by location, a download button will appear once generated.")
+        pdf_report = st.radio("Report", list(REPORT_OPTIONS), horizontal=True, key="pdf_report")
+        pdf_history = st.checkbox("Include history", key="pdf_history")
+        if st.button(label="Generate .PDF"):
+            st.download_button(
+                label=f"{pdf_report} PDF Download",
+                data=pdf_bytes(conn.engine, REPORT_OPTIONS[pdf_report], pdf_history),
+                file_name=f"{today} POS {pdf_report} Report.pdf",
+                mime="application/pdf",
+                key="download_pdf"
+            )
+
     with zip:
         if st.button(label="All POS Photos"):
-            st.download_button(
-                label="All POS photos download",
-                data=create_photo_zip_and_download_button(images_path),
-                file_name=f"{today} POS IMAGES.zip",
-                key="download_photo_zip")
+            #The button is given the archive file itself, it's read when the button is drawn so it can be closed right after
+            with create_photo_zip_and_download_button(images_path) as photo_zip:
+                st.download_button(
+                    label="All POS photos download",
+                    data=photo_zip,
+                    file_name=f"{today} POS IMAGES.zip",
+                    mime="application/zip",
+                    key="download_photo_zip")
             
         if st.button("Create a .zip of EVERYTHING"):
             st.markdown('''Are you sure? This is EVERYTHING.
@@ -1053,5 +1196,35 @@ Why would you? I don't even need this file and yet I'm still programming in this
 Whatever. Have it your way...
 ''')
                 if st.button("Click here to generate the report that you DO NOT need."):
-                    create_photo_zip_and_download_button(images_path)
-                
\ No newline at end of file
+                    create_photo_zip_and_download_button(images_path).close()
+                
+
+#The Performance tab, this rerun is still going while it's drawn so it shows the session's reruns before this one
+if METRICS.enabled:
+    with admin_tabs[0]:
+        st.subheader("Performance")
+        session_reruns = st.session_state.get("performance_reruns", [])
+        if session_reruns:
+            last_rerun = session_reruns[-1]
+            st.write(f"The last rerun took {last_rerun['total'] * 1000:.0f} ms, this is where it went:")
+            last_rerun_timings = pd.DataFrame([{"TIMER": name, "MS": round(seconds * 1000, 2), "CALLS": last_rerun["calls"][name]} for name, seconds in last_rerun["timings"].items()], columns=["TIMER", "MS", "CALLS"])
+            st.dataframe(last_rerun_timings.sort_values(by="MS", ascending=False), use_container_width=True, hide_index=True)
+            st.line_chart(pd.DataFrame({"RERUN MS": [rerun["total"] * 1000 for rerun in session_reruns]}))
+
+        st.markdown("**Since the server started (every session)**")
+        performance_snapshot = METRICS.snapshot()
+        performance_timers = pd.DataFrame([{"TIMER": name, "CALLS": timer["calls"], "TOTAL MS": round(timer["total_seconds"] * 1000, 2), "AVERAGE MS": round(timer["total_seconds"] * 1000 / timer["calls"], 2), "SLOWEST MS": round(timer["max_seconds"] * 1000, 2)}
+                                           for name, timer in performance_snapshot["timers"].items()], columns=["TIMER", "CALLS", "TOTAL MS", "AVERAGE MS", "SLOWEST MS"])
+        st.dataframe(performance_timers.sort_values(by="TOTAL MS", ascending=False), use_container_width=True, hide_index=True)
+        st.dataframe(pd.DataFrame(list(performance_snapshot["counters"].items()), columns=["COUNTER", "COUNT"]), use_container_width=True, hide_index=True)
+
+        json_column, prometheus_column, reset_column = st.columns(3)
+        json_column.download_button("Download .JSON", data=METRICS.json_text(), file_name=f"{today} Performance.json", mime="application/json", key="download_performance_json")
+        prometheus_column.download_button("Download Prometheus text", data=METRICS.prometheus_text(), file_name=f"{today} Performance.prom", mime="text/plain", key="download_performance_prometheus")
+        if reset_column.button("Reset the numbers"):
+            METRICS.reset()
+            st.session_state["performance_reruns"] = []
+
+finished_rerun = METRICS.finish_rerun()
+if finished_rerun:
+    st.session_state["performance_reruns"] = (st.session_state.get("performance_reruns", []) + [finished_rerun])[-PERFORMANCE_RERUNS_KEPT:]